@@ -0,0 +1,250 @@
+import os
+import re
+import stat
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+from services.audio_cache import hot_audio_cache
+from services.audio_store import audio_store
+
+# 音频文件名只允许由字母、数字、下划线和连字符组成，防止路径穿越
+AUDIO_FILENAME_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+\.(wav)$")
+
+AUDIO_MEDIA_TYPES = {
+    "wav": "audio/wav",
+}
+
+
+def build_etag(filename: str, stat_result: os.stat_result) -> str:
+    """
+    生成强 ETag
+
+    文件名本身就是内容哈希，再附加大小和修改时间，
+    保证同名文件被清理后重新合成时 ETag 也会变化。
+    """
+    stem = os.path.splitext(filename)[0]
+    return f'"{stem}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个 Range 请求头
+
+    Returns:
+        (start, end) 闭区间；请求头无法识别或包含多个区间时返回 None，表示按整个文件响应
+
+    Raises:
+        ValueError: 区间无法满足（应返回 416）
+    """
+    units, _, ranges = range_header.partition("=")
+    if units.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    start_str, sep, end_str = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        start = int(start_str) if start_str else None
+        end = int(end_str) if end_str else None
+    except ValueError:
+        return None
+
+    if start is None:
+        # 后缀区间: bytes=-500 表示最后 500 字节
+        if end is None or end <= 0:
+            raise ValueError("无效的后缀区间")
+        start = max(file_size - end, 0)
+        end = file_size - 1
+    else:
+        end = file_size - 1 if end is None else min(end, file_size - 1)
+
+    if start < 0 or start > end or start >= file_size:
+        raise ValueError("区间无法满足")
+    return start, end
+
+
+def _etag_matches(header_value: str, etag: str) -> bool:
+    """判断 If-None-Match 中是否包含当前 ETag"""
+    if header_value.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    # If-None-Match 使用弱比较，忽略 W/ 前缀
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class AudioFileResponse(Response):
+    """
+    音频文件响应
+
+    在 Starlette FileResponse 的基础上增加 Range 区间响应和零拷贝发送：
+    - 服务器支持 ASGI zerocopy 扩展时使用 sendfile 发送
+    - 服务器支持 ASGI pathsend 扩展时由服务器直接发送整个文件
+    - 配置了 AUDIO_ACCEL_REDIRECT_PREFIX 时交给 Nginx 以 sendfile 发送
+    - 否则分块读取发送
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: Optional[str] = None,
+        offset: int = 0,
+        count: int = 0,
+        send_body: bool = True,
+    ) -> None:
+        self.path = path
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+        if not self.send_body or scope["method"].upper() == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        is_full_file = self.status_code == 200
+
+        if "http.response.zerocopy" in extensions:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await send(
+                    {
+                        "type": "http.response.zerocopy",
+                        "file": file.wrapped,
+                        "offset": self.offset,
+                        "count": self.count,
+                        "more_body": False,
+                    }
+                )
+        elif is_full_file and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": self.path})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                if self.offset:
+                    await file.seek(self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": remaining > 0,
+                        }
+                    )
+                if remaining > 0:
+                    # 文件在发送过程中被截断，结束响应
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def serve_audio_file(request: Request, filename: str) -> Response:
+    """
+    返回音频文件，支持强 ETag、条件 GET (304) 和 Range 区间请求
+
+    音频文件名由内容哈希生成，文件内容不会变化，因此可以使用
+    Cache-Control: immutable 进行长期缓存。
+    """
+    match = AUDIO_FILENAME_PATTERN.match(filename)
+    if not match:
+        raise HTTPException(status_code=404, detail="音频文件不存在")
+
+    audio_path = os.path.join(settings.AUDIO_OUTPUT_DIR, filename)
+    # 先查内存热点层，命中时只确认文件仍存在，不读取磁盘
+    hot_entry = await hot_audio_cache.lookup(filename, audio_path)
+    if hot_entry is not None:
+        stat_result = hot_entry.stat_result
+    else:
+        try:
+            stat_result = await audio_store.stat(audio_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="音频文件不存在")
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404, detail="音频文件不存在")
+        if hot_audio_cache.record_disk_hit(filename):
+            # 访问频率达到阈值，在后台提升到内存热点层
+            audio_store.submit(hot_audio_cache.promote, filename, audio_path)
+
+    etag = build_etag(filename, stat_result)
+    file_size = stat_result.st_size
+    headers = {
+        "etag": etag,
+        "cache-control": f"public, max-age={settings.AUDIO_CACHE_MAX_AGE}, immutable",
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "accept-ranges": "bytes",
+    }
+    media_type = AUDIO_MEDIA_TYPES[match.group(1)]
+
+    # 条件 GET：客户端缓存仍然有效
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # 交给 Nginx 通过 X-Accel-Redirect 发送，Range 和条件请求由 Nginx 处理
+    if settings.AUDIO_ACCEL_REDIRECT_PREFIX:
+        headers["x-accel-redirect"] = f"{settings.AUDIO_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{filename}"
+        headers["content-length"] = "0"
+        return AudioFileResponse(audio_path, headers=headers, media_type=media_type, send_body=False)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range 与当前 ETag 不一致时忽略 Range，返回完整文件
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range_header(range_header, file_size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            headers["content-length"] = str(end - start + 1)
+            if hot_entry is not None:
+                return Response(
+                    content=hot_entry.read(start, end - start + 1),
+                    status_code=206,
+                    headers=headers,
+                    media_type=media_type
+                )
+            return AudioFileResponse(
+                audio_path,
+                status_code=206,
+                headers=headers,
+                media_type=media_type,
+                offset=start,
+                count=end - start + 1,
+            )
+
+    headers["content-length"] = str(file_size)
+    if hot_entry is not None:
+        return Response(content=hot_entry.read(), headers=headers, media_type=media_type)
+    return AudioFileResponse(
+        audio_path,
+        headers=headers,
+        media_type=media_type,
+        count=file_size,
+    )
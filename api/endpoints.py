@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, WebSocket
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, Any, Optional
 import os
+import time
 import logging
 
 from models.requests import (
@@ -9,11 +10,24 @@ from models.requests import (
     TextToSpeechRequest, TextToSpeechResponse,
     TextGenerationWithHistoryRequest, ApiStatusResponse,
     LanguagesResponse, CombinedRequest, CombinedResponse,
-    MultiSpeakerTTSRequest, VoicesResponse
+    MultiSpeakerTTSRequest, VoicesResponse,
+    PrewarmRequest, PrewarmResponse, CacheStatsResponse,
+    JobSubmitRequest, JobResponse, UsageResponse
 )
 from services.gemini_service import gemini_service
 from services.gemini_tts_service import gemini_tts_service
-from config import settings
+from services.tts_prewarm import tts_history, tts_prewarmer
+from services.speak_pipeline import stream_generate_and_speak
+from services.audio_cache import hot_audio_cache
+from services.job_queue import job_queue, JobQueueFullError, CallbackNotAllowedError
+from services.bulkhead import BulkheadFullError
+from services.upstream_health import upstream_prober
+from services.usage import usage_tracker, USAGE_FIELDS
+from services import usage
+from api.audio_response import serve_audio_file
+from api.realtime import serve_realtime
+from api.json_response import model_response, dumps, StaticJSON
+from services import timing
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -21,6 +35,25 @@ logger = logging.getLogger(__name__)
 # 创建路由器
 router = APIRouter()
 
+# 内容固定的高频接口，响应只序列化一次
+_HEALTH_RESPONSE = StaticJSON({
+    "status": "healthy",
+    "service": "Gemini Proxy",
+    "version": "1.0.0"
+})
+_VOICES_RESPONSE = StaticJSON(VoicesResponse(success=True, voices=gemini_tts_service.get_supported_voices()))
+_LANGUAGES_RESPONSE = StaticJSON(LanguagesResponse(
+    success=True,
+    languages={lang: lang for lang in gemini_tts_service.get_supported_languages()}
+))
+
+def _error_response(response_class, message: str, e: Exception):
+    """接口通用异常分支的统一出口：记录日志并返回 success=False；BulkheadFullError 继续抛出，由全局处理器返回 503"""
+    if isinstance(e, BulkheadFullError):
+        raise e
+    logger.error(f"{message}: {str(e)}")
+    return response_class(success=False, error=str(e))
+
 @router.post("/generate", response_model=TextGenerationResponse)
 async def generate_text(request: TextGenerationRequest):
     """生成文本"""
@@ -32,7 +65,7 @@ async def generate_text(request: TextGenerationRequest):
             top_p=request.top_p
         )
         
-        return TextGenerationResponse(
+        return model_response(TextGenerationResponse(
             success=True,
             text=text,
             metadata={
@@ -41,13 +74,9 @@ async def generate_text(request: TextGenerationRequest):
                 "temperature": request.temperature,
                 "top_p": request.top_p
             }
-        )
+        ))
     except Exception as e:
-        logger.error(f"文本生成错误: {str(e)}")
-        return TextGenerationResponse(
-            success=False,
-            error=str(e)
-        )
+        return _error_response(TextGenerationResponse, "文本生成错误", e)
 
 @router.post("/generate_with_history", response_model=TextGenerationResponse)
 async def generate_text_with_history(request: TextGenerationWithHistoryRequest):
@@ -59,7 +88,7 @@ async def generate_text_with_history(request: TextGenerationWithHistoryRequest):
             temperature=request.temperature
         )
         
-        return TextGenerationResponse(
+        return model_response(TextGenerationResponse(
             success=True,
             text=text,
             metadata={
@@ -67,23 +96,37 @@ async def generate_text_with_history(request: TextGenerationWithHistoryRequest):
                 "response_length": len(text),
                 "temperature": request.temperature
             }
-        )
+        ))
     except Exception as e:
-        logger.error(f"基于历史的文本生成错误: {str(e)}")
-        return TextGenerationResponse(
-            success=False,
-            error=str(e)
-        )
+        return _error_response(TextGenerationResponse, "基于历史的文本生成错误", e)
 
-@router.post("/text_to_speech", response_model=TextToSpeechResponse)
+@router.post(
+    "/text_to_speech",
+    response_model=TextToSpeechResponse,
+    responses={200: {"content": {"audio/wav": {}}, "description": "response_format=binary 时直接返回音频数据"}}
+)
 async def text_to_speech(request: TextToSpeechRequest, background_tasks: BackgroundTasks):
     """文本转语音 - 使用Gemini TTS"""
     try:
+        # 记录请求历史，供缓存预热统计热门短语（配置了 TTS_HISTORY_FILE 时）
+        if tts_history.enabled:
+            background_tasks.add_task(
+                tts_history.record, request.text, request.voice_name, request.language, request.segmented
+            )
+        
+        if request.response_format == "binary":
+            return await _text_to_speech_binary(request, background_tasks)
+        
         # 使用 Gemini TTS
         audio_path = await gemini_tts_service.generate_speech(
             text=request.text,
             voice_name=request.voice_name,
-            language=request.language
+            language=request.language,
+            slow=request.slow,
+            segmented=request.segmented,
+            speed=request.speed,
+            trim_silence=request.trim_silence,
+            normalize=request.normalize
         )
         # 在后台任务中清理旧文件
         background_tasks.add_task(gemini_tts_service.cleanup_old_files, 100)
@@ -92,7 +135,10 @@ async def text_to_speech(request: TextToSpeechRequest, background_tasks: Backgro
             "text_length": len(request.text),
             "voice_name": request.voice_name,
             "language": request.language or "auto",
-            "tts_engine": "gemini"
+            "slow": request.slow,
+            "speed": request.speed,
+            "tts_engine": "gemini",
+            **timing.request_metadata()
         }
         
         # 获取文件名
@@ -105,15 +151,57 @@ async def text_to_speech(request: TextToSpeechRequest, background_tasks: Backgro
             metadata=metadata
         )
     except Exception as e:
-        logger.error(f"语音合成错误: {str(e)}")
-        return TextToSpeechResponse(
-            success=False,
-            error=str(e)
-        )
+        return _error_response(TextToSpeechResponse, "语音合成错误", e)
+
+async def _text_to_speech_binary(request: TextToSpeechRequest, background_tasks: BackgroundTasks) -> Response:
+    """文本转语音 - 直接在响应中返回内存中的WAV数据，缓存写入在响应后进行"""
+    wav_data, filename, from_cache = await gemini_tts_service.generate_speech_bytes(
+        text=request.text,
+        voice_name=request.voice_name,
+        language=request.language,
+        slow=request.slow,
+        segmented=request.segmented,
+        speed=request.speed,
+        trim_silence=request.trim_silence,
+        normalize=request.normalize
+    )
+    
+    if not from_cache and request.cache:
+        # 响应发送后再写入缓存，磁盘写入不在延迟路径上
+        background_tasks.add_task(gemini_tts_service.save_wav_to_cache, wav_data, filename)
+        background_tasks.add_task(gemini_tts_service.cleanup_old_files, 100)
+    
+    return Response(
+        content=wav_data,
+        media_type="audio/wav",
+        headers={
+            "Content-Disposition": f'inline; filename="{filename}"',
+            "X-Audio-Filename": filename,
+            "X-Audio-Cache": "hit" if from_cache else "miss"
+        }
+    )
 
-@router.post("/generate_and_speak", response_model=CombinedResponse)
+@router.post(
+    "/generate_and_speak",
+    response_model=CombinedResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}, "description": "pipelined=true 时以 NDJSON 流返回每句音频"}}
+)
 async def generate_and_speak(request: CombinedRequest, background_tasks: BackgroundTasks):
     """生成文本并转换为语音 - 使用Gemini TTS"""
+    if request.pipelined:
+        background_tasks.add_task(gemini_tts_service.cleanup_old_files, 100)
+        return StreamingResponse(
+            _ndjson_stream(stream_generate_and_speak(
+                prompt=request.prompt,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                voice_name=request.voice_name,
+                language=request.language
+            )),
+            media_type="application/x-ndjson",
+            background=background_tasks
+        )
+    
     try:
         # 生成文本
         text = await gemini_service.generate_text(
@@ -137,48 +225,50 @@ async def generate_and_speak(request: CombinedRequest, background_tasks: Backgro
             "temperature": request.temperature,
             "voice_name": request.voice_name,
             "language": request.language or "auto",
-            "tts_engine": "gemini"
+            "tts_engine": "gemini",
+            **timing.request_metadata()
         }
         
         filename = os.path.basename(audio_path)
         
-        return CombinedResponse(
+        return model_response(CombinedResponse(
             success=True,
             text=text,
             audio_url=f"/audio/{filename}",
             filename=filename,
             metadata=metadata
-        )
+        ))
     except Exception as e:
-        logger.error(f"生成文本并转语音错误: {str(e)}")
-        return CombinedResponse(
-            success=False,
-            error=str(e)
-        )
+        return _error_response(CombinedResponse, "生成文本并转语音错误", e)
+
+async def _ndjson_stream(events):
+    """将事件逐行编码为 NDJSON"""
+    async for event in events:
+        yield dumps(event) + b"\n"
 
-@router.get("/audio/{filename}")
-async def get_audio(filename: str):
-    """获取音频文件"""
+@router.websocket("/ws")
+async def realtime(websocket: WebSocket):
+    """实时接口：一个连接上并发处理多个文本生成 / 语音合成请求，文本和音频按请求 id 交错推送"""
+    await serve_realtime(websocket)
+
+@router.api_route("/audio/{filename}", methods=["GET", "HEAD"])
+async def get_audio(filename: str, request: Request):
+    """获取音频文件，支持 ETag 条件请求和 Range 区间请求"""
     try:
-        audio_path = os.path.join(settings.AUDIO_OUTPUT_DIR, filename)
-        
-        if not os.path.exists(audio_path):
-            raise HTTPException(status_code=404, detail="音频文件不存在")
-        
-        return FileResponse(
-            path=audio_path,
-            media_type="audio/mpeg",
-            filename=filename
-        )
+        return await serve_audio_file(request, filename)
+    except (HTTPException, BulkheadFullError):
+        raise
     except Exception as e:
         logger.error(f"获取音频文件错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/status", response_model=ApiStatusResponse)
 async def get_api_status():
-    """获取API状态"""
+    """获取API状态（上游健康状况来自后台探测的缓存结果，不发起请求）"""
     try:
         status = await gemini_service.check_api_status()
+        if status["status"] == "ready":
+            status.update(upstream_prober.summary())
         return ApiStatusResponse(**status)
     except Exception as e:
         logger.error(f"检查API状态错误: {str(e)}")
@@ -202,7 +292,8 @@ async def multi_speaker_tts(request: MultiSpeakerTTSRequest, background_tasks: B
         
         audio_path = await gemini_tts_service.generate_multi_speaker_speech(
             text=request.text,
-            speaker_configs=speaker_configs
+            speaker_configs=speaker_configs,
+            chunked=request.chunked
         )
         
         # 获取文件名
@@ -219,55 +310,141 @@ async def multi_speaker_tts(request: MultiSpeakerTTSRequest, background_tasks: B
                 "text_length": len(request.text),
                 "speaker_count": len(speaker_configs),
                 "speakers": [config["speaker"] for config in speaker_configs],
-                "tts_engine": "gemini"
+                "tts_engine": "gemini",
+                **timing.request_metadata()
             }
         )
     except Exception as e:
-        logger.error(f"多说话人语音合成错误: {str(e)}")
-        return TextToSpeechResponse(
+        return _error_response(TextToSpeechResponse, "多说话人语音合成错误", e)
+
+@router.post("/prewarm", response_model=PrewarmResponse)
+async def start_prewarm(request: PrewarmRequest):
+    """启动TTS缓存预热任务"""
+    try:
+        if request.phrases:
+            entries = [
+                (phrase.text, phrase.voice_name, phrase.language, phrase.segmented)
+                for phrase in request.phrases
+            ]
+            started = tts_prewarmer.start(entries, request.rate_per_minute)
+        else:
+            started = tts_prewarmer.start_from_sources(
+                top_n=request.top_n,
+                rate_per_minute=request.rate_per_minute
+            )
+        
+        if not started:
+            return PrewarmResponse(
+                success=False,
+                status=tts_prewarmer.status,
+                error="预热任务正在运行或没有可预热的短语"
+            )
+        return PrewarmResponse(success=True, status=tts_prewarmer.status)
+    except Exception as e:
+        logger.error(f"启动缓存预热错误: {str(e)}")
+        return PrewarmResponse(
             success=False,
             error=str(e)
         )
 
-@router.get("/voices", response_model=VoicesResponse)
-async def get_supported_voices():
-    """获取Gemini TTS支持的声音列表"""
+@router.get("/prewarm", response_model=PrewarmResponse)
+async def get_prewarm_status():
+    """获取TTS缓存预热任务状态"""
+    return PrewarmResponse(success=True, status=tts_prewarmer.status)
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+async def get_cache_stats():
+    """获取音频缓存各层（内存热点层/磁盘）命中统计"""
+    return CacheStatsResponse(success=True, stats=hot_audio_cache.stats())
+
+# 各任务类型对应的同步接口请求模型，用于校验任务参数
+JOB_PARAM_MODELS = {
+    "tts": TextToSpeechRequest,
+    "multi_speaker_tts": MultiSpeakerTTSRequest,
+    "generate_and_speak": CombinedRequest
+}
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(
+        success=job["state"] != "failed",
+        job_id=job["id"],
+        state=job["state"],
+        result=job.get("result"),
+        error=job.get("error"),
+        created_at=job.get("created_at"),
+        finished_at=job.get("finished_at")
+    )
+
+@router.post("/jobs", response_model=JobResponse)
+async def submit_job(request: JobSubmitRequest):
+    """提交异步任务，立即返回任务ID，通过 GET /jobs/{job_id} 轮询或 callback_url 回调获取结果"""
     try:
-        voices = gemini_tts_service.get_supported_voices()
-        return VoicesResponse(
-            success=True,
-            voices=voices
+        params = JOB_PARAM_MODELS[request.type].model_validate(request.params)
+    except ValueError as e:
+        return JobResponse(success=False, error=f"任务参数无效: {str(e)}")
+    
+    try:
+        job = await job_queue.submit(
+            request.type,
+            params.model_dump(exclude={"response_format", "cache", "pipelined"}),
+            request.callback_url
         )
+        return _job_response(job)
+    except (JobQueueFullError, CallbackNotAllowedError) as e:
+        return JobResponse(success=False, error=str(e))
     except Exception as e:
-        logger.error(f"获取声音列表错误: {str(e)}")
-        return VoicesResponse(
-            success=False,
-            error=str(e)
-        )
+        logger.error(f"提交任务错误: {str(e)}")
+        return JobResponse(success=False, error=str(e))
 
-@router.get("/languages", response_model=LanguagesResponse)
-async def get_supported_languages():
-    """获取Gemini TTS支持的语言列表"""
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """查询异步任务状态和结果"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return _job_response(job)
+
+@router.get("/usage", response_model=UsageResponse)
+async def get_usage(
+    request: Request, client_id: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None
+):
+    """
+    查询上游用量，按客户端、模型和操作汇总
+
+    需要 USAGE_ADMIN_KEY；使用客户端 API Key 时只能查询该客户端自己的用量。
+    start / end 为 Unix 时间戳（按小时统计），默认最近 24 小时；各 worker 的用量最多延迟
+    USAGE_FLUSH_INTERVAL 秒写入。
+    """
+    api_key = usage.api_key_from(request.headers)
+    if not usage.is_admin(api_key):
+        own_client = usage.authenticated_client(api_key)
+        if own_client is None or client_id not in (None, own_client):
+            raise HTTPException(status_code=403, detail="无权查询该用量")
+        client_id = own_client
+    
     try:
-        languages_list = gemini_tts_service.get_supported_languages()
-        # 将语言列表转换为字典格式
-        languages_dict = {lang: lang for lang in languages_list}
-        return LanguagesResponse(
+        rows = await usage_tracker.query(client_id, start if start is not None else time.time() - 86400, end)
+        return UsageResponse(
             success=True,
-            languages=languages_dict
+            usage=rows,
+            totals={field: round(sum(row[field] for row in rows), 3) for field in USAGE_FIELDS},
+            quota=usage_tracker.quota_status(client_id) if client_id is not None else None
         )
     except Exception as e:
-        logger.error(f"获取语言列表错误: {str(e)}")
-        return LanguagesResponse(
-            success=False,
-            error=str(e)
-        )
+        logger.error(f"查询用量错误: {str(e)}")
+        return UsageResponse(success=False, error=str(e))
+
+@router.get("/voices", response_model=VoicesResponse)
+async def get_supported_voices():
+    """获取Gemini TTS支持的声音列表"""
+    return _VOICES_RESPONSE.response()
+
+@router.get("/languages", response_model=LanguagesResponse)
+async def get_supported_languages():
+    """获取Gemini TTS支持的语言列表"""
+    return _LANGUAGES_RESPONSE.response()
 
 @router.get("/health")
 async def health_check():
     """健康检查"""
-    return {
-        "status": "healthy",
-        "service": "Gemini Proxy",
-        "version": "1.0.0"
-    } 
\ No newline at end of file
+    return _HEALTH_RESPONSE.response() 
\ No newline at end of file
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, Any
+
+from fastapi import WebSocket
+from pydantic import BaseModel, ValidationError
+
+from config import settings
+from models.requests import TextGenerationRequest, TextToSpeechRequest, CombinedRequest
+from services.gemini_service import gemini_service
+from services.gemini_tts_service import gemini_tts_service
+from services.tts_prewarm import tts_history
+from services.speak_pipeline import stream_generate_and_speak
+from services.audio_cache import hot_audio_cache
+from services.audio_store import audio_store
+from services.bulkhead import BulkheadFullError
+from services.metrics import WS_CONNECTIONS, WS_REQUESTS, USAGE_QUOTA_REJECTED
+from services.usage import usage_tracker
+from services import usage
+from api.json_response import dumps
+
+logger = logging.getLogger(__name__)
+
+# 客户端消息的 type 与对应的请求模型（参数与同名 HTTP 接口一致）
+REQUEST_MODELS = {
+    "generate": TextGenerationRequest,
+    "tts": TextToSpeechRequest,
+    "generate_and_speak": CombinedRequest,
+}
+
+# 音频二进制帧用 1 个字节记录请求 id 的长度
+MAX_REQUEST_ID_BYTES = 64
+
+
+class StreamError(Exception):
+    """流水线以 error 事件报告的失败（已记录日志）"""
+
+
+def encode_audio_frame(request_id: str, chunk: bytes) -> bytes:
+    """音频二进制帧: [id 字节数 (1 字节)][id (UTF-8)][WAV 数据]"""
+    encoded = request_id.encode("utf-8")
+    return bytes((len(encoded),)) + encoded + chunk
+
+
+class RealtimeSession:
+    """
+    一个 WebSocket 连接上的实时会话
+
+    客户端在同一个连接上发送多个带 id 的请求，各请求并发执行，生成的文本片段（JSON 文本帧）
+    和音频数据（二进制帧，帧头带请求 id）交错返回。所有待发送的消息经过一个有界队列，
+    由单独的写任务按顺序发出：客户端读取过慢时队列写满，各请求在下一次推送时暂停，
+    上游流式读取随之停止，不会在内存中无限堆积。每个连接同时进行的请求数有上限，
+    超出的请求直接返回 error，连接断开时取消该连接上所有进行中的请求。
+    """
+
+    def __init__(
+        self, websocket: WebSocket, client_id: str, max_concurrent: int, send_queue_size: int, audio_chunk_bytes: int
+    ):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_concurrent = max_concurrent
+        self.audio_chunk_bytes = audio_chunk_bytes
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.closing = False
+
+    async def run(self):
+        # 各请求任务继承该上下文，上游用量记在此客户端名下
+        usage.set_client(self.client_id)
+        await self.websocket.accept()
+        WS_CONNECTIONS.inc()
+        reader = asyncio.create_task(self._read())
+        writer = asyncio.create_task(self._write())
+        try:
+            # 客户端断开时读任务结束，发送失败时写任务结束
+            await asyncio.wait((reader, writer), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.closing = True
+            tasks = [reader, writer, *self.tasks.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            WS_CONNECTIONS.dec()
+
+    async def _write(self):
+        while True:
+            message = await self.outbox.get()
+            try:
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                else:
+                    await self.websocket.send_text(message)
+            except Exception as e:
+                logger.debug(f"WebSocket 发送失败，关闭会话: {str(e)}")
+                return
+
+    async def _send_json(self, event: Dict[str, Any]):
+        await self.outbox.put(dumps(event).decode("utf-8"))
+
+    async def _send_error(self, request_id, error: str, **extra):
+        await self._send_json({"id": request_id, "type": "error", "error": error, **extra})
+
+    async def _read(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is None:
+                await self._send_error(None, "只接受 JSON 文本消息")
+                continue
+            try:
+                payload = json.loads(message["text"])
+            except ValueError:
+                await self._send_error(None, "消息不是有效的 JSON")
+                continue
+            await self._dispatch(payload)
+
+    async def _dispatch(self, payload: Any):
+        if not isinstance(payload, dict):
+            await self._send_error(None, "消息必须是 JSON 对象")
+            return
+        request_id = payload.get("id")
+        kind = payload.get("type")
+        if not isinstance(request_id, str) or not request_id or len(request_id.encode("utf-8")) > MAX_REQUEST_ID_BYTES:
+            await self._send_error(None, f"id 必须是 1 到 {MAX_REQUEST_ID_BYTES} 字节的字符串")
+            return
+
+        if kind == "cancel":
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            return
+
+        model = REQUEST_MODELS.get(kind)
+        if model is None:
+            await self._send_error(request_id, f"不支持的请求类型: {kind}")
+            return
+        if request_id in self.tasks:
+            await self._send_error(request_id, "该 id 的请求仍在进行中")
+            return
+        try:
+            request = model.model_validate({k: v for k, v in payload.items() if k not in ("id", "type")})
+        except ValidationError as e:
+            await self._send_error(
+                request_id, "请求参数无效", details=e.errors(include_url=False, include_context=False, include_input=False)
+            )
+            return
+        exceeded = usage_tracker.check_quota(self.client_id)
+        if exceeded is not None:
+            USAGE_QUOTA_REJECTED.inc()
+            WS_REQUESTS.labels(kind, "rejected").inc()
+            await self._send_error(request_id, exceeded, retry_after=usage_tracker.quota_retry_after())
+            return
+        if len(self.tasks) >= self.max_concurrent:
+            WS_REQUESTS.labels(kind, "rejected").inc()
+            await self._send_error(
+                request_id, f"该连接上进行中的请求已达上限 ({self.max_concurrent})，请稍后重试", retry_after=1
+            )
+            return
+
+        task = asyncio.create_task(self._handle(request_id, kind, request))
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _task: self.tasks.pop(request_id, None))
+
+    async def _handle(self, request_id: str, kind: str, request: BaseModel):
+        outcome = "error"
+        try:
+            if kind == "generate":
+                await self._generate(request_id, request)
+            elif kind == "tts":
+                await self._text_to_speech(request_id, request)
+            else:
+                await self._generate_and_speak(request_id, request)
+            outcome = "success"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            # 连接已断开时不再通知
+            if not self.closing:
+                await self._send_json({"id": request_id, "type": "cancelled"})
+            raise
+        except BulkheadFullError as e:
+            outcome = "rejected"
+            await self._send_error(request_id, str(e), retry_after=1)
+        except StreamError as e:
+            await self._send_error(request_id, str(e))
+        except Exception as e:
+            logger.error(f"WebSocket {kind} 请求错误: {str(e)}")
+            await self._send_error(request_id, str(e))
+        finally:
+            WS_REQUESTS.labels(kind, outcome).inc()
+
+    async def _send_audio(self, request_id: str, wav_data: bytes, **event):
+        """先发送描述音频的 JSON 事件，再按 audio_chunk_bytes 分块发送二进制帧"""
+        await self._send_json({"id": request_id, "type": "audio", "format": "wav", "bytes": len(wav_data), **event})
+        for offset in range(0, len(wav_data), self.audio_chunk_bytes):
+            await self.outbox.put(encode_audio_frame(request_id, wav_data[offset:offset + self.audio_chunk_bytes]))
+
+    async def _generate(self, request_id: str, request: TextGenerationRequest):
+        chunks = []
+        stream = gemini_service.stream_text(
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            top_p=request.top_p
+        )
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                await self._send_json({"id": request_id, "type": "text", "text": chunk})
+        finally:
+            # 取消时及时通知读取线程停止
+            await stream.aclose()
+        text = "".join(chunks)
+        await self._send_json({
+            "id": request_id,
+            "type": "done",
+            "text": text,
+            "metadata": {
+                "prompt_length": len(request.prompt),
+                "response_length": len(text),
+                "temperature": request.temperature,
+                "top_p": request.top_p
+            }
+        })
+
+    async def _text_to_speech(self, request_id: str, request: TextToSpeechRequest):
+        if tts_history.enabled:
+            asyncio.get_running_loop().run_in_executor(
+                None, tts_history.record, request.text, request.voice_name, request.language, request.segmented
+            )
+        wav_data, filename, from_cache = await gemini_tts_service.generate_speech_bytes(
+            text=request.text,
+            voice_name=request.voice_name,
+            language=request.language,
+            slow=request.slow,
+            segmented=request.segmented,
+            speed=request.speed,
+            trim_silence=request.trim_silence,
+            normalize=request.normalize
+        )
+        await self._send_audio(request_id, wav_data, filename=filename, audio_url=f"/audio/{filename}")
+        await self._send_json({
+            "id": request_id,
+            "type": "done",
+            "metadata": {
+                "text_length": len(request.text),
+                "voice_name": request.voice_name,
+                "language": request.language or "auto",
+                "speed": request.speed,
+                "cache": "hit" if from_cache else "miss",
+                "tts_engine": "gemini"
+            }
+        })
+        if not from_cache and request.cache:
+            # 音频和 done 已进入发送队列，缓存写入不在延迟路径上
+            await gemini_tts_service.save_wav_to_cache(wav_data, filename)
+            await gemini_tts_service.cleanup_old_files(100)
+
+    async def _generate_and_speak(self, request_id: str, request: CombinedRequest):
+        async def on_text(chunk: str):
+            await self._send_json({"id": request_id, "type": "text", "text": chunk})
+
+        events = stream_generate_and_speak(
+            prompt=request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            voice_name=request.voice_name,
+            language=request.language,
+            on_text=on_text
+        )
+        try:
+            async for event in events:
+                if event["event"] == "segment":
+                    wav_data = await _load_audio(event["filename"])
+                    await self._send_audio(
+                        request_id, wav_data,
+                        index=event["index"], text=event["text"],
+                        filename=event["filename"], audio_url=event["audio_url"]
+                    )
+                elif event["event"] == "done":
+                    await self._send_json({
+                        "id": request_id,
+                        "type": "done",
+                        "text": event["text"],
+                        "segments": event["segments"],
+                        "metadata": event["metadata"]
+                    })
+                else:
+                    raise StreamError(event["error"])
+        finally:
+            # 取消时停止尚未完成的生成和合成
+            await events.aclose()
+        await gemini_tts_service.cleanup_old_files(100)
+
+
+async def _load_audio(filename: str) -> bytes:
+    """读取刚合成的音频，优先使用内存热点层"""
+    hot_entry = hot_audio_cache.get(filename)
+    if hot_entry is not None:
+        return hot_entry.read()
+    return await audio_store.read(os.path.join(settings.AUDIO_OUTPUT_DIR, filename))
+
+
+async def serve_realtime(websocket: WebSocket):
+    """处理一个 WebSocket 实时连接，直到客户端断开"""
+    # 浏览器无法为 WebSocket 设置请求头，也可以通过 api_key / client_id 查询参数传递
+    client_id = usage.resolve_client(
+        usage.api_key_from(websocket.headers, websocket.query_params.get("api_key")),
+        websocket.headers.get(settings.USAGE_CLIENT_HEADER) or websocket.query_params.get("client_id")
+    )
+    session = RealtimeSession(
+        websocket,
+        client_id=client_id,
+        max_concurrent=settings.WS_MAX_CONCURRENT_REQUESTS,
+        send_queue_size=settings.WS_SEND_QUEUE_SIZE,
+        audio_chunk_bytes=settings.WS_AUDIO_CHUNK_BYTES
+    )
+    await session.run()
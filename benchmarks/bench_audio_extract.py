@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+音频提取微基准
+
+对比旧的逐字段探测 + wave/BytesIO 封装方式与 services.audio_format 的提取和封装，
+负载为数 MB 的 PCM 数据（24kHz 16-bit 单声道，1MB 约 22 秒）。
+
+用法: python benchmarks/bench_audio_extract.py
+"""
+
+import base64
+import io
+import os
+import sys
+import timeit
+import wave
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.audio_format import extract_audio_data, build_wav_bytes  # noqa: E402
+
+SIZES_MB = (2, 8, 32)
+REPEAT = 20
+
+
+def make_response(payload):
+    part = SimpleNamespace(inline_data=SimpleNamespace(data=payload, mime_type="audio/L16;codec=pcm;rate=24000"))
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+def legacy_extract(response):
+    """旧实现的提取路径（去掉日志）"""
+    for part in response.candidates[0].content.parts:
+        for attr_name in ['inline_data', 'inlineData', 'data', 'audio_data', 'audioData']:
+            if hasattr(part, attr_name):
+                attr_value = getattr(part, attr_name)
+                if attr_value:
+                    if hasattr(attr_value, 'data') and attr_value.data:
+                        if isinstance(attr_value.data, bytes):
+                            return attr_value.data
+                        elif isinstance(attr_value.data, str):
+                            return base64.b64decode(attr_value.data)
+    raise Exception("响应中未找到音频数据")
+
+
+def legacy_wav(pcm_data):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_f:
+        wav_f.setnchannels(1)
+        wav_f.setsampwidth(2)
+        wav_f.setframerate(24000)
+        wav_f.writeframes(pcm_data)
+    return buffer.getvalue()
+
+
+def new_wav(pcm_data):
+    return build_wav_bytes(pcm_data, 1, 2, 24000)
+
+
+def bench(label, func):
+    seconds = min(timeit.repeat(func, number=1, repeat=REPEAT))
+    print(f"  {label:<28} {seconds * 1000:8.2f} ms")
+    return seconds
+
+
+def main():
+    for size_mb in SIZES_MB:
+        pcm = os.urandom(size_mb * 1024 * 1024)
+        raw_response = make_response(pcm)
+        b64_response = make_response(base64.b64encode(pcm).decode("ascii"))
+        assert bytes(extract_audio_data(b64_response)) == legacy_extract(b64_response)
+        assert new_wav(pcm) == legacy_wav(pcm)
+
+        print(f"{size_mb} MB PCM")
+        bench("旧: bytes 提取 + WAV 封装", lambda: legacy_wav(legacy_extract(raw_response)))
+        bench("新: bytes 提取 + WAV 封装", lambda: new_wav(extract_audio_data(raw_response)))
+        bench("旧: base64 提取 + WAV 封装", lambda: legacy_wav(legacy_extract(b64_response)))
+        bench("新: base64 提取 + WAV 封装", lambda: new_wav(extract_audio_data(b64_response)))
+
+
+if __name__ == "__main__":
+    main()
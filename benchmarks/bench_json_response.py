@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+JSON 响应序列化基准
+
+分别以 FAST_JSON_RESPONSES=false（FastAPI 默认的校验 + jsonable + 标准库 json）和
+FAST_JSON_RESPONSES=true（orjson / pydantic-core 直接序列化 / 预序列化）启动应用，
+在进程内直接调用 ASGI 应用（包含全部中间件），统计每个请求消耗的 CPU 时间。
+文本生成接口的上游调用替换为直接返回固定长度的文本，只测量本服务自身的开销。
+
+用法: python benchmarks/bench_json_response.py [--requests 2000]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (名称, 方法, 路径, 请求体, 生成文本长度)
+SCENARIOS = [
+    ("health", "GET", "/api/v1/health", None, 0),
+    ("voices", "GET", "/api/v1/voices", None, 0),
+    ("languages", "GET", "/api/v1/languages", None, 0),
+    ("generate 1K", "POST", "/api/v1/generate", {"prompt": "你好"}, 1_000),
+    ("generate 20K", "POST", "/api/v1/generate", {"prompt": "你好"}, 20_000),
+    ("generate 100K", "POST", "/api/v1/generate", {"prompt": "你好"}, 100_000),
+]
+
+
+async def call_app(app, method, path, body):
+    """直接调用 ASGI 应用，返回状态码和响应体"""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 12345), "server": ("127.0.0.1", 8000),
+        "headers": [(b"host", b"127.0.0.1"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)
+        received = True
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    status = 0
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def run_scenarios(requests):
+    sys.path.insert(0, ROOT)
+    from main import app
+    from services.gemini_service import gemini_service
+
+    results = {}
+    for name, method, path, body, text_length in SCENARIOS:
+        text = ("这是一段用于测试序列化开销的生成文本。" * (text_length // 19 + 1))[:text_length]
+
+        async def fake_generate_text(*args, _text=text, **kwargs):
+            return _text
+
+        gemini_service.generate_text = fake_generate_text
+
+        # 预热
+        for _ in range(50):
+            status, data = await call_app(app, method, path, body)
+        if status != 200:
+            raise RuntimeError(f"{name} 返回 {status}: {data[:200]!r}")
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(requests):
+            await call_app(app, method, path, body)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+
+        # 比较两种模式输出是否一致（解析后比较，忽略格式差异）
+        digest = hashlib.sha256(json.dumps(json.loads(data), sort_keys=True).encode()).hexdigest()[:12]
+        results[name] = {
+            "cpu_us": cpu / requests * 1e6,
+            "wall_us": wall / requests * 1e6,
+            "bytes": len(data),
+            "digest": digest,
+        }
+    return results
+
+
+def run_mode(fast, requests):
+    env = dict(os.environ, FAST_JSON_RESPONSES="true" if fast else "false",
+               GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "bench"),
+               TRAFFIC_CAPTURE_ENABLED="false", LOAD_SHED_ENABLED="false", LOG_LEVEL="WARNING")
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", "--requests", str(requests)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 响应序列化基准")
+    parser.add_argument("--requests", type=int, default=2000, help="每个场景的请求数")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_scenarios(args.requests))))
+        return
+
+    before = run_mode(False, args.requests)
+    after = run_mode(True, args.requests)
+
+    print(f"{'场景':<16}{'响应字节':>10}{'默认 CPU(us)':>14}{'快速 CPU(us)':>14}{'降低':>8}{'输出一致':>10}")
+    for name, *_ in SCENARIOS:
+        b, a = before[name], after[name]
+        saving = (1 - a["cpu_us"] / b["cpu_us"]) * 100
+        same = "是" if a["digest"] == b["digest"] else "否"
+        print(f"{name:<16}{b['bytes']:>10}{b['cpu_us']:>14.1f}{a['cpu_us']:>14.1f}{saving:>7.1f}%{same:>10}")
+
+
+if __name__ == "__main__":
+    main()
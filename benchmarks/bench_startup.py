@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+启动时间基准
+
+worker 每处理约 1000 个请求就会被回收重建，启动时间直接影响回收期间的可用容量。测量：
+- import main 的耗时（全新进程，取多次运行的中位数）
+- 单个 uvicorn worker 从启动到第一个 /api/v1/health 返回 200 的时间
+- 从启动到第一个 /api/v1/generate 成功的时间（包含 Gemini SDK 的延迟导入和客户端创建，
+  上游为本地模拟服务，延迟为 0）
+
+超过阈值时以非零状态退出，可加入 CI 防止启动时间回归。
+
+用法:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --max-import-ms 1500 --max-first-request-ms 4000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import ROOT, start_fake_upstream, _stop
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def _env(args) -> dict:
+    return dict(
+        os.environ,
+        GEMINI_API_KEY="fake",
+        GEMINI_API_BASE_URL=f"http://127.0.0.1:{args.upstream_port}",
+        PYTHONPATH=ROOT,
+        LOG_LEVEL="WARNING",
+        UPSTREAM_PROBE_ENABLED="false",
+    )
+
+
+def measure_import(args, work_dir: str) -> float:
+    """import main 耗时（毫秒，中位数）"""
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=work_dir, env=_env(args), capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]) * 1000)
+    return statistics.median(samples)
+
+
+def _poll(client: httpx.Client, method: str, url: str, body, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if client.request(method, url, json=body).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"服务未能及时响应: {url}")
+
+
+def measure_first_request(args, work_dir: str):
+    """(首个健康检查, 首个文本生成) 距进程启动的时间（毫秒）"""
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=work_dir, env=_env(args))
+    try:
+        deadline = start + 60
+        base_url = f"http://127.0.0.1:{args.port}"
+        with httpx.Client(timeout=30) as client:
+            health = _poll(client, "GET", f"{base_url}/api/v1/health", None, deadline)
+            generate = _poll(client, "POST", f"{base_url}/api/v1/generate", {"prompt": "你好"}, deadline)
+        return (health - start) * 1000, (generate - start) * 1000
+    finally:
+        _stop(process)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="启动时间基准")
+    parser.add_argument("--runs", type=int, default=5, help="import 和首请求测量的重复次数")
+    parser.add_argument("--port", type=int, default=8766, help="代理服务端口")
+    parser.add_argument("--upstream-port", type=int, default=9101)
+    parser.add_argument("--max-import-ms", type=float, default=1500, help="import main 耗时阈值")
+    parser.add_argument("--max-first-request-ms", type=float, default=4000, help="启动到首个文本生成成功的耗时阈值")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+    # start_fake_upstream 使用的模拟上游参数
+    args.upstream_latency_ms = 0
+    args.upstream_jitter_ms = 0
+    args.upstream_error_rate = 0.0
+    args.upstream_rate_limit_rate = 0.0
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    upstream = None
+    with tempfile.TemporaryDirectory(prefix="gemini-proxy-startup-") as work_dir:
+        try:
+            upstream = start_fake_upstream(args)
+            import_ms = measure_import(args, work_dir)
+            first = [measure_first_request(args, work_dir) for _ in range(args.runs)]
+        finally:
+            _stop(upstream)
+
+    result = {
+        "import_ms": round(import_ms, 1),
+        "first_health_ms": round(statistics.median(health for health, _ in first), 1),
+        "first_generate_ms": round(statistics.median(generate for _, generate in first), 1),
+    }
+    failures = []
+    if result["import_ms"] > args.max_import_ms:
+        failures.append(f"import main {result['import_ms']}ms 超过阈值 {args.max_import_ms:g}ms")
+    if result["first_generate_ms"] > args.max_first_request_ms:
+        failures.append(f"首个请求 {result['first_generate_ms']}ms 超过阈值 {args.max_first_request_ms:g}ms")
+
+    if args.json:
+        print(json.dumps({**result, "failures": failures}, ensure_ascii=False, indent=2))
+    else:
+        print(f"import main:             {result['import_ms']:>8} ms")
+        print(f"启动到首个 /health:      {result['first_health_ms']:>8} ms")
+        print(f"启动到首个 /generate:    {result['first_generate_ms']:>8} ms")
+        for failure in failures:
+            print(f"启动时间回归: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+本地模拟 Gemini API 服务
+
+实现 generateContent / streamGenerateContent 接口的请求和响应格式，
+语音请求返回合成的 PCM 数据（正弦波），文本请求返回固定文本，不消耗真实配额。
+可配置延迟、抖动、错误率和 429 比例，用于压测代理服务自身的吞吐和开销。
+
+用法:
+    python benchmarks/fake_gemini.py --port 9100 --latency-ms 800 --jitter-ms 200 --error-rate 0.01 --rate-limit-rate 0.02
+然后以 GEMINI_API_BASE_URL=http://127.0.0.1:9100 GEMINI_API_KEY=fake 启动代理服务。
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import struct
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+SAMPLE_RATE = 24000
+
+SAMPLE_TEXT = (
+    "这是模拟服务生成的文本。它用于测试代理服务的吞吐量和延迟。"
+    "Each sentence is short enough to be synthesized quickly. "
+    "压测时不会消耗真实的 API 配额。"
+)
+
+
+class FakeGemini:
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float,
+                 rate_limit_rate: float, audio_seconds_per_char: float, max_audio_seconds: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.audio_seconds_per_char = audio_seconds_per_char
+        self.max_audio_seconds = max_audio_seconds
+        # 预先生成 1 秒的正弦波，按需重复
+        self._second_of_audio = b"".join(
+            struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)))
+            for i in range(SAMPLE_RATE)
+        )
+
+    async def _delay(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+    def _failure(self):
+        """按配置的比例返回 429 或 500 错误"""
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return JSONResponse(
+                {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                status_code=429
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            return JSONResponse(
+                {"error": {"code": 500, "message": "Internal error", "status": "INTERNAL"}},
+                status_code=500
+            )
+        return None
+
+    def _audio_part(self, text: str) -> dict:
+        seconds = min(max(len(text) * self.audio_seconds_per_char, 0.2), self.max_audio_seconds)
+        frames = int(seconds * SAMPLE_RATE)
+        repeats = frames // SAMPLE_RATE + 1
+        pcm = (self._second_of_audio * repeats)[:frames * 2]
+        return {"inlineData": {"mimeType": f"audio/L16;codec=pcm;rate={SAMPLE_RATE}", "data": base64.b64encode(pcm).decode()}}
+
+    @staticmethod
+    def _prompt_text(body: dict) -> str:
+        texts = []
+        for content in body.get("contents", []):
+            for part in content.get("parts", []):
+                texts.append(part.get("text", ""))
+        return "".join(texts)
+
+    @staticmethod
+    def _wants_audio(body: dict) -> bool:
+        modalities = body.get("generationConfig", {}).get("responseModalities", [])
+        return "AUDIO" in [modality.upper() for modality in modalities]
+
+    @staticmethod
+    def _response(parts: list, prompt_tokens: int = 0, output_tokens: int = 0) -> dict:
+        return {
+            "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens
+            },
+            "modelVersion": "fake"
+        }
+
+    @staticmethod
+    def _tokens(text: str) -> int:
+        # 粗略估计：约 4 个字符一个 token
+        return max(1, len(text) // 4)
+
+    async def handle(self, request: Request):
+        model, _, method = request.path_params["model_method"].partition(":")
+        body = await request.json()
+        await self._delay()
+        failure = self._failure()
+        if failure is not None:
+            return failure
+
+        prompt = self._prompt_text(body)
+        if method == "generateContent":
+            if self._wants_audio(body):
+                part = self._audio_part(prompt)
+                # 音频输出约每秒 25 个 token
+                output_tokens = len(part["inlineData"]["data"]) * 3 // 4 * 25 // (SAMPLE_RATE * 2)
+            else:
+                part = {"text": SAMPLE_TEXT}
+                output_tokens = self._tokens(SAMPLE_TEXT)
+            return JSONResponse(self._response([part], self._tokens(prompt), output_tokens))
+
+        if method == "streamGenerateContent":
+            return StreamingResponse(self._stream_text(self._tokens(prompt)), media_type="text/event-stream")
+
+        return JSONResponse({"error": {"code": 404, "message": f"未知方法 {method}"}}, status_code=404)
+
+    async def _stream_text(self, prompt_tokens: int):
+        # 按句分块返回，块间加入延迟模拟逐步生成；用量为截至当前块的累计值
+        chunks = [chunk + "。" for chunk in SAMPLE_TEXT.split("。") if chunk]
+        generated = ""
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(self.latency_ms / 1000 / len(chunks))
+            generated += chunk
+            response = self._response([{"text": chunk}], prompt_tokens, self._tokens(generated))
+            yield f"data: {json.dumps(response, ensure_ascii=False)}\r\n\r\n"
+
+
+def create_app(fake: FakeGemini) -> Starlette:
+    async def health(request: Request):
+        return Response("ok")
+
+    async def model_info(request: Request):
+        # 健康探测查询模型信息
+        model = request.path_params["model_method"]
+        return JSONResponse({"name": f"models/{model}", "displayName": model})
+
+    return Starlette(routes=[
+        Route("/v1beta/models/{model_method}", fake.handle, methods=["POST"]),
+        Route("/v1beta/models/{model_method}", model_info, methods=["GET"]),
+        Route("/health", health),
+    ])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟 Gemini API 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=500, help="平均响应延迟")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="延迟抖动范围（±）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--audio-seconds-per-char", type=float, default=0.06, help="每个字符对应的音频时长")
+    parser.add_argument("--max-audio-seconds", type=float, default=60, help="单次返回音频的最大时长")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fake = FakeGemini(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        audio_seconds_per_char=args.audio_seconds_per_char,
+        max_audio_seconds=args.max_audio_seconds
+    )
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
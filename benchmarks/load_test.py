@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+端到端压测
+
+启动本地模拟 Gemini 服务 (benchmarks/fake_gemini.py) 和代理服务（gunicorn 多 worker），
+以指定并发持续请求各接口，报告每个接口的 RPS、p50/p95/p99 延迟、错误数，
+以及压测结束时每个 worker 进程的内存占用 (RSS)。
+上游延迟固定可控，结果反映代理服务本身的开销和并发能力，可用于对比各项优化前后的表现。
+
+用法:
+    python benchmarks/load_test.py --workers 4 --concurrency 32 --duration 30
+    python benchmarks/load_test.py --scenarios tts,tts_cached --upstream-latency-ms 200
+    python benchmarks/load_test.py --target http://127.0.0.1:8000   # 压测已启动的服务，不启动子进程
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SENTENCES = [
+    "今天的天气非常好，适合出去散步。",
+    "Please remember to bring your umbrella tomorrow.",
+    "会议将在下午三点准时开始。",
+    "The quick brown fox jumps over the lazy dog.",
+]
+
+_counter = itertools.count()
+
+
+def _unique_text() -> str:
+    """每次生成不同的文本，避免命中音频缓存"""
+    n = next(_counter)
+    return f"{SENTENCES[n % len(SENTENCES)]} 编号 {n}。"
+
+
+def _scenario_requests():
+    """各场景的请求: (方法, 路径, 请求体生成函数, 是否为 NDJSON 流)"""
+    return {
+        "generate": ("POST", "/api/v1/generate", lambda: {"prompt": _unique_text()}, False),
+        "tts": ("POST", "/api/v1/text_to_speech", lambda: {"text": _unique_text()}, False),
+        "tts_cached": ("POST", "/api/v1/text_to_speech", lambda: {"text": SENTENCES[0]}, False),
+        "tts_binary": (
+            "POST", "/api/v1/text_to_speech",
+            lambda: {"text": _unique_text(), "response_format": "binary"}, False
+        ),
+        "multi_speaker_tts": (
+            "POST", "/api/v1/multi_speaker_tts",
+            lambda: {
+                "text": f"Alice: {_unique_text()}\nBob: {_unique_text()}",
+                "speaker_configs": [
+                    {"speaker": "Alice", "voice_name": "Kore"},
+                    {"speaker": "Bob", "voice_name": "Puck"}
+                ]
+            }, False
+        ),
+        "generate_and_speak": ("POST", "/api/v1/generate_and_speak", lambda: {"prompt": _unique_text()}, False),
+        "generate_and_speak_pipelined": (
+            "POST", "/api/v1/generate_and_speak",
+            lambda: {"prompt": _unique_text(), "pipelined": True}, True
+        ),
+        "health": ("GET", "/api/v1/health", lambda: None, False),
+    }
+
+
+DEFAULT_SCENARIOS = "generate,tts,tts_cached,tts_binary,generate_and_speak,generate_and_speak_pipelined"
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+async def _request_ok(client: httpx.AsyncClient, method: str, path: str, body, streaming: bool) -> bool:
+    """发送一次请求，返回是否成功（HTTP 200 且响应中没有 success=false）"""
+    if streaming:
+        async with client.stream(method, path, json=body) as response:
+            if response.status_code != 200:
+                return False
+            async for line in response.aiter_lines():
+                if line and json.loads(line).get("event") == "error":
+                    return False
+            return True
+
+    response = await client.request(method, path, json=body)
+    if response.status_code != 200:
+        return False
+    if response.headers.get("content-type", "").startswith("application/json"):
+        data = response.json()
+        return not (isinstance(data, dict) and data.get("success") is False)
+    return True
+
+
+async def run_scenario(base_url: str, name: str, concurrency: int, duration: float, timeout: float) -> Dict:
+    """以固定并发持续请求一个场景 duration 秒"""
+    method, path, make_body, streaming = _scenario_requests()[name]
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def user():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = await _request_ok(client, method, path, make_body(), streaming)
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return {
+        "scenario": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def _child_pids(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # 第 4 个字段为父进程 PID（进程名可能含空格，从右括号之后开始解析）
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def worker_memory(master_pid: int) -> Dict[int, Optional[float]]:
+    """gunicorn 各 worker 进程的 RSS (MB)，仅支持 Linux"""
+    return {pid: _rss_mb(pid) for pid in _child_pids(master_pid)}
+
+
+def _wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout} 秒内就绪: {url}")
+
+
+def start_fake_upstream(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_gemini.py"),
+        "--port", str(args.upstream_port),
+        "--latency-ms", str(args.upstream_latency_ms),
+        "--jitter-ms", str(args.upstream_jitter_ms),
+        "--error-rate", str(args.upstream_error_rate),
+        "--rate-limit-rate", str(args.upstream_rate_limit_rate),
+    ]
+    process = subprocess.Popen(command, cwd=ROOT)
+    _wait_until_ready(f"http://127.0.0.1:{args.upstream_port}/health")
+    return process
+
+
+def start_app(args, work_dir: str) -> subprocess.Popen:
+    """使用独立的工作目录启动代理服务，避免污染项目中的音频缓存和日志"""
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="fake",
+        GEMINI_API_BASE_URL=f"http://127.0.0.1:{args.upstream_port}",
+        PYTHONPATH=ROOT,
+        LOG_LEVEL=args.log_level,
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(work_dir, "prometheus"),
+    )
+    os.makedirs(os.path.join(work_dir, "logs"), exist_ok=True)
+    command = [
+        sys.executable, "-m", "gunicorn", "main:app",
+        "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+        "-w", str(args.workers),
+        "-b", f"127.0.0.1:{args.port}",
+        "--chdir", work_dir,
+    ]
+    process = subprocess.Popen(command, cwd=work_dir, env=env)
+    _wait_until_ready(f"http://127.0.0.1:{args.port}/api/v1/health", timeout=60.0)
+    return process
+
+
+def _stop(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def print_report(results: List[Dict], memory: Dict[int, Optional[float]]):
+    header = f"{'scenario':<30}{'requests':>10}{'errors':>8}{'rps':>10}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<30}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10}"
+            f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+        )
+    if memory:
+        print()
+        print("worker 内存 (RSS MB): " + ", ".join(f"{pid}={rss}" for pid, rss in sorted(memory.items())))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="代理服务端到端压测")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS,
+                        help=f"逗号分隔的场景，可选: {', '.join(_scenario_requests())}")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--duration", type=float, default=20, help="每个场景的持续时间（秒）")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求超时（秒）")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker 数")
+    parser.add_argument("--port", type=int, default=8765, help="代理服务端口")
+    parser.add_argument("--log-level", default="WARNING", help="代理服务日志级别")
+    parser.add_argument("--target", help="压测已启动的服务，不启动模拟上游和代理服务")
+    parser.add_argument("--upstream-port", type=int, default=9100)
+    parser.add_argument("--upstream-latency-ms", type=float, default=500)
+    parser.add_argument("--upstream-jitter-ms", type=float, default=100)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in _scenario_requests()]
+    if unknown:
+        sys.exit(f"未知场景: {', '.join(unknown)}")
+
+    upstream = app = None
+    base_url = args.target
+    with tempfile.TemporaryDirectory(prefix="gemini-proxy-load-") as work_dir:
+        try:
+            if base_url is None:
+                upstream = start_fake_upstream(args)
+                app = start_app(args, work_dir)
+                base_url = f"http://127.0.0.1:{args.port}"
+
+            results = []
+            for name in scenarios:
+                results.append(asyncio.run(
+                    run_scenario(base_url, name, args.concurrency, args.duration, args.timeout)
+                ))
+            memory = worker_memory(app.pid) if app is not None else {}
+        finally:
+            _stop(app)
+            _stop(upstream)
+
+    if args.json:
+        print(json.dumps({"results": results, "worker_rss_mb": memory}, ensure_ascii=False, indent=2))
+    else:
+        print_report(results, memory)
+
+
+if __name__ == "__main__":
+    main()
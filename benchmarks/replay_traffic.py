@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+流量回放
+
+读取线上采集的请求记录（TRAFFIC_CAPTURE_ENABLED=true 时写入 logs/traffic/ 的 .jsonl / .jsonl.gz），
+按原始到达间隔（可按倍速压缩）重新发送到目标服务，用于离线复现线上的性能问题。
+回放是开环的：按时间表发出请求，不等待前一个请求完成，与线上的到达模式一致。
+
+报告每个接口的首字节时间 (TTFB) 和总耗时的 p50/p95/p99，以及与采集时记录的耗时之差；
+传入 --baseline 时还会对比上一次回放的结果（例如优化前后各回放一次）。
+
+用法:
+    # 以 4 倍速回放到本地服务，结果保存到 before.json
+    python benchmarks/replay_traffic.py logs/traffic --target http://127.0.0.1:8000 --speed 4 --output before.json
+    # 修改后再回放一次，与 before.json 对比
+    python benchmarks/replay_traffic.py logs/traffic --target http://127.0.0.1:8000 --speed 4 --baseline before.json
+
+结合 benchmarks/fake_gemini.py 可在不消耗 API 配额的情况下回放。
+"""
+
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+# 音频文件名等路径参数合并统计，避免每个文件单独成为一组
+_PATH_GROUPS = [(re.compile(r"^/audio/.+"), "/audio/{filename}"), (re.compile(r"^/api/v1/jobs/.+"), "/api/v1/jobs/{job_id}")]
+
+
+def load_journal(paths: List[str]) -> List[Dict]:
+    """读取采集文件（可传目录），按到达时间排序"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "*.jsonl")))
+            files.extend(glob.glob(os.path.join(path, "*.jsonl.gz")))
+        else:
+            files.append(path)
+
+    entries = []
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 进程退出时可能留下不完整的最后一行
+                    continue
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+def endpoint_of(entry: Dict) -> str:
+    path = entry["path"]
+    for pattern, group in _PATH_GROUPS:
+        if pattern.match(path):
+            path = group
+            break
+    return f"{entry['method']} {path}"
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+async def _send(client: httpx.AsyncClient, entry: Dict) -> Dict:
+    url = entry["path"] + (f"?{entry['query']}" if entry.get("query") else "")
+    kwargs = {}
+    if entry.get("body") is not None:
+        kwargs["json"] = entry["body"]
+    result = {
+        "endpoint": endpoint_of(entry),
+        "recorded_ms": entry.get("duration_ms"),
+        "recorded_status": entry.get("status")
+    }
+    start = time.perf_counter()
+    try:
+        async with client.stream(entry["method"], url, **kwargs) as response:
+            result["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            async for _ in response.aiter_raw():
+                pass
+            result["status"] = response.status_code
+    except httpx.HTTPError as e:
+        result["status"] = None
+        result["error"] = type(e).__name__
+    result["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+async def replay(entries: List[Dict], target: str, speed: float, timeout: float) -> Dict:
+    """按原始到达间隔除以 speed 的时间表发送请求"""
+    lags: List[float] = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, limits=limits) as client:
+        tasks = []
+        first_ts = entries[0]["ts"]
+        started = time.perf_counter()
+        for entry in entries:
+            delay = (entry["ts"] - first_ts) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # 发送端落后于时间表，说明本机已成为瓶颈，结果不可信
+                lags.append(-delay)
+            tasks.append(asyncio.create_task(_send(client, entry)))
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "meta": {
+            "target": target,
+            "speed": speed,
+            "requests": len(results),
+            "elapsed": round(elapsed, 3),
+            "max_schedule_lag_ms": round(max(lags) * 1000, 2) if lags else 0.0
+        },
+        "results": results
+    }
+
+
+def summarize(results: List[Dict]) -> Dict[str, Dict]:
+    """按接口统计 TTFB、总耗时和采集时耗时的百分位"""
+    groups: Dict[str, List[Dict]] = {}
+    for result in results:
+        groups.setdefault(result["endpoint"], []).append(result)
+
+    summary = {}
+    for endpoint, items in sorted(groups.items()):
+        ok = [item for item in items if item.get("status") is not None and item["status"] < 400]
+        stats = {"requests": len(items), "errors": len(items) - len(ok)}
+        for field in ("ttfb_ms", "total_ms", "recorded_ms"):
+            values = [item[field] for item in ok if item.get(field) is not None]
+            for percent in (50, 95, 99):
+                stats[f"{field[:-3]}_p{percent}"] = _percentile(values, percent)
+        summary[endpoint] = stats
+    return summary
+
+
+def _delta(current: Optional[float], previous: Optional[float]) -> str:
+    if current is None or previous is None:
+        return "-"
+    sign = "+" if current >= previous else ""
+    return f"{sign}{current - previous:.1f}"
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def print_report(run: Dict, baseline: Optional[Dict]):
+    meta = run["meta"]
+    print(f"回放 {meta['requests']} 个请求，{meta['speed']}x 速度，耗时 {meta['elapsed']} 秒，"
+          f"最大调度延迟 {meta['max_schedule_lag_ms']} ms")
+    summary = summarize(run["results"])
+    baseline_summary = summarize(baseline["results"]) if baseline else {}
+
+    header = (f"{'endpoint':<40}{'reqs':>6}{'errs':>6}{'ttfb_p50':>10}{'ttfb_p95':>10}{'ttfb_p99':>10}"
+              f"{'total_p95':>11}{'Δrec_p50':>10}{'Δrec_p95':>10}")
+    if baseline:
+        header += f"{'Δbase_p50':>11}{'Δbase_p95':>11}{'Δbase_p99':>11}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in summary.items():
+        line = (f"{endpoint:<40}{stats['requests']:>6}{stats['errors']:>6}"
+                f"{_fmt(stats['ttfb_p50']):>10}{_fmt(stats['ttfb_p95']):>10}{_fmt(stats['ttfb_p99']):>10}"
+                f"{_fmt(stats['total_p95']):>11}"
+                f"{_delta(stats['ttfb_p50'], stats['recorded_p50']):>10}"
+                f"{_delta(stats['ttfb_p95'], stats['recorded_p95']):>10}")
+        if baseline:
+            previous = baseline_summary.get(endpoint, {})
+            line += "".join(
+                f"{_delta(stats[f'total_p{p}'], previous.get(f'total_p{p}')):>11}" for p in (50, 95, 99)
+            )
+        print(line)
+    print()
+    print("Δrec: 本次 TTFB 与采集时记录的耗时之差 (ms)；Δbase: 本次总耗时与基准回放之差 (ms)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="按原始到达间隔回放采集的线上流量")
+    parser.add_argument("journal", nargs="+", help="采集文件或目录")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="目标服务地址")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，如 4 表示到达间隔缩短为 1/4")
+    parser.add_argument("--limit", type=int, default=0, help="最多回放的请求数，0 表示全部")
+    parser.add_argument("--path-prefix", default="", help="只回放该前缀的路径，如 /api/v1/text_to_speech")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时（秒）")
+    parser.add_argument("--output", help="保存本次回放结果，可作为下次回放的 --baseline")
+    parser.add_argument("--baseline", help="对比的上一次回放结果")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.speed <= 0:
+        sys.exit("--speed 必须大于 0")
+
+    entries = [entry for entry in load_journal(args.journal) if entry["path"].startswith(args.path_prefix)]
+    # 请求体过大或非 JSON 时采集中没有保存内容，无法复现
+    replayable = [entry for entry in entries if entry.get("body") is not None or not entry.get("body_bytes")]
+    skipped = len(entries) - len(replayable)
+    if args.limit:
+        replayable = replayable[:args.limit]
+    if not replayable:
+        sys.exit("没有可回放的请求")
+    if skipped:
+        print(f"跳过 {skipped} 个未保存请求体的请求")
+
+    run = asyncio.run(replay(replayable, args.target, args.speed, args.timeout))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(run, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ backlog = 2048
 
 # Worker进程配置
 workers = max(2, multiprocessing.cpu_count())  # 至少2个worker
-worker_class = "uvicorn.workers.UvicornWorker"
+worker_class = "uvicorn_worker.GracefulUvicornWorker"
 worker_connections = 1000
 timeout = 120  # 增加超时时间
 keepalive = 2
@@ -41,8 +41,16 @@ tmp_upload_dir = None
 # 性能优化
 worker_tmp_dir = "/dev/shm" if os.path.exists("/dev/shm") else "/tmp"
 
-# 优雅重启
-graceful_timeout = 30
+# 优雅重启：前 graceful_timeout - SHUTDOWN_DRAIN_TIMEOUT - 5 秒等待进行中的 HTTP 请求（TTS 可能长达数十秒），
+# 之后最多 SHUTDOWN_DRAIN_TIMEOUT 秒等待后台任务、上游调用和文件写入
+graceful_timeout = 60
+
+# Prometheus 多进程指标目录，必须在 worker 导入应用之前设置
+prometheus_multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(worker_tmp_dir or "/tmp", f"{proc_name}_metrics")
+)
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
 
 # 安全设置
 limit_request_line = 4094
@@ -74,6 +82,7 @@ def on_starting(server):
     # 确保日志目录存在
     os.makedirs("logs", exist_ok=True)
     os.makedirs("audio_output", exist_ok=True)
+    reset_metrics_dir(server)
     
     server.log.info("🚀 Gemini Proxy 宝塔部署版本启动中...")
     server.log.info(f"📁 项目路径: {project_root}")
@@ -83,6 +92,19 @@ def on_reload(server):
     """重载时的钩子"""
     server.log.info("🔄 Gemini Proxy服务正在重载...")
 
+def child_exit(server, worker):
+    """Worker退出时清理其实时指标（in-flight 等）"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def reset_metrics_dir(server):
+    """清空上次运行遗留的指标文件，并交给 worker 运行用户"""
+    for filename in os.listdir(prometheus_multiproc_dir):
+        if filename.endswith(".db"):
+            os.remove(os.path.join(prometheus_multiproc_dir, filename))
+    if os.geteuid() == 0:
+        os.chown(prometheus_multiproc_dir, server.cfg.uid, server.cfg.gid)
+
 def worker_abort(worker):
     """Worker异常退出时的钩子"""
     worker.log.error(f"💥 Worker {worker.pid} 异常退出")
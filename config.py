@@ -7,6 +7,8 @@ load_dotenv()
 class Settings:
     # Gemini API 配置
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    # 自定义 Gemini API 地址（如压测时指向本地模拟服务），留空使用官方地址
+    GEMINI_API_BASE_URL: str = os.getenv("GEMINI_API_BASE_URL", "")
     
     # 服务器配置
     HOST: str = os.getenv("HOST", "0.0.0.0")
@@ -19,13 +21,187 @@ class Settings:
     # 输出目录
     AUDIO_OUTPUT_DIR: str = "audio_output"
     
+    # 音频文件 HTTP 缓存时间（秒），文件名为内容哈希，可长期缓存
+    AUDIO_CACHE_MAX_AGE: int = int(os.getenv("AUDIO_CACHE_MAX_AGE", "31536000"))
+    # 设置后通过 X-Accel-Redirect 交给 Nginx 发送音频文件，如 "/protected_audio"
+    AUDIO_ACCEL_REDIRECT_PREFIX: str = os.getenv("AUDIO_ACCEL_REDIRECT_PREFIX", "")
+    
+    # 内存热点音频缓存，最大字节数为 0 时关闭
+    AUDIO_HOT_CACHE_MAX_BYTES: int = int(os.getenv("AUDIO_HOT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # 访问次数达到该值后提升到内存
+    AUDIO_HOT_CACHE_PROMOTE_AFTER: int = int(os.getenv("AUDIO_HOT_CACHE_PROMOTE_AFTER", "2"))
+    # 设置后热点文件放在共享内存目录并以 mmap 读取，多个 worker 共享，如 "/dev/shm/gemini_proxy_audio"
+    AUDIO_HOT_CACHE_SHM_DIR: str = os.getenv("AUDIO_HOT_CACHE_SHM_DIR", "")
+    
+    # 各类工作负载使用独立线程池（线程数和排队上限），某一类负载占满时只拒绝该类请求 (503)
+    TEXT_EXECUTOR_WORKERS: int = int(os.getenv("TEXT_EXECUTOR_WORKERS", "8"))
+    TEXT_EXECUTOR_QUEUE_SIZE: int = int(os.getenv("TEXT_EXECUTOR_QUEUE_SIZE", "32"))
+    TTS_EXECUTOR_WORKERS: int = int(os.getenv("TTS_EXECUTOR_WORKERS", "16"))
+    TTS_EXECUTOR_QUEUE_SIZE: int = int(os.getenv("TTS_EXECUTOR_QUEUE_SIZE", "64"))
+    MULTI_SPEAKER_EXECUTOR_WORKERS: int = int(os.getenv("MULTI_SPEAKER_EXECUTOR_WORKERS", "4"))
+    MULTI_SPEAKER_EXECUTOR_QUEUE_SIZE: int = int(os.getenv("MULTI_SPEAKER_EXECUTOR_QUEUE_SIZE", "16"))
+    # 静音裁剪、响度归一化、变速等 CPU 密集的音频处理
+    AUDIO_PROCESSING_WORKERS: int = int(os.getenv("AUDIO_PROCESSING_WORKERS", str(os.cpu_count() or 2)))
+    AUDIO_PROCESSING_QUEUE_SIZE: int = int(os.getenv("AUDIO_PROCESSING_QUEUE_SIZE", "32"))
+    # 音频文件读写专用线程数
+    AUDIO_IO_WORKERS: int = int(os.getenv("AUDIO_IO_WORKERS", "4"))
+    AUDIO_IO_QUEUE_SIZE: int = int(os.getenv("AUDIO_IO_QUEUE_SIZE", "256"))
+    
+    # 上游并发自适应限制：延迟平稳时逐步提高并发上限，延迟上升或出现 429/超时时降低（每个 worker 进程独立计算）
+    UPSTREAM_LIMIT_ENABLED: bool = os.getenv("UPSTREAM_LIMIT_ENABLED", "true").lower() == "true"
+    UPSTREAM_LIMIT_INITIAL: int = int(os.getenv("UPSTREAM_LIMIT_INITIAL", "8"))
+    UPSTREAM_LIMIT_MIN: int = int(os.getenv("UPSTREAM_LIMIT_MIN", "2"))
+    UPSTREAM_LIMIT_MAX: int = int(os.getenv("UPSTREAM_LIMIT_MAX", "32"))
+    # 短期延迟超过长期基线的该倍数时开始降低上限（TTS 延迟随文本长度变化，容忍度宜大一些）
+    UPSTREAM_LIMIT_TOLERANCE: float = float(os.getenv("UPSTREAM_LIMIT_TOLERANCE", "2.0"))
+    # 出现 429 或超时时上限乘以该系数
+    UPSTREAM_LIMIT_BACKOFF: float = float(os.getenv("UPSTREAM_LIMIT_BACKOFF", "0.8"))
+    # 等待并发名额的最长时间（秒），超时返回 503
+    UPSTREAM_LIMIT_MAX_WAIT: float = float(os.getenv("UPSTREAM_LIMIT_MAX_WAIT", "10"))
+    
+    # 入口限流：排队延迟在 LOAD_SHED_INTERVAL_MS 内持续超过 LOAD_SHED_TARGET_MS 时，新请求直接返回 503
+    LOAD_SHED_ENABLED: bool = os.getenv("LOAD_SHED_ENABLED", "true").lower() == "true"
+    LOAD_SHED_TARGET_MS: float = float(os.getenv("LOAD_SHED_TARGET_MS", "100"))
+    LOAD_SHED_INTERVAL_MS: float = float(os.getenv("LOAD_SHED_INTERVAL_MS", "1000"))
+    LOAD_SHED_RETRY_AFTER: int = int(os.getenv("LOAD_SHED_RETRY_AFTER", "2"))
+    # 不会被拒绝的轻量接口，保证健康检查正常
+    LOAD_SHED_EXEMPT_PATHS: str = os.getenv(
+        "LOAD_SHED_EXEMPT_PATHS", "/api/v1/health,/api/v1/voices,/api/v1/languages,/metrics"
+    )
+    # 反向代理记录请求开始时间的请求头（Nginx: proxy_set_header X-Request-Start "t=${msec}"），用于计算代理到应用之间的排队时间
+    REQUEST_START_HEADER: str = os.getenv("REQUEST_START_HEADER", "X-Request-Start")
+    # 只采用这些反向代理（逗号分隔的 IP 或 CIDR，如 127.0.0.1）转发的请求开始时间头，留空则不读取该请求头
+    REQUEST_START_TRUSTED_PROXIES: str = os.getenv("REQUEST_START_TRUSTED_PROXIES", "")
+    # 早于该时间（毫秒）或晚于当前时间的请求开始时间视为无效
+    REQUEST_START_MAX_AGE_MS: float = float(os.getenv("REQUEST_START_MAX_AGE_MS", "30000"))
+    
+    # 上游健康探测：每组 worker 中由一个进程定期向每个模型发送最小请求，结果写入共享状态文件供 /status 等读取
+    UPSTREAM_PROBE_ENABLED: bool = os.getenv("UPSTREAM_PROBE_ENABLED", "true").lower() == "true"
+    UPSTREAM_PROBE_INTERVAL: float = float(os.getenv("UPSTREAM_PROBE_INTERVAL", "60"))
+    UPSTREAM_PROBE_TIMEOUT: float = float(os.getenv("UPSTREAM_PROBE_TIMEOUT", "15"))
+    UPSTREAM_PROBE_STATE_FILE: str = os.getenv("UPSTREAM_PROBE_STATE_FILE", "logs/upstream_health.json")
+    UPSTREAM_PROBE_LOCK_FILE: str = os.getenv("UPSTREAM_PROBE_LOCK_FILE", "logs/upstream_probe.lock")
+    # TTS 模型默认只查询模型信息；开启后每次探测真实合成一个词，会消耗语音合成配额（间隔 60 秒时每天约 1440 次）
+    UPSTREAM_PROBE_TTS_SYNTHESIS: bool = os.getenv("UPSTREAM_PROBE_TTS_SYNTHESIS", "false").lower() == "true"
+    
+    # 用量统计：按客户端标识（USAGE_CLIENT_HEADER 请求头）记录上游 token、TTS 字符数和音频时长，
+    # 在内存中汇总后每隔 USAGE_FLUSH_INTERVAL 秒批量写入 SQLite
+    USAGE_ENABLED: bool = os.getenv("USAGE_ENABLED", "true").lower() == "true"
+    USAGE_DB_PATH: str = os.getenv("USAGE_DB_PATH", "logs/usage.db")
+    USAGE_FLUSH_INTERVAL: float = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+    USAGE_CLIENT_HEADER: str = os.getenv("USAGE_CLIENT_HEADER", "X-Client-Id")
+    USAGE_ANONYMOUS_CLIENT: str = os.getenv("USAGE_ANONYMOUS_CLIENT", "anonymous")
+    # API Key 到客户端的映射，格式 "key-1=client-a,key-2=client-b"；配置后客户端只由 API Key
+    # （USAGE_API_KEY_HEADER 请求头或 Authorization: Bearer）确定，忽略 USAGE_CLIENT_HEADER
+    USAGE_CLIENT_KEYS: str = os.getenv("USAGE_CLIENT_KEYS", "")
+    USAGE_API_KEY_HEADER: str = os.getenv("USAGE_API_KEY_HEADER", "X-API-Key")
+    # 查询所有客户端用量 (GET /usage) 的管理 Key；客户端 Key 只能查询自己的用量
+    USAGE_ADMIN_KEY: str = os.getenv("USAGE_ADMIN_KEY", "")
+    # 每个客户端每个周期（UTC 自然日 day 或自然月 month）的用量上限，格式 "client-a=1000000,*=200000"，
+    # * 表示未单独配置的客户端，留空不限制；用完后该客户端的 POST 请求返回 429
+    USAGE_QUOTA_TOKENS: str = os.getenv("USAGE_QUOTA_TOKENS", "")
+    USAGE_QUOTA_TTS_CHARACTERS: str = os.getenv("USAGE_QUOTA_TTS_CHARACTERS", "")
+    USAGE_QUOTA_PERIOD: str = os.getenv("USAGE_QUOTA_PERIOD", "day")
+    
+    # 快速 JSON 序列化：orjson 作为默认响应类，长文本响应由 pydantic-core 直接序列化，固定内容的接口预先序列化
+    FAST_JSON_RESPONSES: bool = os.getenv("FAST_JSON_RESPONSES", "true").lower() == "true"
+    
+    # worker 关闭（重启、max_requests 回收）时等待后台任务、上游调用和文件写入完成的最长时间（秒），
+    # 需小于 gunicorn 的 graceful_timeout，剩余时间留给进行中的 HTTP 请求
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "15"))
+    
+    # 音频片段缓存目录及保留数量
+    SEGMENT_CACHE_DIR: str = os.path.join(AUDIO_OUTPUT_DIR, "segments")
+    SEGMENT_CACHE_MAX_FILES: int = int(os.getenv("SEGMENT_CACHE_MAX_FILES", "2000"))
+    
+    # 按句分段缓存配置
+    TTS_SEGMENTED_DEFAULT: bool = os.getenv("TTS_SEGMENTED_DEFAULT", "false").lower() == "true"
+    TTS_SEGMENT_CONCURRENCY: int = int(os.getenv("TTS_SEGMENT_CONCURRENCY", "4"))
+    TTS_SEGMENT_GAP_MS: int = int(os.getenv("TTS_SEGMENT_GAP_MS", "0"))
+    
+    # 音频后处理默认配置
+    TTS_TRIM_SILENCE_DEFAULT: bool = os.getenv("TTS_TRIM_SILENCE_DEFAULT", "false").lower() == "true"
+    TTS_NORMALIZE_DEFAULT: bool = os.getenv("TTS_NORMALIZE_DEFAULT", "false").lower() == "true"
+    # slow=True 时使用的语速倍率
+    TTS_SLOW_SPEED: float = float(os.getenv("TTS_SLOW_SPEED", "0.8"))
+    
+    # 多说话人分段合成配置
+    MULTI_SPEAKER_MAX_SINGLE_CHARS: int = int(os.getenv("MULTI_SPEAKER_MAX_SINGLE_CHARS", "5000"))
+    MULTI_SPEAKER_CHUNK_CHARS: int = int(os.getenv("MULTI_SPEAKER_CHUNK_CHARS", "800"))
+    MULTI_SPEAKER_CHUNK_MAX_TURNS: int = int(os.getenv("MULTI_SPEAKER_CHUNK_MAX_TURNS", "10"))
+    MULTI_SPEAKER_CHUNK_CONCURRENCY: int = int(os.getenv("MULTI_SPEAKER_CHUNK_CONCURRENCY", "4"))
+    
+    # 流水线 generate_and_speak：同时合成的句子数，以及未出现句末标点时强制断句的字符数
+    SPEAK_PIPELINE_CONCURRENCY: int = int(os.getenv("SPEAK_PIPELINE_CONCURRENCY", "3"))
+    SPEAK_PIPELINE_MAX_SENTENCE_CHARS: int = int(os.getenv("SPEAK_PIPELINE_MAX_SENTENCE_CHARS", "300"))
+    
+    # WebSocket 实时接口：每个连接同时处理的请求数、待发送消息队列长度（客户端读取过慢时暂停生成）、音频二进制帧大小
+    WS_MAX_CONCURRENT_REQUESTS: int = int(os.getenv("WS_MAX_CONCURRENT_REQUESTS", "4"))
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+    WS_AUDIO_CHUNK_BYTES: int = int(os.getenv("WS_AUDIO_CHUNK_BYTES", "32768"))
+    
+    # TTS 请求历史（用于缓存预热），会以明文记录请求文本，默认不记录；
+    # 需要按历史预热时设置为如 logs/tts_history.jsonl
+    TTS_HISTORY_FILE: str = os.getenv("TTS_HISTORY_FILE", "")
+    TTS_HISTORY_MAX_BYTES: int = int(os.getenv("TTS_HISTORY_MAX_BYTES", str(20 * 1024 * 1024)))
+    
+    # TTS 缓存预热配置
+    TTS_PREWARM_ON_STARTUP: bool = os.getenv("TTS_PREWARM_ON_STARTUP", "false").lower() == "true"
+    TTS_PREWARM_PHRASES_FILE: str = os.getenv("TTS_PREWARM_PHRASES_FILE", "")
+    TTS_PREWARM_HISTORY_HOURS: int = int(os.getenv("TTS_PREWARM_HISTORY_HOURS", "72"))
+    TTS_PREWARM_TOP_N: int = int(os.getenv("TTS_PREWARM_TOP_N", "100"))
+    TTS_PREWARM_RATE_PER_MINUTE: float = float(os.getenv("TTS_PREWARM_RATE_PER_MINUTE", "20"))
+    TTS_PREWARM_MAX_LIVE_INFLIGHT: int = int(os.getenv("TTS_PREWARM_MAX_LIVE_INFLIGHT", "0"))
+    TTS_PREWARM_LOCK_FILE: str = os.getenv("TTS_PREWARM_LOCK_FILE", "logs/tts_prewarm.lock")
+    
+    # 异步任务队列配置
+    JOB_DIR: str = os.getenv("JOB_DIR", "logs/jobs")
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_QUEUE_MAX_SIZE: int = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+    JOB_RETENTION_HOURS: int = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+    # 线程池或上游并发名额已满时的重试次数（间隔 1、2、4… 秒），用完后任务失败
+    JOB_BUSY_RETRIES: int = int(os.getenv("JOB_BUSY_RETRIES", "5"))
+    # 设置后 webhook 请求带 X-Signature-SHA256 (HMAC-SHA256) 签名头
+    JOB_WEBHOOK_SECRET: str = os.getenv("JOB_WEBHOOK_SECRET", "")
+    JOB_WEBHOOK_TIMEOUT: float = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+    JOB_WEBHOOK_RETRIES: int = int(os.getenv("JOB_WEBHOOK_RETRIES", "3"))
+    # 回调地址允许列表（逗号分隔的主机名、".example.com" 形式的子域名或 URL 前缀）；
+    # 为空时接受任意公网地址，始终拒绝未列入的内网地址
+    JOB_WEBHOOK_ALLOWED_HOSTS: str = os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "")
+    
+    # 日志配置：格式为 text 或 json（每行一个 JSON 对象，便于日志平台解析）；LOG_LEVELS 按 logger 设置级别，如 "httpx=WARNING,services.job_queue=DEBUG"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "httpx=WARNING")
+    LOG_FILE: str = os.getenv("LOG_FILE", "")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # 以下 logger 的 INFO 日志（缓存命中、合成成功等高频日志）按比例采样，默认 1 表示全部保留，需要降低日志量时再调小
+    LOG_SAMPLED_LOGGERS: str = os.getenv("LOG_SAMPLED_LOGGERS", "services.gemini_tts_service,services.gemini_service,api.endpoints")
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    
+    # 请求追踪：从该请求头读取 trace id（没有则生成）并在响应中返回
+    TRACE_ID_HEADER: str = os.getenv("TRACE_ID_HEADER", "X-Trace-Id")
+    # 总耗时超过该值（毫秒）的请求记录分阶段耗时日志
+    SLOW_REQUEST_LOG_MS: float = float(os.getenv("SLOW_REQUEST_LOG_MS", "5000"))
+    
+    # 线上流量采集（用于离线回放复现性能问题），默认关闭
+    TRAFFIC_CAPTURE_ENABLED: bool = os.getenv("TRAFFIC_CAPTURE_ENABLED", "false").lower() == "true"
+    TRAFFIC_CAPTURE_SAMPLE_RATE: float = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "0.05"))
+    TRAFFIC_CAPTURE_DIR: str = os.getenv("TRAFFIC_CAPTURE_DIR", "logs/traffic")
+    # 是否将文本内容替换为等长的伪随机文本（同一文本替换结果相同，保留缓存命中特征）
+    TRAFFIC_CAPTURE_ANONYMIZE: bool = os.getenv("TRAFFIC_CAPTURE_ANONYMIZE", "true").lower() == "true"
+    # 匿名化使用的密钥，多个 worker 和多次启动间保持一致；留空时每个进程随机生成
+    TRAFFIC_CAPTURE_SALT: str = os.getenv("TRAFFIC_CAPTURE_SALT", "")
+    TRAFFIC_CAPTURE_EXCLUDE_PATHS: str = os.getenv("TRAFFIC_CAPTURE_EXCLUDE_PATHS", "/metrics,/api/v1/health")
+    TRAFFIC_CAPTURE_MAX_BODY_BYTES: int = int(os.getenv("TRAFFIC_CAPTURE_MAX_BODY_BYTES", "65536"))
+    # 单个文件超过该大小后轮转并 gzip 压缩，目录中最多保留的压缩文件数
+    TRAFFIC_CAPTURE_MAX_BYTES: int = int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+    TRAFFIC_CAPTURE_BACKUP_COUNT: int = int(os.getenv("TRAFFIC_CAPTURE_BACKUP_COUNT", "20"))
+    TRAFFIC_CAPTURE_QUEUE_SIZE: int = int(os.getenv("TRAFFIC_CAPTURE_QUEUE_SIZE", "10000"))
+    
     # Gemini 模型配置
     GEMINI_MODEL: str = "gemini-2.0-flash"
-    
-    def __post_init__(self):
-        # 确保音频输出目录存在
-        os.makedirs(self.AUDIO_OUTPUT_DIR, exist_ok=True)
+
 
 # 创建全局配置实例
-settings = Settings()
-settings.__post_init__() 
\ No newline at end of file
+settings = Settings() 
\ No newline at end of file
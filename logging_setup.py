@@ -0,0 +1,154 @@
+"""
+日志配置
+
+所有日志记录先进入内存队列，由后台线程统一格式化并写出，请求处理过程中不做日志 I/O。
+支持 JSON 结构化输出、按 logger 设置级别，以及对高频成功日志按比例采样。
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Optional, Dict, List
+
+from config import settings
+from services import timing
+
+# 写入 JSON 时忽略的 LogRecord 标准属性
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """将日志记录格式化为单行 JSON，extra 参数中的字段一并输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "sample" and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """在调用线程上补充 trace id（入队前执行，后台线程无法获取请求上下文）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "trace_id"):
+            timings = timing.current()
+            if timings is not None:
+                record.trace_id = timings.trace_id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对指定 logger 的 INFO 及以下级别日志按比例采样
+
+    WARNING 及以上级别总是保留；记录时传入 extra={"sample": False} 可跳过采样。
+    """
+
+    def __init__(self, loggers: List[str], rate: float):
+        super().__init__()
+        self.prefixes = tuple(loggers)
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno > logging.INFO or not record.name.startswith(self.prefixes):
+            return True
+        if not getattr(record, "sample", True):
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时丢弃日志，不阻塞请求处理"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def parse_logger_levels(value: str) -> Dict[str, str]:
+    """解析 "logger=LEVEL,logger2=LEVEL" 格式的按 logger 级别配置"""
+    levels = {}
+    for item in value.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """配置根 logger：日志经队列交给后台线程写出，可重复调用"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+    handlers = [output]
+    if settings.LOG_FILE:
+        directory = os.path.dirname(settings.LOG_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.WatchedFileHandler(settings.LOG_FILE, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLED_LOGGERS.split(","), settings.LOG_SAMPLE_RATE))
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in parse_logger_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    # gunicorn preload_app 时在主进程配置日志，fork 出的 worker 中没有后台线程，需要重新启动
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def _restart_listener_after_fork():
+    global _listener
+    if _listener is None:
+        return
+    _queue_handler.queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
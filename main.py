@@ -1,21 +1,35 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-import uvicorn
+from fastapi.responses import HTMLResponse, Response
 import logging
-import os
+import time
 from contextlib import asynccontextmanager
 
-from api.endpoints import router
 from config import settings
+from logging_setup import setup_logging
+
+# 配置日志（在导入服务模块之前，使其初始化日志也经过队列输出）
+setup_logging()
+
+from api.endpoints import router
+from api.audio_response import serve_audio_file
+from api.json_response import DefaultJSONResponse
+from services.tts_prewarm import tts_prewarmer
+from services.job_queue import job_queue
+from services.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, USAGE_QUOTA_REJECTED, render_metrics
+from services import timing
+from services.traffic_capture import traffic_recorder
+from services.bulkhead import BulkheadFullError, POOLS
+from services.concurrency_limit import LIMITERS
+from services.load_shedding import load_shedder
+from services.audio_cache import hot_audio_cache
+from services.shutdown import drain_background_work
+from services.upstream_health import upstream_prober
+from services.usage import usage_tracker
+from services import usage
+from services.gemini_tts_service import gemini_tts_service
+from services.genai_loader import genai_loader
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
@@ -24,13 +38,50 @@ async def lifespan(app: FastAPI):
     # 启动时
     logger.info("Gemini 代理服务启动中...")
     
-    # 确保音频输出目录存在
-    os.makedirs(settings.AUDIO_OUTPUT_DIR, exist_ok=True)
+    # 确保音频输出和片段缓存目录存在
+    gemini_tts_service.prepare()
+    
+    # 在一个后台线程中导入 Gemini SDK 并创建两个客户端，不推迟 worker 开始接受请求；
+    # 请求和上游探测都等待这一次加载的结果
+    genai_loader.start()
     
     logger.info(f"服务器运行在 http://{settings.HOST}:{settings.PORT}")
+    
+    # 每个 worker 进程上报各线程池的线程数和上游并发上限
+    for pool in POOLS:
+        pool.publish_capacity()
+    for limiter in LIMITERS:
+        limiter.publish()
+    
+    # 启动事件循环延迟探测（入口限流的排队延迟估计）
+    load_shedder.monitor.start()
+    
+    # 启动上游健康探测（每组 worker 中只有一个进程实际发送探测请求）
+    upstream_prober.start()
+    
+    # 启动用量记录的定期批量写入
+    usage_tracker.start()
+    
+    # 启动异步任务 worker
+    job_queue.start()
+    
+    # 部署或清空缓存后预热热门短语
+    if settings.TTS_PREWARM_ON_STARTUP:
+        tts_prewarmer.start_from_sources()
+    
     yield
     
-    # 关闭时
+    # 关闭时：等待进行中的任务、上游调用和音频写入完成（有最长等待时间）
+    await drain_background_work(settings.SHUTDOWN_DRAIN_TIMEOUT)
+    await load_shedder.monitor.stop()
+    await upstream_prober.stop()
+    # 收尾期间完成的上游调用也已计入，写入剩余用量
+    await usage_tracker.stop()
+    traffic_recorder.stop()
+    # 释放内存热点层并同步缓存指标
+    hot_audio_cache.clear()
+    for pool in POOLS:
+        pool.shutdown(wait=False)
     logger.info("Gemini 代理服务关闭")
 
 # 创建 FastAPI 应用
@@ -40,7 +91,8 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultJSONResponse
 )
 
 # 配置 CORS
@@ -52,19 +104,118 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 包含路由
-app.include_router(router, prefix="/api/v1", tags=["main"])
+# 某类负载的线程池或上游并发名额已满时快速返回 503，不影响其他接口
+@app.exception_handler(BulkheadFullError)
+async def bulkhead_full_handler(request: Request, exc: BulkheadFullError):
+    logger.warning(f"{exc.pool} 繁忙，拒绝请求 {request.method} {request.url.path}")
+    return DefaultJSONResponse(
+        status_code=503,
+        content={"success": False, "error": str(exc)},
+        headers={"Retry-After": "1"}
+    )
 
-# 挂载静态文件
-if os.path.exists(settings.AUDIO_OUTPUT_DIR):
-    app.mount("/audio", StaticFiles(directory=settings.AUDIO_OUTPUT_DIR), name="audio")
+# 线上流量采样记录，供离线回放（最先注册，位于最内层，可以取到当前请求的分阶段耗时）
+@app.middleware("http")
+async def capture_traffic(request: Request, call_next):
+    if not traffic_recorder.should_capture(request.url.path):
+        return await call_next(request)
+    body = await request.body()
+    start = time.perf_counter()
+    response = await call_next(request)
+    timings = timing.current()
+    traffic_recorder.record(
+        method=request.method,
+        path=request.url.path,
+        query=request.url.query,
+        content_type=request.headers.get("content-type", ""),
+        body=body,
+        status=response.status_code,
+        duration=time.perf_counter() - start,
+        timings=timings.as_dict() if timings is not None else None,
+        trace_id=timings.trace_id if timings is not None else None
+    )
+    return response
 
-# 创建模板目录（如果需要）
-templates_dir = "templates"
-if not os.path.exists(templates_dir):
-    os.makedirs(templates_dir, exist_ok=True)
+# 请求耗时和并发数监控
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        # 使用路由模板作为标签，避免音频文件名等路径参数导致标签数量膨胀
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_DURATION.labels(request.method, endpoint, str(status)).observe(time.perf_counter() - start)
+
+# 分阶段耗时：通过 Server-Timing 响应头返回，并与 trace id 关联
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    trace_id = request.headers.get(settings.TRACE_ID_HEADER, "")[:128] or None
+    timings = timing.start_request(trace_id)
+    response = await call_next(request)
+    server_timing = timings.server_timing_header()
+    response.headers["Server-Timing"] = server_timing
+    response.headers[settings.TRACE_ID_HEADER] = timings.trace_id
+    if timings.as_dict()["total"] >= settings.SLOW_REQUEST_LOG_MS:
+        logger.info(f"慢请求 trace_id={timings.trace_id} {request.method} {request.url.path} {server_timing}")
+    return response
+
+# 用量统计：记录当前请求的客户端标识，用完配额的客户端的 POST 请求直接返回 429
+@app.middleware("http")
+async def enforce_usage_quota(request: Request, call_next):
+    client_id = usage.resolve_client(
+        usage.api_key_from(request.headers), request.headers.get(settings.USAGE_CLIENT_HEADER)
+    )
+    usage.set_client(client_id)
+    if request.method == "POST":
+        exceeded = usage_tracker.check_quota(client_id)
+        if exceeded is not None:
+            USAGE_QUOTA_REJECTED.inc()
+            return DefaultJSONResponse(
+                status_code=429,
+                content={"success": False, "error": exceeded},
+                headers={"Retry-After": str(usage_tracker.quota_retry_after())}
+            )
+    return await call_next(request)
 
-templates = Jinja2Templates(directory=templates_dir)
+# 入口限流：排队延迟持续超过目标值时直接拒绝新请求（最后注册，位于最外层，被拒绝的请求不做任何其他处理）
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    # uvicorn 按 X-Forwarded-For 改写客户端地址时端口为 0（真实连接的端口不会为 0）
+    forwarded = request.client is not None and request.client.port == 0 and "x-forwarded-for" in request.headers
+    if load_shedder.should_shed(
+        request.url.path,
+        request.headers.get(load_shedder.request_start_header),
+        request.client.host if request.client else None,
+        forwarded
+    ):
+        return DefaultJSONResponse(
+            status_code=503,
+            content={"success": False, "error": "服务繁忙，请稍后重试"},
+            headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER)}
+        )
+    return await call_next(request)
+
+# Prometheus 指标（gunicorn 多 worker 部署时汇总所有 worker）
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
+
+# 包含路由
+app.include_router(router, prefix="/api/v1", tags=["main"])
+
+# 音频文件访问（强ETag、immutable 缓存、304 和 Range 支持）
+@app.api_route("/audio/{filename}", methods=["GET", "HEAD"], include_in_schema=False)
+async def audio_file(request: Request, filename: str):
+    """音频文件访问"""
+    return await serve_audio_file(request, filename)
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -168,6 +319,8 @@ async def server_error_handler(request: Request, exc):
     )
 
 if __name__ == "__main__":
+    import uvicorn
+    
     uvicorn.run(
         "main:app",
         host=settings.HOST,
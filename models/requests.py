@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 class TextGenerationRequest(BaseModel):
     """文本生成请求模型"""
@@ -13,6 +13,13 @@ class TextToSpeechRequest(BaseModel):
     text: str = Field(..., description="要转换的文本", min_length=1, max_length=5000)
     voice_name: Optional[str] = Field("Kore", description="声音名称，如: Kore, Puck, Zephyr")
     language: Optional[str] = Field(None, description="语言代码（可选，模型自动检测）")
+    segmented: Optional[bool] = Field(None, description="是否按句子分段缓存并拼接，适合由固定句式组成的文本")
+    slow: bool = Field(False, description="是否使用慢速语音")
+    speed: Optional[float] = Field(None, description="语速倍率，小于 1 为慢速，指定后忽略 slow", ge=0.5, le=2.0)
+    trim_silence: Optional[bool] = Field(None, description="是否去除首尾静音")
+    normalize: Optional[bool] = Field(None, description="是否进行响度归一化")
+    response_format: Literal["url", "binary"] = Field("url", description="响应格式: url 返回音频链接, binary 直接返回 audio/wav 数据")
+    cache: bool = Field(True, description="binary 模式下是否在响应后写入音频缓存")
 
 class TextGenerationWithHistoryRequest(BaseModel):
     """基于历史的文本生成请求模型"""
@@ -41,6 +48,9 @@ class ApiStatusResponse(BaseModel):
     message: str = Field(..., description="状态信息")
     model: Optional[str] = Field(None, description="使用的模型")
     test_response: Optional[str] = Field(None, description="测试响应")
+    upstreams: Optional[Dict[str, Dict[str, Any]]] = Field(
+        None, description="各上游模型最近一次健康探测结果（是否健康、延迟、错误、探测时间）"
+    )
 
 class LanguagesResponse(BaseModel):
     """支持语言响应模型"""
@@ -55,6 +65,7 @@ class CombinedRequest(BaseModel):
     temperature: float = Field(0.7, description="创造性参数", ge=0.0, le=1.0)
     voice_name: Optional[str] = Field("Kore", description="声音名称")
     language: Optional[str] = Field(None, description="语音语言代码（可选）")
+    pipelined: bool = Field(False, description="流水线模式：边生成文本边按句合成，以 NDJSON 流按顺序返回每句音频")
 
 class CombinedResponse(BaseModel):
     """组合响应模型"""
@@ -72,11 +83,61 @@ class SpeakerConfig(BaseModel):
 
 class MultiSpeakerTTSRequest(BaseModel):
     """多说话人TTS请求模型"""
-    text: str = Field(..., description="包含说话人标记的文本", min_length=1, max_length=5000)
+    text: str = Field(..., description="包含说话人标记的文本", min_length=1, max_length=50000)
     speaker_configs: List[SpeakerConfig] = Field(..., description="说话人配置列表")
+    chunked: Optional[bool] = Field(None, description="是否按说话人轮次分段并行合成，默认在文本较长时自动分段")
 
 class VoicesResponse(BaseModel):
     """声音列表响应模型"""
     success: bool = Field(..., description="是否成功")
     voices: Optional[List[str]] = Field(None, description="支持的声音列表")
-    error: Optional[str] = Field(None, description="错误信息") 
\ No newline at end of file
+    error: Optional[str] = Field(None, description="错误信息") 
+
+class PrewarmPhrase(BaseModel):
+    """预热短语模型"""
+    text: str = Field(..., description="要预热的文本", min_length=1, max_length=5000)
+    voice_name: str = Field("Kore", description="声音名称")
+    language: Optional[str] = Field(None, description="语言代码（可选）")
+    segmented: Optional[bool] = Field(None, description="是否按句子分段缓存")
+
+class PrewarmRequest(BaseModel):
+    """TTS缓存预热请求模型"""
+    phrases: Optional[List[PrewarmPhrase]] = Field(None, description="要预热的短语列表，不传时从请求历史中选取热门短语")
+    top_n: Optional[int] = Field(None, description="从请求历史中选取的短语数量", ge=1, le=10000)
+    rate_per_minute: Optional[float] = Field(None, description="每分钟最多上游合成次数", gt=0, le=600)
+
+class PrewarmResponse(BaseModel):
+    """TTS缓存预热响应模型"""
+    success: bool = Field(..., description="是否成功启动")
+    status: Optional[Dict[str, Any]] = Field(None, description="预热任务状态")
+    error: Optional[str] = Field(None, description="错误信息")
+
+class CacheStatsResponse(BaseModel):
+    """音频缓存统计响应模型"""
+    success: bool = Field(..., description="是否成功")
+    stats: Optional[Dict[str, Any]] = Field(None, description="各缓存层命中统计")
+    error: Optional[str] = Field(None, description="错误信息")
+
+class JobSubmitRequest(BaseModel):
+    """异步任务提交请求模型"""
+    type: Literal["tts", "multi_speaker_tts", "generate_and_speak"] = Field(..., description="任务类型")
+    params: Dict[str, Any] = Field(..., description="任务参数，与对应同步接口的请求体相同")
+    callback_url: Optional[str] = Field(None, description="任务完成后 POST 结果的回调地址（可选）", pattern=r"^https?://")
+
+class JobResponse(BaseModel):
+    """异步任务响应模型"""
+    success: bool = Field(..., description="是否成功")
+    job_id: Optional[str] = Field(None, description="任务ID")
+    state: Optional[str] = Field(None, description="任务状态: queued / running / succeeded / failed")
+    result: Optional[Dict[str, Any]] = Field(None, description="任务结果，包含 audio_url、filename 等")
+    error: Optional[str] = Field(None, description="错误信息")
+    created_at: Optional[float] = Field(None, description="提交时间戳")
+    finished_at: Optional[float] = Field(None, description="完成时间戳")
+
+class UsageResponse(BaseModel):
+    """用量查询响应模型"""
+    success: bool = Field(..., description="是否成功")
+    usage: Optional[List[Dict[str, Any]]] = Field(None, description="按客户端、模型和操作汇总的用量")
+    totals: Optional[Dict[str, Any]] = Field(None, description="查询范围内的用量合计")
+    quota: Optional[Dict[str, Any]] = Field(None, description="指定客户端时返回其当前配额周期的用量和上限")
+    error: Optional[str] = Field(None, description="错误信息")
@@ -0,0 +1,291 @@
+import logging
+import mmap
+import os
+import threading
+from typing import Optional, Dict, Any, Union
+
+from config import settings
+from services.audio_store import audio_store, write_file_atomic
+from services.bulkhead import BulkheadFullError
+from services.metrics import AUDIO_CACHE_LOOKUPS, AUDIO_CACHE_BYTES, AUDIO_CACHE_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+class HotAudioEntry:
+    """
+    热点缓存中的音频条目
+
+    淘汰时只移除引用，不主动关闭内存映射，避免与正在读取的请求竞争；
+    映射在最后一个引用释放时自动解除。
+    """
+
+    __slots__ = ("data", "stat_result", "size")
+
+    def __init__(self, data: Union[bytes, memoryview], stat_result: os.stat_result):
+        self.data = data
+        self.stat_result = stat_result
+        self.size = len(data)
+
+    def read(self, offset: int = 0, count: Optional[int] = None) -> bytes:
+        """读取指定区间的数据"""
+        end = self.size if count is None else offset + count
+        if offset == 0 and end == self.size and isinstance(self.data, bytes):
+            return self.data
+        return bytes(self.data[offset:end])
+
+
+class HotAudioCache:
+    """
+    内存热点音频缓存
+
+    位于磁盘音频缓存 (audio_output) 之前的按字节数限制的内存层。
+    访问频率达到阈值的文件会被提升到内存，空间不足时淘汰访问频率最低的条目；
+    访问计数会定期减半，使长期不再访问的文件逐渐降级。
+
+    配置 AUDIO_HOT_CACHE_SHM_DIR（如 /dev/shm/gemini_proxy_audio）后，
+    提升的文件会复制到共享内存目录并以 mmap 方式读取，多个 worker 共享同一份物理内存。
+    """
+
+    def __init__(self, max_bytes: int, promote_after: int, shm_dir: str = ""):
+        self.max_bytes = max_bytes
+        self.promote_after = max(promote_after, 1)
+        self.shm_dir = shm_dir
+        self.enabled = max_bytes > 0
+
+        self._entries: Dict[str, HotAudioEntry] = {}
+        self._frequency: Dict[str, int] = {}
+        self._promoting = set()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+        # 访问计数衰减：每累计这么多次访问，所有计数减半
+        self._decay_interval = 1000
+        self._accesses_since_decay = 0
+
+        # 分层命中统计
+        self.hot_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.promotions = 0
+        self.evictions = 0
+
+        if self.enabled and self.shm_dir:
+            try:
+                os.makedirs(self.shm_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"共享内存目录不可用，热点缓存仅使用进程内存: {str(e)}")
+                self.shm_dir = ""
+
+    def _touch(self, filename: str) -> int:
+        """增加访问计数并返回新的计数（需持有锁）"""
+        count = self._frequency.get(filename, 0) + 1
+        self._frequency[filename] = count
+        self._accesses_since_decay += 1
+        if self._accesses_since_decay >= self._decay_interval:
+            self._accesses_since_decay = 0
+            self._frequency = {
+                name: freq // 2
+                for name, freq in self._frequency.items()
+                if freq // 2 > 0 or name in self._entries
+            }
+        return count
+
+    def get(self, filename: str) -> Optional[HotAudioEntry]:
+        """查询内存层，命中时记录访问"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None:
+                self.hot_hits += 1
+                self._touch(filename)
+        if entry is not None:
+            AUDIO_CACHE_LOOKUPS.labels("hot").inc()
+        return entry
+
+    async def lookup(self, filename: str, filepath: str) -> Optional[HotAudioEntry]:
+        """
+        查询内存层，并确认磁盘文件仍是提升时的那一个
+
+        内存层是每个 worker 各自的，磁盘文件可能已被其他 worker 的清理删除或重新生成。
+        文件不存在或已被替换时移出内存层并按未命中处理，不返回在其他 worker 上 404 的音频地址。
+        """
+        if not self.enabled or filename not in self._entries:
+            return None
+        try:
+            stat_result = await audio_store.stat(filepath)
+        except FileNotFoundError:
+            stat_result = None
+        except BulkheadFullError:
+            # I/O 线程池已满时无法确认，仍使用内存层
+            return self.get(filename)
+        entry = self._entries.get(filename)
+        if entry is None:
+            return None
+        if stat_result is None or not _same_file(entry.stat_result, stat_result):
+            logger.info(f"磁盘音频已删除或被替换，移出内存层: {filename}")
+            self.discard(filename)
+            return None
+        return self.get(filename)
+
+    def contains(self, filename: str) -> bool:
+        """判断文件是否在内存层（不计入命中统计）"""
+        return self.enabled and filename in self._entries
+
+    def record_disk_hit(self, filename: str) -> bool:
+        """
+        记录一次磁盘层命中
+
+        Returns:
+            是否应将该文件提升到内存层
+        """
+        AUDIO_CACHE_LOOKUPS.labels("disk").inc()
+        with self._lock:
+            self.disk_hits += 1
+            if not self.enabled:
+                return False
+            count = self._touch(filename)
+            if count < self.promote_after or filename in self._entries or filename in self._promoting:
+                return False
+            self._promoting.add(filename)
+            return True
+
+    def record_miss(self):
+        """记录一次两层都未命中（需要重新合成）"""
+        AUDIO_CACHE_LOOKUPS.labels("miss").inc()
+        with self._lock:
+            self.misses += 1
+
+    def promote(self, filename: str, filepath: str):
+        """将磁盘文件提升到内存层（阻塞操作，应在线程池中调用）"""
+        try:
+            entry = self._load_entry(filename, filepath)
+            if entry is None:
+                return
+            with self._lock:
+                if filename in self._entries or not self._make_room(filename, entry.size):
+                    return
+                self._entries[filename] = entry
+                self._current_bytes += entry.size
+                self.promotions += 1
+                self._update_gauges()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"提升热点音频失败 {filename}: {str(e)}")
+        finally:
+            with self._lock:
+                self._promoting.discard(filename)
+
+    def _load_entry(self, filename: str, filepath: str) -> Optional[HotAudioEntry]:
+        """读取文件内容；使用共享内存目录时复制到该目录并建立内存映射"""
+        stat_result = os.stat(filepath)
+        if stat_result.st_size == 0 or stat_result.st_size > self.max_bytes:
+            return None
+
+        if not self.shm_dir:
+            with open(filepath, "rb") as f:
+                return HotAudioEntry(f.read(), stat_result)
+
+        shm_path = os.path.join(self.shm_dir, filename)
+        try:
+            shm_stat = os.stat(shm_path)
+            stale = shm_stat.st_size != stat_result.st_size or shm_stat.st_mtime_ns < stat_result.st_mtime_ns
+        except FileNotFoundError:
+            stale = True
+        if stale:
+            # 其他 worker 尚未提升该文件，复制到共享内存目录
+            with open(filepath, "rb") as src:
+                write_file_atomic(shm_path, src.read())
+
+        with open(shm_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return HotAudioEntry(memoryview(mapped), stat_result)
+
+    def _make_room(self, filename: str, size: int) -> bool:
+        """按访问频率淘汰条目，为新条目腾出空间（需持有锁）"""
+        if self._current_bytes + size <= self.max_bytes:
+            return True
+
+        candidate_freq = self._frequency.get(filename, 0)
+        victims = sorted(self._entries, key=lambda name: self._frequency.get(name, 0))
+        freed = 0
+        to_evict = []
+        for name in victims:
+            if self._current_bytes - freed + size <= self.max_bytes:
+                break
+            # 不淘汰比新条目更热的文件
+            if self._frequency.get(name, 0) > candidate_freq:
+                return False
+            to_evict.append(name)
+            freed += self._entries[name].size
+
+        if self._current_bytes - freed + size > self.max_bytes:
+            return False
+        for name in to_evict:
+            self._evict(name)
+        return True
+
+    def _evict(self, filename: str, remove_shared: bool = True):
+        """移出内存层（需持有锁）"""
+        entry = self._entries.pop(filename, None)
+        if entry is None:
+            return
+        self._current_bytes -= entry.size
+        self.evictions += 1
+        self._update_gauges()
+        if self.shm_dir and remove_shared:
+            try:
+                os.remove(os.path.join(self.shm_dir, filename))
+            except OSError:
+                pass
+
+    def _update_gauges(self):
+        """同步内存层占用到监控指标（需持有锁）"""
+        AUDIO_CACHE_BYTES.set(self._current_bytes)
+        AUDIO_CACHE_ENTRIES.set(len(self._entries))
+
+    def discard(self, filename: str):
+        """磁盘文件被删除时同步移出内存层"""
+        with self._lock:
+            self._evict(filename)
+            self._frequency.pop(filename, None)
+
+    def clear(self):
+        """清空本进程的内存层（共享内存目录中的文件保留给其他 worker）"""
+        with self._lock:
+            for filename in list(self._entries):
+                self._evict(filename, remove_shared=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """分层命中统计"""
+        with self._lock:
+            total = self.hot_hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "shared_memory": bool(self.shm_dir),
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hot_hits": self.hot_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "promotions": self.promotions,
+                "evictions": self.evictions,
+                "hot_hit_ratio": self.hot_hits / total if total else 0.0,
+                "disk_hit_ratio": self.disk_hits / total if total else 0.0,
+                "miss_ratio": self.misses / total if total else 0.0
+            }
+
+
+
+def _same_file(a: os.stat_result, b: os.stat_result) -> bool:
+    return (a.st_dev, a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_dev, b.st_ino, b.st_size, b.st_mtime_ns)
+
+# 创建全局实例
+hot_audio_cache = HotAudioCache(
+    max_bytes=settings.AUDIO_HOT_CACHE_MAX_BYTES,
+    promote_after=settings.AUDIO_HOT_CACHE_PROMOTE_AFTER,
+    shm_dir=settings.AUDIO_HOT_CACHE_SHM_DIR
+)
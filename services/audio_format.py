@@ -0,0 +1,115 @@
+import binascii
+import logging
+import struct
+from typing import Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 音频数据：bytes 或指向原始响应数据的 memoryview，避免复制大块音频
+AudioBuffer = Union[bytes, memoryview]
+
+# 兼容旧版 SDK / REST 返回的字段名
+_PART_AUDIO_ATTRS = ("inline_data", "inlineData", "audio_data", "audioData", "data")
+
+_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def extract_audio_data(response: Any) -> AudioBuffer:
+    """
+    从 Gemini generate_content 响应中提取 PCM 音频数据
+
+    先走当前 SDK 的结构 candidates[0].content.parts[*].inline_data.data（已解码的 bytes），
+    直接返回原始对象不做复制；找不到时再兼容其他字段名和 base64 字符串。
+
+    Raises:
+        Exception: 响应中没有音频数据
+    """
+    if not response:
+        raise Exception("Gemini API 返回空响应")
+
+    parts = _response_parts(response)
+    if parts:
+        for part in parts:
+            inline_data = getattr(part, "inline_data", None)
+            data = getattr(inline_data, "data", None)
+            if isinstance(data, bytes) and data:
+                return _strip_wav_container(data)
+
+    # 兼容路径：响应直接携带 audio 字段
+    audio = getattr(response, "audio", None)
+    if audio:
+        data = _decode_payload(getattr(audio, "data", None))
+        if data:
+            return _strip_wav_container(data)
+
+    if not getattr(response, "candidates", None):
+        raise Exception("Gemini API 未返回候选结果")
+    if not parts:
+        raise Exception("响应中缺少内容部分")
+
+    for part in parts:
+        for attr_name in _PART_AUDIO_ATTRS:
+            value = getattr(part, attr_name, None)
+            if not value:
+                continue
+            data = _decode_payload(getattr(value, "data", value))
+            if data:
+                return _strip_wav_container(data)
+
+    raise Exception(f"响应中未找到音频数据，Parts数量: {len(parts)}")
+
+
+def _response_parts(response: Any) -> Optional[list]:
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return None
+    content = getattr(candidates[0], "content", None)
+    return getattr(content, "parts", None) if content else None
+
+
+def _decode_payload(value: Any) -> Optional[AudioBuffer]:
+    """bytes 原样返回，base64 字符串一次解码为 bytes，其他类型返回 None"""
+    if isinstance(value, (bytes, memoryview)):
+        return value
+    if isinstance(value, bytearray):
+        return memoryview(value)
+    if isinstance(value, str):
+        try:
+            # a2b_base64 直接接受 ASCII 字符串，解码结果只分配一次
+            return binascii.a2b_base64(value)
+        except (binascii.Error, ValueError) as e:
+            logger.warning(f"解码base64音频数据失败: {str(e)}")
+    return None
+
+
+def _strip_wav_container(data: AudioBuffer) -> AudioBuffer:
+    """返回的是 WAV 文件时，以 memoryview 切出 data 块，不复制 PCM 数据"""
+    view = memoryview(data)
+    if len(view) < 12 or view[:4] != b"RIFF" or view[8:12] != b"WAVE":
+        return data
+
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = int.from_bytes(view[offset + 4:offset + 8], "little")
+        offset += 8
+        if chunk_id == b"data":
+            return view[offset:offset + chunk_size]
+        offset += chunk_size + (chunk_size & 1)
+    return data
+
+
+def build_wav_header(data_size: int, channels: int, sample_width: int, sample_rate: int) -> bytes:
+    """生成 44 字节的 PCM WAV 文件头"""
+    block_align = channels * sample_width
+    return _WAV_HEADER.pack(
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b"data", data_size
+    )
+
+
+def build_wav_bytes(pcm_data: AudioBuffer, channels: int, sample_width: int, sample_rate: int) -> bytes:
+    """将 PCM 数据封装为 WAV，只复制一次 PCM 数据"""
+    header = build_wav_header(len(pcm_data), channels, sample_width, sample_rate)
+    return b"".join((header, pcm_data))
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from typing import Optional, Dict, Any, TYPE_CHECKING
+
+# numpy 只在请求了音频后处理时才导入，不计入 worker 启动时间
+if TYPE_CHECKING:
+    import numpy as np
+
+# 静音检测参数
+SILENCE_THRESHOLD_DB = -45.0
+SILENCE_FRAME_MS = 10
+SILENCE_PADDING_MS = 60
+
+# 响度归一化参数
+TARGET_LOUDNESS_DBFS = -20.0
+PEAK_LIMIT_DBFS = -1.0
+
+# 变速参数：40ms 帧长，50% 重叠
+TEMPO_FRAME_MS = 40
+
+
+def _frame_levels_db(samples: np.ndarray, frame: int) -> np.ndarray:
+    """按帧计算 RMS 电平 (dBFS)"""
+    import numpy as np
+
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(rms + 1e-10)
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """去除首尾静音，保留少量余量避免截断字音"""
+    import numpy as np
+
+    frame = sample_rate * SILENCE_FRAME_MS // 1000
+    if len(samples) < frame:
+        return samples
+
+    active = np.flatnonzero(_frame_levels_db(samples, frame) > SILENCE_THRESHOLD_DB)
+    if active.size == 0:
+        return samples
+
+    padding = sample_rate * SILENCE_PADDING_MS // 1000
+    start = max(int(active[0]) * frame - padding, 0)
+    end = min((int(active[-1]) + 1) * frame + padding, len(samples))
+    return samples[start:end]
+
+
+def normalize_loudness(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """按有声部分的 RMS 响度归一化到目标电平，并限制峰值避免削波"""
+    import numpy as np
+
+    peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+    if peak == 0.0:
+        return samples
+
+    frame = sample_rate * SILENCE_FRAME_MS // 1000
+    levels = _frame_levels_db(samples, frame) if len(samples) >= frame else np.array([])
+    voiced = levels[levels > SILENCE_THRESHOLD_DB]
+    if voiced.size:
+        # 以有声帧的平均能量作为响度
+        loudness = 10.0 * np.log10(np.mean(np.power(10.0, voiced / 10.0)))
+    else:
+        loudness = 20.0 * np.log10(np.sqrt(np.mean(samples * samples)) + 1e-10)
+
+    gain = 10.0 ** ((TARGET_LOUDNESS_DBFS - loudness) / 20.0)
+    gain = min(gain, 10.0 ** (PEAK_LIMIT_DBFS / 20.0) / peak)
+    return samples * gain
+
+
+def change_tempo(samples: np.ndarray, sample_rate: int, speed: float) -> np.ndarray:
+    """
+    重叠相加 (OLA) 变速，不改变音高
+
+    以固定合成步长、按速度缩放的分析步长取帧，加汉宁窗后叠加。
+    50% 重叠的周期汉宁窗叠加后增益恒为 1，可整体向量化计算。
+    """
+    import numpy as np
+
+    frame = sample_rate * TEMPO_FRAME_MS // 1000
+    hop = frame // 2
+    if abs(speed - 1.0) < 1e-3 or len(samples) < frame:
+        return samples
+
+    analysis_hop = hop * speed
+    frame_count = int((len(samples) - frame) / analysis_hop) + 1
+    starts = np.floor(np.arange(frame_count) * analysis_hop).astype(np.int64)
+    frames = samples[starts[:, None] + np.arange(frame)]
+
+    window = (0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+    frames = frames * window
+
+    output = np.zeros((frame_count + 1, hop), dtype=np.float32)
+    output[:-1] += frames[:, :hop]
+    output[1:] += frames[:, hop:]
+    return output.reshape(-1)
+
+
+def process_pcm(
+    pcm_data: bytes,
+    sample_rate: int,
+    trim: bool = False,
+    normalize: bool = False,
+    speed: float = 1.0
+) -> bytes:
+    """
+    对 16-bit 单声道 PCM 依次执行静音裁剪、响度归一化和变速
+
+    Args:
+        pcm_data: 16-bit 小端 PCM 数据
+        sample_rate: 采样率
+        trim: 是否去除首尾静音
+        normalize: 是否进行响度归一化
+        speed: 语速倍率，小于 1 为慢速
+
+    Returns:
+        处理后的 16-bit PCM 数据
+    """
+    import numpy as np
+
+    if not (trim or normalize or abs(speed - 1.0) >= 1e-3):
+        return pcm_data
+
+    usable = len(pcm_data) - len(pcm_data) % 2
+    samples = np.frombuffer(pcm_data, dtype="<i2", count=usable // 2).astype(np.float32) / 32768.0
+
+    if trim:
+        samples = trim_silence(samples, sample_rate)
+    if normalize:
+        samples = normalize_loudness(samples, sample_rate)
+    samples = change_tempo(samples, sample_rate, speed)
+
+    return (np.clip(samples, -1.0, 32767.0 / 32768.0) * 32768.0).astype("<i2").tobytes()
+
+
+def resolve_processing_options(
+    slow: bool = False,
+    speed: Optional[float] = None,
+    trim: Optional[bool] = None,
+    normalize: Optional[bool] = None,
+    slow_speed: float = 0.8,
+    trim_default: bool = False,
+    normalize_default: bool = False
+) -> Dict[str, Any]:
+    """合并请求参数和默认配置，得到完整的后处理参数"""
+    if speed is None:
+        speed = slow_speed if slow else 1.0
+    return {
+        "trim": trim_default if trim is None else trim,
+        "normalize": normalize_default if normalize is None else normalize,
+        "speed": round(float(speed), 3)
+    }
+
+
+def processing_cache_suffix(options: Dict[str, Any]) -> str:
+    """
+    后处理参数对应的缓存键后缀
+
+    未启用任何处理时返回空字符串，保证原有缓存文件名不变。
+    """
+    parts = []
+    if options["trim"]:
+        parts.append("trim")
+    if options["normalize"]:
+        parts.append("norm")
+    if options["speed"] != 1.0:
+        parts.append(f"speed{options['speed']}")
+    return "_".join(parts)
@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Any
+
+from services.audio_format import build_wav_header
+from services.bulkhead import Bulkhead, audio_io_pool
+
+logger = logging.getLogger(__name__)
+
+
+class AudioStore:
+    """
+    音频存储异步 I/O 层
+
+    音频缓存目录的所有文件操作（检查、读取、写入、清理）都在专用线程池中执行，
+    不占用事件循环，也不与上游 API 调用争抢线程。
+    """
+
+    def __init__(self, pool: Bulkhead):
+        self._pool = pool
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """在 I/O 线程池中执行阻塞函数"""
+        return await self._pool.run(func, *args)
+
+    def submit(self, func: Callable[..., Any], *args) -> Future:
+        """提交后台 I/O 任务，不等待结果"""
+        return self._pool.submit(func, *args)
+
+    async def exists(self, path: str) -> bool:
+        return await self.run(os.path.exists, path)
+
+    async def stat(self, path: str) -> os.stat_result:
+        return await self.run(os.stat, path)
+
+    async def read(self, path: str) -> bytes:
+        return await self.run(_read_file, path)
+
+    async def write(self, path: str, data: bytes):
+        """原子写入文件：先写临时文件再替换，读取方不会看到写了一半的文件"""
+        await self.run(write_file_atomic, path, data)
+
+    async def write_wav(self, path: str, pcm_data: bytes, channels: int, sample_width: int, sample_rate: int):
+        """将 PCM 数据原子写入为 WAV 文件"""
+        await self.run(_write_wav_atomic, path, pcm_data, channels, sample_width, sample_rate)
+
+    def shutdown(self, wait: bool = True):
+        """关闭 I/O 线程池，wait 为 True 时等待已提交的写入完成"""
+        self._pool.shutdown(wait=wait)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _tmp_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_file_atomic(path: str, data: bytes):
+    """同步原子写入文件（先写临时文件再替换）"""
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def _write_wav_atomic(path: str, pcm_data: bytes, channels: int, sample_width: int, sample_rate: int):
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            # 分别写入文件头和 PCM 数据，不拼接复制
+            f.write(build_wav_header(len(pcm_data), channels, sample_width, sample_rate))
+            f.write(pcm_data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# 创建全局实例
+audio_store = AudioStore(audio_io_pool)
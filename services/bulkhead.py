@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Any, Dict, NoReturn
+
+from config import settings
+from services import timing
+from services.metrics import EXECUTOR_PENDING, EXECUTOR_ACTIVE, EXECUTOR_WORKERS, EXECUTOR_REJECTED
+
+
+class BulkheadFullError(Exception):
+    """线程池的排队任务已达上限"""
+
+    def __init__(self, pool: str):
+        super().__init__(f"{pool} 服务繁忙，请稍后重试")
+        self.pool = pool
+
+
+def raise_service_error(e: Exception, message: str, log: logging.Logger) -> NoReturn:
+    """
+    服务方法通用异常分支的统一出口：记录日志后包装为带说明的 Exception 抛出
+
+    BulkheadFullError 原样抛出，由全局处理器返回 503，不被包装成普通的失败
+    """
+    if isinstance(e, BulkheadFullError):
+        raise e
+    log.error(f"{message}: {str(e)}")
+    raise Exception(f"{message}: {str(e)}")
+
+
+class Bulkhead:
+    """
+    隔离的线程池
+
+    文本生成、TTS、多说话人 TTS、音频处理和文件 I/O 各使用一个，
+    一类负载变慢（如大量 20 秒的语音合成）只会占满自己的线程池，不影响其他接口。
+    排队和执行中的任务数达到 线程数 + 排队上限 时立即拒绝新任务，而不是无限排队。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queued: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._active = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._pending_gauge = EXECUTOR_PENDING.labels(name)
+        self._active_gauge = EXECUTOR_ACTIVE.labels(name)
+
+    def run(self, func: Callable[..., Any], *args) -> "asyncio.Future":
+        """
+        在线程池中执行阻塞函数，返回可 await 的 Future
+
+        Raises:
+            BulkheadFullError: 排队任务数已达上限
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queued:
+                self._rejected += 1
+                EXECUTOR_REJECTED.labels(self.name).inc()
+                raise BulkheadFullError(self.name)
+        return asyncio.wrap_future(self.submit(func, *args))
+
+    def submit(self, func: Callable[..., Any], *args) -> Future:
+        """提交任务，不检查排队上限（用于不能丢弃的后台写入等）"""
+        task = timing.bind_to_request(func, *args)
+
+        def execute():
+            with self._lock:
+                self._active += 1
+            self._active_gauge.inc()
+            try:
+                return task()
+            finally:
+                with self._lock:
+                    self._active -= 1
+                self._active_gauge.dec()
+
+        with self._lock:
+            self._pending += 1
+        self._pending_gauge.inc()
+        # 在线程池的 Future 上计数：调用方超时取消等待后，线程中的任务仍然占用线程直到结束
+        future = self._executor.submit(execute)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, _future: Future):
+        with self._lock:
+            self._pending -= 1
+        self._pending_gauge.dec()
+
+    @property
+    def pending(self) -> int:
+        """排队和执行中的任务数"""
+        return self._pending
+
+    def publish_capacity(self):
+        """上报线程数指标，需在每个 worker 进程中调用（preload_app 时主进程中的设置不计入 worker）"""
+        EXECUTOR_WORKERS.labels(self.name).set(self.max_workers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "rejected": self._rejected
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+# 创建全局实例
+text_pool = Bulkhead("text", settings.TEXT_EXECUTOR_WORKERS, settings.TEXT_EXECUTOR_QUEUE_SIZE)
+tts_pool = Bulkhead("tts", settings.TTS_EXECUTOR_WORKERS, settings.TTS_EXECUTOR_QUEUE_SIZE)
+multi_speaker_pool = Bulkhead(
+    "multi_speaker", settings.MULTI_SPEAKER_EXECUTOR_WORKERS, settings.MULTI_SPEAKER_EXECUTOR_QUEUE_SIZE
+)
+audio_processing_pool = Bulkhead(
+    "audio_processing", settings.AUDIO_PROCESSING_WORKERS, settings.AUDIO_PROCESSING_QUEUE_SIZE
+)
+audio_io_pool = Bulkhead("audio_io", settings.AUDIO_IO_WORKERS, settings.AUDIO_IO_QUEUE_SIZE)
+
+POOLS = (text_pool, tts_pool, multi_speaker_pool, audio_processing_pool, audio_io_pool)
@@ -0,0 +1,195 @@
+import asyncio
+import collections
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+
+from config import settings
+from services.bulkhead import BulkheadFullError
+from services.metrics import UPSTREAM_CONCURRENCY_LIMIT, UPSTREAM_LIMIT_WAITING, UPSTREAM_LIMIT_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimitExceeded(BulkheadFullError):
+    """等待上游并发名额超时，与线程池已满同样返回 503"""
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """上游过载的信号：超时、429 / RESOURCE_EXHAUSTED"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+class AdaptiveLimiter:
+    """
+    上游调用的自适应并发限制（参考 Netflix concurrency-limits 的 Gradient2 算法）
+
+    以长期平均延迟作为基线、近期平均延迟作为当前值：
+    当前延迟不超过基线的 tolerance 倍时逐步提高上限（每次约增加 sqrt(limit)），
+    超过时按比例降低；出现 429 或超时时上限直接乘以 backoff。
+    超出上限的调用在事件循环中排队等待（不占用线程），等待超过 max_wait 时拒绝。
+    只在事件循环线程中使用，不需要加锁。
+    """
+
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int,
+                 tolerance: float, backoff: float, max_wait: float, enabled: bool = True,
+                 smoothing: float = 0.2, long_window: int = 600, short_window: int = 10):
+        self.name = name
+        self.enabled = enabled
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self._long_decay = 2.0 / (long_window + 1)
+        self._short_decay = 2.0 / (short_window + 1)
+        self._estimated_limit = float(min(max(initial, min_limit), max_limit))
+        self._long_rtt = 0.0
+        self._short_rtt = 0.0
+        self._inflight = 0
+        self._last_drop = 0.0
+        self._waiters: collections.deque = collections.deque()
+        self._limit_gauge = UPSTREAM_CONCURRENCY_LIMIT.labels(name)
+        self._waiting_gauge = UPSTREAM_LIMIT_WAITING.labels(name)
+
+    @property
+    def limit(self) -> int:
+        return int(self._estimated_limit)
+
+    def publish(self):
+        """上报当前上限，需在每个 worker 进程中调用"""
+        self._limit_gauge.set(self.limit)
+
+    @asynccontextmanager
+    async def acquire(self, measure_latency: bool = True):
+        """
+        获取一个上游并发名额，退出时根据耗时和结果调整上限
+
+        Args:
+            measure_latency: 是否用本次耗时调整上限；流式调用的耗时取决于输出长度，只计入并发数
+
+        Raises:
+            ConcurrencyLimitExceeded: 等待名额超过 max_wait
+        """
+        if not self.enabled:
+            yield
+            return
+        await self._wait_for_slot()
+        start = time.perf_counter()
+        outcome = "ignore"
+        try:
+            yield
+            outcome = "success" if measure_latency else "ignore"
+        except BaseException as e:
+            if is_overload_error(e):
+                outcome = "dropped"
+            raise
+        finally:
+            self._release(start, outcome)
+
+    async def _wait_for_slot(self):
+        if self._inflight < self.limit and not self._waiters:
+            self._inflight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._waiting_gauge.inc()
+        try:
+            # 名额由 _wake_waiters 分配，_inflight 已在分配时增加
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return
+            waiter.cancel()
+            UPSTREAM_LIMIT_REJECTED.labels(self.name).inc()
+            raise ConcurrencyLimitExceeded(f"{self.name} 上游")
+        except asyncio.CancelledError:
+            # 调用方被取消时，如果名额已分配则归还
+            if waiter.done() and not waiter.cancelled():
+                self._inflight -= 1
+                self._wake_waiters()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            self._waiting_gauge.dec()
+
+    def _wake_waiters(self):
+        while self._waiters and self._inflight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._inflight += 1
+            waiter.set_result(None)
+
+    def _release(self, start: float, outcome: str):
+        self._inflight -= 1
+        if outcome == "dropped":
+            # 同一批并发调用接连失败时只降低一次：忽略在上次降低之前就已发出的调用
+            if start >= self._last_drop:
+                self._last_drop = time.perf_counter()
+                self._update_limit(max(self.min_limit, self._estimated_limit * self.backoff))
+                logger.warning("上游过载，%s 并发上限降为 %d", self.name, self.limit)
+        elif outcome == "success":
+            self._on_sample(time.perf_counter() - start)
+        self._wake_waiters()
+
+    def _on_sample(self, rtt: float):
+        if self._long_rtt == 0.0:
+            self._long_rtt = self._short_rtt = rtt
+            return
+        self._short_rtt += (rtt - self._short_rtt) * self._short_decay
+        self._long_rtt += (rtt - self._long_rtt) * self._long_decay
+        # 基线远高于当前延迟时（上游恢复后）加速回落，避免基线长期偏高
+        if self._long_rtt / self._short_rtt > 2:
+            self._long_rtt *= 0.95
+
+        # 只有并发接近上限时才提高上限，空闲时的低延迟不能说明能承受更高并发
+        if self._inflight < self._estimated_limit / 2:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self._long_rtt / self._short_rtt))
+        new_limit = self._estimated_limit * gradient + math.sqrt(self._estimated_limit)
+        new_limit = self._estimated_limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self._update_limit(max(self.min_limit, min(self.max_limit, new_limit)))
+
+    def _update_limit(self, value: float):
+        self._estimated_limit = value
+        self._limit_gauge.set(self.limit)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "inflight": self._inflight,
+            "waiting": len(self._waiters),
+            "long_rtt_ms": round(self._long_rtt * 1000, 1),
+            "short_rtt_ms": round(self._short_rtt * 1000, 1)
+        }
+
+
+def _create_limiter(name: str) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        name=name,
+        initial=settings.UPSTREAM_LIMIT_INITIAL,
+        min_limit=settings.UPSTREAM_LIMIT_MIN,
+        max_limit=settings.UPSTREAM_LIMIT_MAX,
+        tolerance=settings.UPSTREAM_LIMIT_TOLERANCE,
+        backoff=settings.UPSTREAM_LIMIT_BACKOFF,
+        max_wait=settings.UPSTREAM_LIMIT_MAX_WAIT,
+        enabled=settings.UPSTREAM_LIMIT_ENABLED
+    )
+
+
+# 创建全局实例
+text_limiter = _create_limiter("text")
+tts_limiter = _create_limiter("tts")
+multi_speaker_limiter = _create_limiter("multi_speaker_tts")
+
+LIMITERS = (text_limiter, tts_limiter, multi_speaker_limiter)
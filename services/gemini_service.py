@@ -1,11 +1,20 @@
-import google.genai as genai
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, TYPE_CHECKING
 from config import settings
+from services.metrics import track_upstream, UPSTREAM_RETRIES
+from services.usage import usage_tracker
+from services.bulkhead import raise_service_error, text_pool
+from services.concurrency_limit import text_limiter
+from services import timing
+from services.genai_loader import genai_loader
 import logging
 import asyncio
+import threading
+
+# google-genai 在后台线程中加载，这里只为类型注解导入
+if TYPE_CHECKING:
+    from google.genai import types
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class GeminiService:
@@ -14,21 +23,65 @@ class GeminiService:
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
         self.model_name = settings.GEMINI_MODEL
-        self.client = None
+        self._client = None
+        self._client_initialized = False
+        self._client_lock = threading.Lock()
+        genai_loader.register(self)
         
-        if self.api_key:
-            self._initialize_client()
-        else:
+        if not self.api_key:
             logger.warning("Gemini API Key 未配置")
     
+    @property
+    def client(self):
+        """
+        Gemini 客户端，首次使用时创建
+
+        google.genai 的导入耗时约占应用导入时间的一半，延迟到首次使用（或启动后的后台预热）
+        以缩短 worker 启动时间。未配置 API Key 或初始化失败时为 None。
+        """
+        if not self._client_initialized:
+            with self._client_lock:
+                if not self._client_initialized:
+                    if self.api_key:
+                        self._initialize_client()
+                    # 创建失败时保持未初始化，之后的调用重新尝试
+                    self._client_initialized = self._client is not None or not self.api_key
+        return self._client
+    
+    def warm_up(self) -> bool:
+        """导入 SDK 并创建客户端（阻塞操作，在后台线程中调用）"""
+        return self.client is not None
+    
+    async def ready_client(self):
+        """
+        在事件循环中获取客户端：等待后台线程导入 SDK 并创建客户端，不在事件循环中导入或创建
+        
+        Raises:
+            Exception: 未配置 API Key 或客户端创建失败
+        """
+        await genai_loader.ready()
+        if self._client is None:
+            raise Exception("Gemini 客户端未初始化，请检查 API Key")
+        return self._client
+    
+    def _http_options(self) -> Optional["types.HttpOptions"]:
+        """配置了 GEMINI_API_BASE_URL 时使用自定义 API 地址"""
+        from google.genai import types
+        
+        if not settings.GEMINI_API_BASE_URL:
+            return None
+        return types.HttpOptions(base_url=settings.GEMINI_API_BASE_URL)
+    
     def _initialize_client(self):
         """初始化 Gemini 客户端"""
+        import google.genai as genai
+        
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self._client = genai.Client(api_key=self.api_key, http_options=self._http_options())
             logger.info(f"Gemini 客户端初始化成功，使用模型: {self.model_name}")
         except Exception as e:
             logger.error(f"Gemini 客户端初始化失败: {str(e)}")
-            self.client = None
+            self._client = None
             # 不要抛出异常，允许服务启动但返回错误信息
     
     async def generate_text(
@@ -50,8 +103,7 @@ class GeminiService:
         Returns:
             生成的文本
         """
-        if not self.client:
-            raise Exception("Gemini 客户端未初始化，请检查 API Key")
+        await self.ready_client()
         
         try:
             # 配置生成参数
@@ -64,20 +116,83 @@ class GeminiService:
                 generation_config["max_output_tokens"] = max_tokens
             
             # 在线程池中执行生成操作
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                self._generate_content, 
-                prompt, 
-                generation_config
-            )
+            async with text_limiter.acquire():
+                response = await text_pool.run(
+                    self._generate_content, 
+                    prompt, 
+                    generation_config
+                )
             
-            logger.info(f"成功生成文本，长度: {len(response)} 字符")
+            logger.info("成功生成文本，长度: %d 字符", len(response))
             return response
             
         except Exception as e:
-            logger.error(f"文本生成失败: {str(e)}")
-            raise Exception(f"文本生成失败: {str(e)}")
+            raise_service_error(e, "文本生成失败", logger)
+    
+    async def stream_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        top_p: float = 0.9
+    ) -> AsyncIterator[str]:
+        """
+        流式生成文本，逐块返回生成的内容
+        
+        SDK 的流式接口是同步迭代器，在线程池中读取后通过队列交给事件循环；
+        调用方提前结束迭代时通知读取线程停止。
+        """
+        await self.ready_client()
+        
+        from google.genai.types import GenerateContentConfig
+        
+        config = GenerateContentConfig(
+            temperature=temperature,
+            top_p=top_p,
+            max_output_tokens=max_tokens
+        )
+        loop = asyncio.get_event_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+        end_of_stream = object()
+        
+        def read_stream():
+            usage_metadata = None
+            try:
+                with track_upstream(self.model_name, "stream_text"):
+                    for chunk in self.client.models.generate_content_stream(
+                        model=self.model_name,
+                        contents=prompt,
+                        config=config
+                    ):
+                        # 用量是累计值，以最后一块为准
+                        usage_metadata = chunk.usage_metadata or usage_metadata
+                        if stopped.is_set():
+                            break
+                        if chunk.text:
+                            loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+                loop.call_soon_threadsafe(queue.put_nowait, end_of_stream)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                # 中途停止或出错时按已返回的部分计算
+                if usage_metadata is not None:
+                    usage_tracker.record(self.model_name, "stream_text", usage_metadata)
+        
+        # 流式调用的耗时取决于输出长度，只占用并发名额，不用于调整上限
+        async with text_limiter.acquire(measure_latency=False):
+            text_pool.run(read_stream)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is end_of_stream:
+                        break
+                    if isinstance(item, Exception):
+                        logger.error(f"流式文本生成失败: {str(item)}")
+                        raise Exception(f"文本生成失败: {str(item)}")
+                    yield item
+            finally:
+                stopped.set()
     
     def _generate_content(self, prompt: str, generation_config: Dict[str, Any]) -> str:
         """在线程中生成内容，带重试机制"""
@@ -98,11 +213,13 @@ class GeminiService:
                     max_output_tokens=generation_config.get("max_output_tokens")
                 )
                 
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=prompt,
-                    config=config
-                )
+                with track_upstream(self.model_name, "generate_text"), timing.stage("text_generation"):
+                    response = self.client.models.generate_content(
+                        model=self.model_name,
+                        contents=prompt,
+                        config=config
+                    )
+                usage_tracker.record(self.model_name, "generate_text", response.usage_metadata)
                 
                 # 提取生成的文本
                 if response.candidates and len(response.candidates) > 0:
@@ -114,6 +231,7 @@ class GeminiService:
             except ssl.SSLError as ssl_error:
                 logger.warning(f"SSL错误 (尝试 {attempt + 1}/{max_retries}): {str(ssl_error)}")
                 if attempt < max_retries - 1:
+                    UPSTREAM_RETRIES.labels(self.model_name, "ssl").inc()
                     time.sleep(retry_delay * (attempt + 1))
                     continue
                 else:
@@ -122,6 +240,7 @@ class GeminiService:
                 if "ssl" in str(e).lower() or "unexpected_eof" in str(e).lower():
                     logger.warning(f"网络连接错误 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
                     if attempt < max_retries - 1:
+                        UPSTREAM_RETRIES.labels(self.model_name, "network").inc()
                         time.sleep(retry_delay * (attempt + 1))
                         continue
                 
@@ -145,8 +264,7 @@ class GeminiService:
         Returns:
             生成的文本
         """
-        if not self.client:
-            raise Exception("Gemini 客户端未初始化，请检查 API Key")
+        await self.ready_client()
         
         try:
             # 将历史消息转换为单个 prompt
@@ -159,8 +277,7 @@ class GeminiService:
             )
             
         except Exception as e:
-            logger.error(f"基于历史的文本生成失败: {str(e)}")
-            raise Exception(f"基于历史的文本生成失败: {str(e)}")
+            raise_service_error(e, "基于历史的文本生成失败", logger)
     
     def _format_messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         """将消息历史格式化为 prompt"""
@@ -189,7 +306,9 @@ class GeminiService:
                     "message": "API Key 未配置"
                 }
             
-            if not self.client:
+            try:
+                await self.ready_client()
+            except Exception:
                 return {
                     "status": "error", 
                     "message": "Gemini 客户端未初始化"
@@ -201,7 +320,7 @@ class GeminiService:
                 "message": "服务已准备就绪",
                 "model": self.model_name,
                 "api_configured": bool(self.api_key),
-                "client_initialized": bool(self.client)
+                "client_initialized": self._client is not None
             }
             
         except Exception as e:
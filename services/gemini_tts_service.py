@@ -1,42 +1,105 @@
-import google.genai as genai
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, TYPE_CHECKING
 from config import settings
+from services.segment_cache import SegmentCache
+from services.audio_cache import hot_audio_cache
+from services.audio_store import audio_store
+from services.metrics import track_upstream
+from services.usage import usage_tracker
+from services.bulkhead import raise_service_error, tts_pool, multi_speaker_pool, audio_processing_pool
+from services.concurrency_limit import tts_limiter, multi_speaker_limiter
+from services import timing
+from services.genai_loader import genai_loader
+from services import audio_processing
+from services.audio_format import AudioBuffer, extract_audio_data, build_wav_bytes
+from services.text_splitter import split_sentences, split_dialogue_turns, group_dialogue_turns
 import logging
+import threading
 import asyncio
 import os
 import hashlib
-import base64
-import wave
+
+# google-genai 在后台线程中加载，这里只为类型注解导入
+if TYPE_CHECKING:
+    from google.genai import types
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class GeminiTTSService:
     """Gemini 原生 TTS 服务 - 使用新的 google-genai API"""
     
+    # 根据Gemini API文档，音频输出为24kHz, 16-bit, mono
+    SAMPLE_RATE = 24000
+    SAMPLE_WIDTH = 2  # 16-bit = 2 bytes
+    CHANNELS = 1  # mono
+    
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
         self.model_name = "gemini-2.5-flash-preview-tts"
         self.output_dir = settings.AUDIO_OUTPUT_DIR
-        self.client = None
+        self._client = None
+        self._client_initialized = False
+        self._client_lock = threading.Lock()
+        genai_loader.register(self)
+        self._cleanup_running = False
         
-        if self.api_key:
-            self._initialize_client()
-        else:
+        if not self.api_key:
             logger.warning("Gemini API Key 未配置")
         
-        # 确保输出目录存在
+        # 分段合成结果的 PCM 片段缓存
+        self.segment_cache = SegmentCache(settings.SEGMENT_CACHE_DIR)
+    
+    def prepare(self):
+        """创建音频输出和片段缓存目录（在应用启动时调用，不在导入时产生文件系统副作用）"""
         os.makedirs(self.output_dir, exist_ok=True)
+        self.segment_cache.prepare()
+    
+    @property
+    def client(self):
+        """Gemini 客户端，首次使用时创建（延迟导入 google.genai，见 GeminiService.client）"""
+        if not self._client_initialized:
+            with self._client_lock:
+                if not self._client_initialized:
+                    if self.api_key:
+                        self._initialize_client()
+                    # 创建失败时保持未初始化，之后的调用重新尝试
+                    self._client_initialized = self._client is not None or not self.api_key
+        return self._client
+    
+    def warm_up(self) -> bool:
+        """导入 SDK 并创建客户端（阻塞操作，在后台线程中调用）"""
+        return self.client is not None
+    
+    async def ready_client(self):
+        """
+        在事件循环中获取客户端：等待后台线程导入 SDK 并创建客户端，不在事件循环中导入或创建
+        
+        Raises:
+            Exception: 未配置 API Key 或客户端创建失败
+        """
+        await genai_loader.ready()
+        if self._client is None:
+            raise Exception("Gemini TTS 客户端未初始化，请检查 API Key 配置")
+        return self._client
+    
+    def _http_options(self) -> Optional["types.HttpOptions"]:
+        """配置了 GEMINI_API_BASE_URL 时使用自定义 API 地址"""
+        from google.genai import types
+        
+        if not settings.GEMINI_API_BASE_URL:
+            return None
+        return types.HttpOptions(base_url=settings.GEMINI_API_BASE_URL)
     
     def _initialize_client(self):
         """初始化 Gemini 客户端"""
+        import google.genai as genai
+        
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self._client = genai.Client(api_key=self.api_key, http_options=self._http_options())
             logger.info(f"Gemini TTS 客户端初始化成功，使用模型: {self.model_name}")
         except Exception as e:
             logger.error(f"Gemini TTS 客户端初始化失败: {str(e)}")
-            self.client = None
+            self._client = None
             # 不要抛出异常，允许服务启动但返回错误信息
     
     def _generate_filename(self, text: str, voice_name: str, language: str = None) -> str:
@@ -45,12 +108,107 @@ class GeminiTTSService:
         hash_object = hashlib.md5(content.encode())
         return f"gemini_{hash_object.hexdigest()}.wav"
     
+    async def _check_cache(self, filename: str, filepath: str) -> bool:
+        """查询音频缓存：先查内存热点层，再查磁盘，并记录各层命中情况"""
+        if await hot_audio_cache.lookup(filename, filepath) is not None:
+            return True
+        with timing.stage("cache_lookup"):
+            exists = await audio_store.exists(filepath)
+        if exists:
+            self._record_disk_hit(filename, filepath)
+            return True
+        hot_audio_cache.record_miss()
+        return False
+    
+    def _record_disk_hit(self, filename: str, filepath: str):
+        """记录磁盘缓存命中，访问频率达到阈值时在后台提升到内存热点层"""
+        if hot_audio_cache.record_disk_hit(filename):
+            audio_store.submit(hot_audio_cache.promote, filename, filepath)
+    
+    def _speech_filename(
+        self,
+        text: str,
+        voice_name: str,
+        language: Optional[str],
+        segmented: bool,
+        processing: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        单说话人语音的缓存文件名
+        
+        按句拼接和后处理后的结果与整段原始合成不同，缓存键中包含完整的参数组合。
+        """
+        variant = f"{voice_name}_segmented" if segmented else voice_name
+        suffix = audio_processing.processing_cache_suffix(processing) if processing else ""
+        if suffix:
+            variant = f"{variant}_{suffix}"
+        return self._generate_filename(text, variant, language)
+    
+    def _resolve_processing(
+        self,
+        slow: bool,
+        speed: Optional[float],
+        trim_silence: Optional[bool],
+        normalize: Optional[bool]
+    ) -> Dict[str, Any]:
+        """合并请求参数与默认配置，得到音频后处理参数"""
+        return audio_processing.resolve_processing_options(
+            slow=slow,
+            speed=speed,
+            trim=trim_silence,
+            normalize=normalize,
+            slow_speed=settings.TTS_SLOW_SPEED,
+            trim_default=settings.TTS_TRIM_SILENCE_DEFAULT,
+            normalize_default=settings.TTS_NORMALIZE_DEFAULT
+        )
+    
+    def cached_speech_path(
+        self,
+        text: str,
+        voice_name: str = "Kore",
+        language: Optional[str] = None,
+        segmented: Optional[bool] = None,
+        slow: bool = False,
+        speed: Optional[float] = None,
+        trim_silence: Optional[bool] = None,
+        normalize: Optional[bool] = None
+    ) -> str:
+        """
+        generate_speech 使用相同参数时的缓存文件路径
+        
+        与 generate_speech 一样合并默认配置和后处理参数，开启了默认裁剪或归一化时也能找到同一个文件。
+        """
+        if segmented is None:
+            segmented = settings.TTS_SEGMENTED_DEFAULT
+        processing = self._resolve_processing(slow, speed, trim_silence, normalize)
+        filename = self._speech_filename(text, voice_name, language, segmented, processing)
+        return os.path.join(self.output_dir, filename)
+    
+    async def _post_process(self, pcm_data: AudioBuffer, processing: Dict[str, Any]) -> AudioBuffer:
+        """在线程池中对 PCM 数据执行静音裁剪、响度归一化和变速"""
+        if not audio_processing.processing_cache_suffix(processing):
+            return pcm_data
+        with timing.stage("post_process"):
+            return await audio_processing_pool.run(
+                lambda: audio_processing.process_pcm(
+                    pcm_data,
+                    self.SAMPLE_RATE,
+                    trim=processing["trim"],
+                    normalize=processing["normalize"],
+                    speed=processing["speed"]
+                )
+            )
+    
     async def generate_speech(
         self, 
         text: str, 
         voice_name: str = "Kore",
         language: Optional[str] = None,
-        slow: bool = False
+        slow: bool = False,
+        segmented: Optional[bool] = None,
+        speed: Optional[float] = None,
+        trim_silence: Optional[bool] = None,
+        normalize: Optional[bool] = None
     ) -> str:
         """
         使用 Gemini TTS 生成语音文件
@@ -59,52 +217,206 @@ class GeminiTTSService:
             text: 要转换的文本
             voice_name: 声音名称 (默认: Kore)
             language: 语言代码 (可选，模型会自动检测)
-            slow: 是否使用慢速语音（暂不支持）
+            slow: 是否使用慢速语音（未指定 speed 时使用 TTS_SLOW_SPEED 倍速）
+            segmented: 是否按句子分段缓存并拼接，None 时使用 TTS_SEGMENTED_DEFAULT 配置
+            speed: 语速倍率，小于 1 为慢速
+            trim_silence: 是否去除首尾静音，None 时使用 TTS_TRIM_SILENCE_DEFAULT 配置
+            normalize: 是否进行响度归一化，None 时使用 TTS_NORMALIZE_DEFAULT 配置
             
         Returns:
             生成的音频文件路径
         """
-        if not self.client:
-            raise Exception("Gemini TTS 客户端未初始化，请检查 API Key 配置")
+        await self.ready_client()
         
         try:
             if not text.strip():
                 raise ValueError("文本内容不能为空")
             
-            # 生成文件名
-            filename = self._generate_filename(text, voice_name, language)
-            filepath = os.path.join(self.output_dir, filename)
+            if segmented is None:
+                segmented = settings.TTS_SEGMENTED_DEFAULT
+            
+            processing = self._resolve_processing(slow, speed, trim_silence, normalize)
+            
+            # 生成文件名（与 cached_speech_path 一致）
+            filepath = self.cached_speech_path(
+                text, voice_name, language, segmented, slow, speed, trim_silence, normalize
+            )
+            filename = os.path.basename(filepath)
             
             # 如果文件已存在，直接返回路径
-            if os.path.exists(filepath):
-                logger.info(f"使用缓存的音频文件: {filename}")
+            if await self._check_cache(filename, filepath):
+                logger.info("使用缓存的音频文件: %s", filename)
                 return filepath
             
-            # 在线程池中执行 TTS 操作，添加超时保护
-            loop = asyncio.get_event_loop()
-            audio_data = await asyncio.wait_for(
-                loop.run_in_executor(
-                    None, 
-                    self._generate_audio, 
-                    text, voice_name
-                ),
-                timeout=30.0  # 30秒超时
-            )
+            audio_data = await self._synthesize_text_pcm(text, voice_name, language, segmented)
+            audio_data = await self._post_process(audio_data, processing)
             
             # 保存音频文件
-            self._save_pcm_as_wav(audio_data, filepath)
+            await self._save_pcm_as_wav(audio_data, filepath)
             
-            logger.info(f"成功生成音频文件: {filename}")
+            logger.info("成功生成音频文件: %s", filename)
             return filepath
             
         except asyncio.TimeoutError:
             logger.error("Gemini TTS 请求超时（30秒）")
             raise Exception("Gemini TTS 请求超时，请稍后重试")
         except Exception as e:
-            logger.error(f"Gemini TTS 语音合成失败: {str(e)}")
-            raise Exception(f"Gemini TTS 语音合成失败: {str(e)}")
+            raise_service_error(e, "Gemini TTS 语音合成失败", logger)
+    
+    async def generate_speech_bytes(
+        self,
+        text: str,
+        voice_name: str = "Kore",
+        language: Optional[str] = None,
+        slow: bool = False,
+        segmented: Optional[bool] = None,
+        speed: Optional[float] = None,
+        trim_silence: Optional[bool] = None,
+        normalize: Optional[bool] = None
+    ) -> Tuple[bytes, str, bool]:
+        """
+        使用 Gemini TTS 生成语音，直接返回内存中的 WAV 数据（不落盘）
+        
+        Args:
+            text: 要转换的文本
+            voice_name: 声音名称 (默认: Kore)
+            language: 语言代码 (可选，模型会自动检测)
+            slow: 是否使用慢速语音（未指定 speed 时使用 TTS_SLOW_SPEED 倍速）
+            segmented: 是否按句子分段缓存并拼接，None 时使用 TTS_SEGMENTED_DEFAULT 配置
+            speed: 语速倍率，小于 1 为慢速
+            trim_silence: 是否去除首尾静音，None 时使用 TTS_TRIM_SILENCE_DEFAULT 配置
+            normalize: 是否进行响度归一化，None 时使用 TTS_NORMALIZE_DEFAULT 配置
+            
+        Returns:
+            (WAV 数据, 缓存文件名, 是否命中缓存)，未命中缓存时可调用 save_wav_to_cache 写入缓存
+        """
+        await self.ready_client()
+        
+        try:
+            if not text.strip():
+                raise ValueError("文本内容不能为空")
+            
+            if segmented is None:
+                segmented = settings.TTS_SEGMENTED_DEFAULT
+            
+            processing = self._resolve_processing(slow, speed, trim_silence, normalize)
+            
+            filename = self._speech_filename(text, voice_name, language, segmented, processing)
+            filepath = os.path.join(self.output_dir, filename)
+            
+            # 命中内存热点层时直接返回
+            hot_entry = await hot_audio_cache.lookup(filename, filepath)
+            if hot_entry is not None:
+                return hot_entry.read(), filename, True
+            
+            # 命中磁盘缓存时读取文件内容（直接读取，文件不存在即视为未命中）
+            try:
+                with timing.stage("cache_lookup"):
+                    wav_data = await audio_store.read(filepath)
+                self._record_disk_hit(filename, filepath)
+                logger.info("使用缓存的音频文件: %s", filename)
+                return wav_data, filename, True
+            except FileNotFoundError:
+                pass
+            hot_audio_cache.record_miss()
+            
+            audio_data = await self._synthesize_text_pcm(text, voice_name, language, segmented)
+            audio_data = await self._post_process(audio_data, processing)
+            with timing.stage("wav_encode"):
+                wav_data = self._build_wav_bytes(audio_data)
+            
+            logger.info("成功生成内存音频数据: %s, 大小: %d 字节", filename, len(wav_data))
+            return wav_data, filename, False
+            
+        except asyncio.TimeoutError:
+            logger.error("Gemini TTS 请求超时（30秒）")
+            raise Exception("Gemini TTS 请求超时，请稍后重试")
+        except Exception as e:
+            raise_service_error(e, "Gemini TTS 语音合成失败", logger)
+    
+    async def _synthesize_pcm(self, text: str, voice_name: str) -> AudioBuffer:
+        """在线程池中执行单说话人 TTS 操作，带超时保护"""
+        async with tts_limiter.acquire():
+            # 线程池已满时直接抛出 BulkheadFullError，不计入上游调用
+            future = tts_pool.run(self._generate_audio, text, voice_name)
+            with track_upstream(self.model_name, "tts"):
+                return await asyncio.wait_for(future, timeout=30.0)  # 30秒超时
+    
+    async def _synthesize_text_pcm(
+        self,
+        text: str,
+        voice_name: str,
+        language: Optional[str],
+        segmented: bool
+    ) -> AudioBuffer:
+        """合成单说话人文本的 PCM 数据，segmented 为 True 时按句子使用片段缓存"""
+        if segmented:
+            sentences = split_sentences(text)
+            if len(sentences) > 1:
+                return await self._synthesize_sentence_segments(sentences, voice_name, language)
+        return await self._synthesize_pcm(text, voice_name)
+    
+    async def _synthesize_sentence_segments(
+        self,
+        sentences: List[str],
+        voice_name: str,
+        language: Optional[str]
+    ) -> bytes:
+        """
+        按句子从片段缓存组装音频，仅对缺失的句子调用上游合成
+        
+        适用于由固定句式组合而成的文本（如通知、IVR 话术），
+        修改其中一个句子时其余句子直接复用缓存。
+        """
+        segments = [
+            (
+                self.segment_cache.make_key("sentence", sentence, voice_name, language or "auto"),
+                lambda sentence=sentence: self._synthesize_pcm(sentence, voice_name)
+            )
+            for sentence in sentences
+        ]
+        
+        gap_frames = int(self.SAMPLE_RATE * settings.TTS_SEGMENT_GAP_MS / 1000)
+        separator = b"\x00" * (gap_frames * self.SAMPLE_WIDTH * self.CHANNELS)
+        pcm_data, cached_count = await self._assemble_segments(
+            segments, settings.TTS_SEGMENT_CONCURRENCY, separator
+        )
+        logger.info("按句拼接语音完成: 共 %d 句，命中缓存 %d 句", len(sentences), cached_count)
+        return pcm_data
+    
+    async def _assemble_segments(
+        self,
+        segments: List[Tuple[str, Callable[[], Awaitable[bytes]]]],
+        concurrency: int,
+        separator: bytes = b""
+    ) -> Tuple[bytes, int]:
+        """
+        按顺序拼接 PCM 片段：命中片段缓存的直接读取，缺失的片段并行合成后写入缓存
+        
+        Args:
+            segments: (缓存键, 合成函数) 列表
+            concurrency: 同时进行的上游合成数量上限
+            separator: 片段之间插入的数据（如静音）
+            
+        Returns:
+            (拼接后的 PCM 数据, 命中缓存的片段数)
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def load_segment(key: str, synthesize: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, bool]:
+            cached = await audio_store.run(self.segment_cache.get, key)
+            if cached is not None:
+                return cached, True
+            async with semaphore:
+                pcm_data = await synthesize()
+            await audio_store.run(self.segment_cache.put, key, pcm_data)
+            return pcm_data, False
+        
+        results = await asyncio.gather(*(load_segment(key, synthesize) for key, synthesize in segments))
+        cached_count = sum(1 for _, from_cache in results if from_cache)
+        return separator.join(pcm_data for pcm_data, _ in results), cached_count
     
-    def _generate_audio(self, text: str, voice_name: str) -> bytes:
+    def _generate_audio(self, text: str, voice_name: str) -> AudioBuffer:
         """在线程中生成音频"""
         try:
             # 验证输入参数
@@ -114,7 +426,7 @@ class GeminiTTSService:
             if voice_name not in self.get_supported_voices():
                 logger.warning(f"声音 {voice_name} 可能不受支持，将尝试使用")
             
-            logger.info(f"开始生成语音: {text[:50]}... (声音: {voice_name})")
+            logger.debug("开始生成语音: %.50s... (声音: %s)", text, voice_name)
             
             # 使用统一的单说话人音频生成方法
             return self._generate_single_speaker_audio(text, voice_name)
@@ -126,7 +438,8 @@ class GeminiTTSService:
     async def generate_multi_speaker_speech(
         self,
         text: str,
-        speaker_configs: List[Dict[str, str]]
+        speaker_configs: List[Dict[str, str]],
+        chunked: Optional[bool] = None
     ) -> str:
         """
         生成多说话人语音
@@ -134,52 +447,99 @@ class GeminiTTSService:
         Args:
             text: 包含说话人标记的文本
             speaker_configs: 说话人配置列表，格式: [{"speaker": "Joe", "voice_name": "Kore"}]
+            chunked: 是否按说话人轮次分段并行合成；None 表示文本超过分段长度时自动分段
             
         Returns:
             生成的音频文件路径
         """
-        if not self.client:
-            raise Exception("Gemini TTS 客户端未初始化，请检查 API Key 配置")
+        await self.ready_client()
         
         try:
             if not text.strip():
                 raise ValueError("文本内容不能为空")
             
-            # 生成文件名
             speakers_str = "_".join([f"{config['speaker']}_{config['voice_name']}" for config in speaker_configs])
-            filename = self._generate_filename(text, speakers_str)
+            
+            turns = split_dialogue_turns(text, [config["speaker"] for config in speaker_configs])
+            if chunked is None:
+                chunked = turns is not None and len(text) > settings.MULTI_SPEAKER_CHUNK_CHARS
+            elif chunked and turns is None:
+                raise ValueError("无法按说话人标记拆分对话文本，请确认每段台词都以 \"说话人: \" 开头")
+            
+            if not chunked and len(text) > settings.MULTI_SPEAKER_MAX_SINGLE_CHARS:
+                raise ValueError(f"单次合成文本不能超过 {settings.MULTI_SPEAKER_MAX_SINGLE_CHARS} 字符，请使用分段合成")
+            
+            # 生成文件名（分段合成的结果与整段合成不同，使用不同的缓存键）
+            filename = self._generate_filename(text, f"{speakers_str}_chunked" if chunked else speakers_str)
             filepath = os.path.join(self.output_dir, filename)
             
             # 如果文件已存在，直接返回路径
-            if os.path.exists(filepath):
-                logger.info(f"使用缓存的多说话人音频文件: {filename}")
+            if await self._check_cache(filename, filepath):
+                logger.info("使用缓存的多说话人音频文件: %s", filename)
                 return filepath
             
-            # 在线程池中执行多说话人 TTS 操作，添加超时保护
-            loop = asyncio.get_event_loop()
-            audio_data = await asyncio.wait_for(
-                loop.run_in_executor(
-                    None, 
-                    self._generate_multi_speaker_audio, 
-                    text, speaker_configs
-                ),
-                timeout=30.0  # 30秒超时
-            )
+            if chunked:
+                audio_data = await self._synthesize_dialogue_chunks(turns, speaker_configs, speakers_str)
+            else:
+                audio_data = await self._synthesize_multi_speaker_pcm(text, speaker_configs)
             
             # 保存音频文件
-            self._save_pcm_as_wav(audio_data, filepath)
+            await self._save_pcm_as_wav(audio_data, filepath)
             
-            logger.info(f"成功生成多说话人音频文件: {filename}")
+            logger.info("成功生成多说话人音频文件: %s", filename)
             return filepath
             
         except asyncio.TimeoutError:
             logger.error("Gemini TTS 多说话人请求超时（30秒）")
             raise Exception("Gemini TTS 多说话人请求超时，请稍后重试")
         except Exception as e:
-            logger.error(f"Gemini TTS 多说话人语音合成失败: {str(e)}")
-            raise Exception(f"Gemini TTS 多说话人语音合成失败: {str(e)}")
+            raise_service_error(e, "Gemini TTS 多说话人语音合成失败", logger)
+    
+    async def _synthesize_multi_speaker_pcm(self, text: str, speaker_configs: List[Dict[str, str]]) -> AudioBuffer:
+        """在线程池中执行多说话人 TTS 操作，带超时保护"""
+        async with multi_speaker_limiter.acquire():
+            # 线程池已满时直接抛出 BulkheadFullError，不计入上游调用
+            future = multi_speaker_pool.run(self._generate_multi_speaker_audio, text, speaker_configs)
+            with track_upstream(self.model_name, "multi_speaker_tts"):
+                return await asyncio.wait_for(future, timeout=30.0)  # 30秒超时
     
-    def _generate_multi_speaker_audio(self, text: str, speaker_configs: List[Dict[str, str]]) -> bytes:
+    async def _synthesize_dialogue_chunks(
+        self,
+        turns: List[Tuple[str, str]],
+        speaker_configs: List[Dict[str, str]],
+        speakers_str: str
+    ) -> bytes:
+        """
+        将对话按轮次分组后并行合成，再按顺序拼接 PCM
+        
+        每个分组单独缓存，修改脚本中的一句台词只需重新合成所在分组。
+        """
+        chunks = group_dialogue_turns(
+            turns,
+            max_chars=settings.MULTI_SPEAKER_CHUNK_CHARS,
+            max_turns=settings.MULTI_SPEAKER_CHUNK_MAX_TURNS
+        )
+        # 超长台词已按句拆分，只有单句超长时才会超过单次合成的上限
+        longest = max(len(chunk_text) for chunk_text in chunks)
+        if longest > settings.MULTI_SPEAKER_MAX_SINGLE_CHARS:
+            raise ValueError(
+                f"单句台词 ({longest} 字符) 超过单次合成上限 {settings.MULTI_SPEAKER_MAX_SINGLE_CHARS} 字符，请拆分后重试"
+            )
+        segments = [
+            (
+                self.segment_cache.make_key("dialogue", chunk_text, speakers_str),
+                lambda chunk_text=chunk_text: self._synthesize_multi_speaker_pcm(chunk_text, speaker_configs)
+            )
+            for chunk_text in chunks
+        ]
+        
+        pcm_data, cached_count = await self._assemble_segments(
+            segments, settings.MULTI_SPEAKER_CHUNK_CONCURRENCY
+        )
+        logger.info("多说话人分段合成完成: 共 %d 段，命中缓存 %d 段", len(chunks), cached_count)
+        return pcm_data
+    
+    def _generate_multi_speaker_audio(self, text: str, speaker_configs: List[Dict[str, str]]) -> AudioBuffer:
         """在线程中生成多说话人音频"""
         try:
             # 使用新版本 google-genai 的多说话人TTS功能
@@ -188,7 +548,11 @@ class GeminiTTSService:
                 SpeakerVoiceConfig, VoiceConfig, PrebuiltVoiceConfig
             )
             
-            logger.info(f"开始生成多说话人语音: {text[:50]}... (说话人数: {len(speaker_configs)})")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "开始生成多说话人语音: %.50s... (说话人: %s)",
+                    text, ", ".join(f"{config['speaker']}->{config['voice_name']}" for config in speaker_configs)
+                )
             
             # 构建说话人配置
             speaker_voice_configs = []
@@ -202,7 +566,6 @@ class GeminiTTSService:
                     )
                 )
                 speaker_voice_configs.append(speaker_voice_config)
-                logger.info(f"配置说话人: {config['speaker']} -> 声音: {config['voice_name']}")
             
             # 构建多说话人配置
             config = GenerateContentConfig(
@@ -214,99 +577,24 @@ class GeminiTTSService:
                 )
             )
             
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=text,
-                config=config
-            )
+            with timing.stage("tts"):
+                response = self.client.models.generate_content(
+                    model=self.model_name,
+                    contents=text,
+                    config=config
+                )
             
-            # 验证响应
-            if not response:
-                raise Exception("Gemini API 返回空响应")
-            
-            # 检查是否有直接的音频数据
-            if hasattr(response, 'audio') and response.audio:
-                try:
-                    if hasattr(response.audio, 'data'):
-                        # 如果音频数据是直接的bytes
-                        if isinstance(response.audio.data, bytes):
-                            logger.info(f"获取到多说话人音频数据，大小: {len(response.audio.data)} 字节")
-                            return response.audio.data
-                        # 如果音频数据是base64字符串
-                        elif isinstance(response.audio.data, str):
-                            audio_data = base64.b64decode(response.audio.data)
-                            logger.info(f"解码base64多说话人音频数据，大小: {len(audio_data)} 字节")
-                            return audio_data
-                except Exception as e:
-                    logger.error(f"处理直接多说话人音频数据失败: {str(e)}")
-            
-            # 检查candidates结构
-            if not response.candidates or len(response.candidates) == 0:
-                raise Exception("Gemini API 未返回候选结果")
-            
-            candidate = response.candidates[0]
-            if not candidate.content or not candidate.content.parts:
-                raise Exception("响应中缺少内容部分")
-            
-            # 遍历所有parts寻找音频数据
-            for part in candidate.content.parts:
-                # 检查不同的可能属性名
-                for attr_name in ['inline_data', 'inlineData', 'data', 'audio_data', 'audioData']:
-                    if hasattr(part, attr_name):
-                        attr_value = getattr(part, attr_name)
-                        
-                        if attr_value:
-                            # 如果是对象，检查其data属性
-                            if hasattr(attr_value, 'data') and attr_value.data:
-                                try:
-                                    if isinstance(attr_value.data, bytes):
-                                        logger.info(f"获取到多说话人音频数据，大小: {len(attr_value.data)} 字节")
-                                        return attr_value.data
-                                    elif isinstance(attr_value.data, str):
-                                        audio_data = base64.b64decode(attr_value.data)
-                                        logger.info(f"解码base64多说话人音频数据，大小: {len(audio_data)} 字节")
-                                        return audio_data
-                                except Exception as decode_error:
-                                    logger.error(f"解码多说话人音频数据失败: {str(decode_error)}")
-                            
-                            # 如果直接是bytes或字符串
-                            elif isinstance(attr_value, bytes):
-                                logger.info(f"获取到多说话人音频数据，大小: {len(attr_value)} 字节")
-                                return attr_value
-                            elif isinstance(attr_value, str):
-                                try:
-                                    audio_data = base64.b64decode(attr_value)
-                                    logger.info(f"解码base64多说话人音频数据，大小: {len(audio_data)} 字节")
-                                    return audio_data
-                                except Exception as decode_error:
-                                    logger.error(f"解码多说话人音频数据失败: {str(decode_error)}")
-                
-                # 检查part本身是否直接包含音频数据
-                if hasattr(part, 'data') and part.data:
-                    try:
-                        if isinstance(part.data, bytes):
-                            logger.info(f"获取到多说话人音频数据，大小: {len(part.data)} 字节")
-                            return part.data
-                        elif isinstance(part.data, str):
-                            audio_data = base64.b64decode(part.data)
-                            logger.info(f"解码base64多说话人音频数据，大小: {len(audio_data)} 字节")
-                            return audio_data
-                    except Exception as decode_error:
-                        logger.error(f"解码多说话人音频数据失败: {str(decode_error)}")
-            
-            # 如果都没找到，抛出详细错误
-            error_msg = "多说话人响应中未找到音频数据"
-            if response.candidates and response.candidates[0].content:
-                error_msg += f"，Parts数量: {len(response.candidates[0].content.parts)}"
-            
-            logger.error(error_msg)
-            raise Exception(error_msg)
+            with timing.stage("decode"):
+                audio_data = extract_audio_data(response)
+            self._record_usage("multi_speaker_tts", response, text, audio_data)
+            logger.debug("获取到多说话人音频数据，大小: %d 字节", len(audio_data))
+            return audio_data
             
         except Exception as e:
             logger.error(f"Gemini TTS 多说话人 API 错误: {str(e)}")
             raise e
     
-    def _generate_single_speaker_audio(self, text: str, voice_name: str) -> bytes:
+    def _generate_single_speaker_audio(self, text: str, voice_name: str) -> AudioBuffer:
         """生成单说话人音频的内部方法"""
         from google.genai.types import GenerateContentConfig, SpeechConfig, VoiceConfig, PrebuiltVoiceConfig
         
@@ -321,93 +609,28 @@ class GeminiTTSService:
             )
         )
         
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=text,
-            config=config
-        )
-        
-        # 验证响应
-        if not response:
-            raise Exception("Gemini API 返回空响应")
-        
-        # 检查是否有直接的音频数据
-        if hasattr(response, 'audio') and response.audio:
-            try:
-                if hasattr(response.audio, 'data'):
-                    # 如果音频数据是直接的bytes
-                    if isinstance(response.audio.data, bytes):
-                        logger.info(f"获取到音频数据，大小: {len(response.audio.data)} 字节")
-                        return response.audio.data
-                    # 如果音频数据是base64字符串
-                    elif isinstance(response.audio.data, str):
-                        audio_data = base64.b64decode(response.audio.data)
-                        logger.info(f"解码base64音频数据，大小: {len(audio_data)} 字节")
-                        return audio_data
-            except Exception as e:
-                logger.error(f"处理直接音频数据失败: {str(e)}")
-        
-        # 检查candidates结构
-        if not response.candidates or len(response.candidates) == 0:
-            raise Exception("Gemini API 未返回候选结果")
-        
-        candidate = response.candidates[0]
-        if not candidate.content or not candidate.content.parts:
-            raise Exception("响应中缺少内容部分")
-        
-        # 遍历所有parts寻找音频数据
-        for part in candidate.content.parts:
-            # 检查不同的可能属性名
-            for attr_name in ['inline_data', 'inlineData', 'data', 'audio_data', 'audioData']:
-                if hasattr(part, attr_name):
-                    attr_value = getattr(part, attr_name)
-                    
-                    if attr_value:
-                        # 如果是对象，检查其data属性
-                        if hasattr(attr_value, 'data') and attr_value.data:
-                            try:
-                                if isinstance(attr_value.data, bytes):
-                                    logger.info(f"获取到音频数据，大小: {len(attr_value.data)} 字节")
-                                    return attr_value.data
-                                elif isinstance(attr_value.data, str):
-                                    audio_data = base64.b64decode(attr_value.data)
-                                    logger.info(f"解码base64音频数据，大小: {len(audio_data)} 字节")
-                                    return audio_data
-                            except Exception as decode_error:
-                                logger.error(f"解码音频数据失败: {str(decode_error)}")
-                        
-                        # 如果直接是bytes或字符串
-                        elif isinstance(attr_value, bytes):
-                            logger.info(f"获取到音频数据，大小: {len(attr_value)} 字节")
-                            return attr_value
-                        elif isinstance(attr_value, str):
-                            try:
-                                audio_data = base64.b64decode(attr_value)
-                                logger.info(f"解码base64音频数据，大小: {len(audio_data)} 字节")
-                                return audio_data
-                            except Exception as decode_error:
-                                logger.error(f"解码音频数据失败: {str(decode_error)}")
-            
-            # 检查part本身是否直接包含音频数据
-            if hasattr(part, 'data') and part.data:
-                try:
-                    if isinstance(part.data, bytes):
-                        logger.info(f"获取到音频数据，大小: {len(part.data)} 字节")
-                        return part.data
-                    elif isinstance(part.data, str):
-                        audio_data = base64.b64decode(part.data)
-                        logger.info(f"解码base64音频数据，大小: {len(audio_data)} 字节")
-                        return audio_data
-                except Exception as decode_error:
-                    logger.error(f"解码音频数据失败: {str(decode_error)}")
-        
-        # 如果都没找到，抛出详细错误
-        error_msg = "响应中未找到音频数据"
-        if response.candidates and response.candidates[0].content:
-            error_msg += f"，Parts数量: {len(response.candidates[0].content.parts)}"
+        with timing.stage("tts"):
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=text,
+                config=config
+            )
         
-        logger.error(error_msg)
-        raise Exception(error_msg)
+        with timing.stage("decode"):
+            audio_data = extract_audio_data(response)
+        self._record_usage("tts", response, text, audio_data)
+        logger.debug("获取到音频数据，大小: %d 字节", len(audio_data))
+        return audio_data
+    
+    def _record_usage(self, operation: str, response: Any, text: str, audio_data: AudioBuffer):
+        """记录一次合成的 token、字符数和音频时长"""
+        usage_tracker.record(
+            self.model_name,
+            operation,
+            getattr(response, "usage_metadata", None),
+            characters=len(text),
+            audio_seconds=len(audio_data) / (self.SAMPLE_RATE * self.SAMPLE_WIDTH * self.CHANNELS)
+        )
     
     def get_supported_voices(self) -> List[str]:
         """获取支持的声音列表"""
@@ -428,8 +651,22 @@ class GeminiTTSService:
             "en-IN", "mr-IN", "ta-IN", "te-IN", "de-DE", "es-US"
         ]
     
-    def cleanup_old_files(self, max_files: int = 100):
-        """清理旧的音频文件，保留最新的指定数量文件"""
+    async def cleanup_old_files(self, max_files: int = 100):
+        """
+        清理旧的音频文件，保留最新的指定数量文件
+        
+        每个请求都会调度清理任务，已有清理在进行时直接跳过，避免并发重复扫描目录。
+        """
+        if self._cleanup_running:
+            return
+        self._cleanup_running = True
+        try:
+            await audio_store.run(self._cleanup_old_files_sync, max_files)
+        finally:
+            self._cleanup_running = False
+    
+    def _cleanup_old_files_sync(self, max_files: int):
+        """清理旧文件（阻塞操作，在 I/O 线程池中执行）"""
         try:
             files = []
             for filename in os.listdir(self.output_dir):
@@ -445,28 +682,40 @@ class GeminiTTSService:
                 for filepath, _ in files[max_files:]:
                     try:
                         os.remove(filepath)
+                        hot_audio_cache.discard(os.path.basename(filepath))
                         logger.info(f"删除旧文件: {filepath}")
                     except Exception as e:
                         logger.warning(f"删除文件失败 {filepath}: {str(e)}")
+            
+            self.segment_cache.cleanup(settings.SEGMENT_CACHE_MAX_FILES)
                         
         except Exception as e:
             logger.error(f"清理文件失败: {str(e)}")
 
-    def _save_pcm_as_wav(self, pcm_data: bytes, wav_file: str):
-        """将PCM数据保存为WAV文件"""
+    def _build_wav_bytes(self, pcm_data: AudioBuffer) -> bytes:
+        """将PCM数据封装为内存中的WAV数据"""
+        return build_wav_bytes(pcm_data, self.CHANNELS, self.SAMPLE_WIDTH, self.SAMPLE_RATE)
+    
+    async def save_wav_to_cache(self, wav_data: bytes, filename: str):
+        """
+        将内存中的WAV数据写入音频缓存（供后台任务延迟写入）
+        
+        先写入临时文件再原子替换，避免其他请求读到写了一半的文件。
+        """
+        filepath = os.path.join(self.output_dir, filename)
         try:
-            # 根据Gemini API文档，音频输出为24kHz, 16-bit, mono
-            sample_rate = 24000
-            sample_width = 2  # 16-bit = 2 bytes
-            channels = 1  # mono
-            
-            with wave.open(wav_file, 'wb') as wav_f:
-                wav_f.setnchannels(channels)
-                wav_f.setsampwidth(sample_width)
-                wav_f.setframerate(sample_rate)
-                wav_f.writeframes(pcm_data)
-            
-            logger.info(f"成功保存PCM数据为WAV文件: {wav_file}, 大小: {len(pcm_data)} 字节")
+            await audio_store.write(filepath, wav_data)
+            logger.info("音频已写入缓存: %s", filename)
+        except Exception as e:
+            logger.warning(f"写入音频缓存失败 {filename}: {str(e)}")
+    
+    async def _save_pcm_as_wav(self, pcm_data: AudioBuffer, wav_file: str):
+        """将PCM数据原子保存为WAV文件"""
+        try:
+            with timing.stage("wav_write"):
+                await audio_store.write_wav(wav_file, pcm_data, self.CHANNELS, self.SAMPLE_WIDTH, self.SAMPLE_RATE)
+            
+            logger.debug("成功保存PCM数据为WAV文件: %s, 大小: %d 字节", wav_file, len(pcm_data))
         except Exception as e:
             logger.error(f"保存PCM数据为WAV文件失败: {str(e)}")
             raise e
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Optional, List, Any
+
+logger = logging.getLogger(__name__)
+
+
+class GenaiLoader:
+    """
+    Gemini SDK 的后台加载
+
+    google.genai 的导入耗时约占应用导入时间的一半，延迟到 worker 启动之后。导入 SDK 和创建各服务的
+    客户端在同一次线程池调用中完成，事件循环只等待其结果，不会在导入或创建客户端时被阻塞，
+    也不会有多个线程同时导入同一个模块。创建失败时下一次等待会重新尝试。
+    """
+
+    def __init__(self):
+        self._services: List[Any] = []
+        self._future: Optional[asyncio.Future] = None
+
+    def register(self, service):
+        """登记需要创建客户端的服务（提供 warm_up() -> bool）"""
+        self._services.append(service)
+
+    def _load(self) -> bool:
+        import google.genai  # noqa: F401
+        import google.genai.types  # noqa: F401
+
+        ready = True
+        for service in self._services:
+            # 未配置 API Key 的服务不需要重试
+            ready = (service.warm_up() or not service.api_key) and ready
+        return ready
+
+    def _log_result(self, future: asyncio.Future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error(f"加载 Gemini SDK 失败: {str(future.exception())}")
+        elif not future.result():
+            logger.warning("部分 Gemini 客户端未能创建，将在下次调用时重试")
+
+    def _failed(self) -> bool:
+        future = self._future
+        return future.done() and (future.cancelled() or future.exception() is not None or not future.result())
+
+    def start(self) -> asyncio.Future:
+        """开始（或在上次失败后重新）加载，返回共享的 Future"""
+        loop = asyncio.get_running_loop()
+        if self._future is None or self._future.get_loop() is not loop or self._failed():
+            self._future = loop.run_in_executor(None, self._load)
+            self._future.add_done_callback(self._log_result)
+        return self._future
+
+    async def ready(self) -> bool:
+        """
+        等待 SDK 导入和客户端创建完成
+
+        Returns:
+            需要创建的客户端是否都已创建；加载出错时抛出异常
+        """
+        # 等待方被取消时不取消共享的加载任务
+        return await asyncio.shield(self.start())
+
+
+# 创建全局实例
+genai_loader = GenaiLoader()
@@ -0,0 +1,419 @@
+import asyncio
+import fcntl
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Set
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import settings
+from services.audio_store import audio_store, write_file_atomic
+from services.bulkhead import BulkheadFullError
+from services.gemini_service import gemini_service
+from services.gemini_tts_service import gemini_tts_service
+from services.metrics import JOB_QUEUE_DEPTH
+from services import usage
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = ("tts", "multi_speaker_tts", "generate_and_speak")
+FINISHED_STATES = ("succeeded", "failed")
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+
+class CallbackNotAllowedError(ValueError):
+    """回调地址不被允许"""
+
+
+class JobQueue:
+    """
+    异步任务队列
+
+    长时间的 TTS / 生成并转语音请求提交后立即返回任务 ID，由后台 worker 执行，
+    不占用 HTTP 连接和 gunicorn worker 的请求超时。
+    任务状态以 JSON 文件保存在 JOB_DIR 中，多个 worker 进程都能查询到；
+    进程退出时未完成的任务会在下次启动时由其他存活的进程接管重新执行。
+    完成后结果写入现有音频缓存，并可通过 webhook 回调通知调用方。
+    """
+
+    def __init__(self, job_dir: str, workers: int, max_queued: int, webhook_allowed: Optional[List[str]] = None):
+        self.job_dir = job_dir
+        self.workers = workers
+        # 回调地址允许列表：主机名（"." 开头时匹配其子域名）或 URL 前缀
+        self.webhook_allowed = [item.strip() for item in webhook_allowed or [] if item.strip()]
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._worker_tasks: List[asyncio.Task] = []
+        self._busy_tasks: Set[asyncio.Task] = set()
+        self._closing = False
+        self._last_cleanup = 0.0
+
+    def _path_for(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    async def _save(self, job: Dict[str, Any]):
+        job["updated_at"] = time.time()
+        data = json.dumps(job, ensure_ascii=False).encode("utf-8")
+        await audio_store.run(write_file_atomic, self._path_for(job["id"]), data)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态，不存在时返回 None"""
+        if not job_id.isalnum():
+            return None
+        try:
+            data = await audio_store.read(self._path_for(job_id))
+        except FileNotFoundError:
+            return None
+        return json.loads(data)
+
+    async def submit(self, job_type: str, params: Dict[str, Any], callback_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Raises:
+            JobQueueFullError: 排队任务数已达上限
+            CallbackNotAllowedError: 回调地址不被允许
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"不支持的任务类型: {job_type}")
+        if self._closing:
+            raise JobQueueFullError("服务正在重启，请稍后重试")
+        if self._queue.full():
+            raise JobQueueFullError("任务队列已满，请稍后重试")
+        if callback_url:
+            await self.check_callback_url(callback_url)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "type": job_type,
+            "state": "queued",
+            "params": params,
+            "callback_url": callback_url,
+            # 执行时的上游用量记在提交任务的客户端名下
+            "client_id": usage.current_client(),
+            "result": None,
+            "error": None,
+            "owner_pid": os.getpid(),
+            "created_at": time.time()
+        }
+        await self._save(job)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # 保存期间队列被并发提交的任务占满，删除已写入的任务文件
+            await audio_store.run(_remove_job_file, self._path_for(job["id"]))
+            raise JobQueueFullError("任务队列已满，请稍后重试")
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+        logger.info(f"已提交任务 {job['id']} ({job_type})")
+        return job
+
+    def start(self):
+        """启动后台 worker，并接管已退出进程遗留的任务"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        for _ in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+        for job in self._recover_orphaned_jobs():
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                logger.warning(f"任务队列已满，遗留任务 {job['id']} 等待下次启动时接管")
+                break
+
+    async def stop(self):
+        """停止后台 worker，未完成的任务保留在磁盘上由下次启动接管"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+
+    async def drain(self, timeout: float) -> int:
+        """
+        停止领取新任务，等待正在执行的任务完成
+
+        超过 timeout 秒仍未完成的任务被取消；未完成和未开始的任务保留在磁盘上，由下次启动接管。
+
+        Returns:
+            被取消的任务数
+        """
+        self._closing = True
+        busy = list(self._busy_tasks)
+        for task in self._worker_tasks:
+            if task not in self._busy_tasks:
+                task.cancel()
+        cancelled = 0
+        if busy:
+            logger.info(f"等待 {len(busy)} 个正在执行的任务完成")
+            _, pending = await asyncio.wait(busy, timeout=timeout)
+            cancelled = len(pending)
+        await self.stop()
+        return cancelled
+
+    async def _worker(self):
+        task = asyncio.current_task()
+        while not self._closing:
+            job = await self._queue.get()
+            JOB_QUEUE_DEPTH.set(self._queue.qsize())
+            self._busy_tasks.add(task)
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 保存任务状态、回调或清理出错（I/O 线程池已满、磁盘已满等）时不能让 worker 退出，
+                # 否则本进程队列中的任务会一直停留在 queued 状态
+                logger.error(f"任务 {job['id']} 处理出错: {str(e)}")
+                await self._mark_failed(job, e)
+            finally:
+                self._busy_tasks.discard(task)
+                self._queue.task_done()
+
+    async def _mark_failed(self, job: Dict[str, Any], error: Exception):
+        """尽力将出错的任务标记为失败并保存最终状态"""
+        if job.get("state") not in FINISHED_STATES:
+            job["state"] = "failed"
+            job["error"] = str(error)
+            job["finished_at"] = time.time()
+        job["updated_at"] = time.time()
+        try:
+            data = json.dumps(job, ensure_ascii=False).encode("utf-8")
+            # 不检查排队上限：线程池排队已满时也要写入最终状态
+            await asyncio.wrap_future(audio_store.submit(write_file_atomic, self._path_for(job["id"]), data))
+        except Exception as e:
+            logger.error(f"任务 {job['id']} 状态保存失败: {str(e)}")
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job["state"] = "running"
+        job["started_at"] = time.time()
+        await self._save(job)
+        usage.set_client(job.get("client_id"))
+        try:
+            # 重试之间保留已生成的文本，线程池拥塞时不重复调用文本生成
+            progress: Dict[str, Any] = {}
+            delay = 1.0
+            for attempt in range(settings.JOB_BUSY_RETRIES + 1):
+                try:
+                    job["result"] = await self._execute(job["type"], job["params"], progress)
+                    break
+                except BulkheadFullError:
+                    # 线程池或上游并发名额被实时请求占满时退避重试，多次仍拥塞时任务失败
+                    if attempt == settings.JOB_BUSY_RETRIES:
+                        raise
+                    logger.info(f"任务 {job['id']} 遇到拥塞，{delay:.0f} 秒后重试 (第 {attempt + 1} 次)")
+                    await asyncio.sleep(delay)
+                    delay *= 2
+            job["state"] = "succeeded"
+            logger.info(f"任务 {job['id']} 执行成功")
+        except asyncio.CancelledError:
+            # 进程退出，任务保持 running 状态由其他进程接管
+            raise
+        except Exception as e:
+            job["state"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"任务 {job['id']} 执行失败: {str(e)}")
+        job["finished_at"] = time.time()
+        await self._save(job)
+
+        if job.get("callback_url"):
+            await self._send_webhook(job)
+        if time.time() - self._last_cleanup > 600:
+            self._last_cleanup = time.time()
+            await audio_store.run(self._cleanup_finished_jobs)
+
+    async def _execute(self, job_type: str, params: Dict[str, Any], progress: Dict[str, Any]) -> Dict[str, Any]:
+        """执行任务，结果写入音频缓存；progress 保存重试之间可复用的中间结果"""
+        if job_type == "tts":
+            audio_path = await gemini_tts_service.generate_speech(
+                text=params["text"],
+                voice_name=params.get("voice_name") or "Kore",
+                language=params.get("language"),
+                slow=params.get("slow", False),
+                segmented=params.get("segmented"),
+                speed=params.get("speed"),
+                trim_silence=params.get("trim_silence"),
+                normalize=params.get("normalize")
+            )
+            text = None
+        elif job_type == "multi_speaker_tts":
+            audio_path = await gemini_tts_service.generate_multi_speaker_speech(
+                text=params["text"],
+                speaker_configs=params["speaker_configs"],
+                chunked=params.get("chunked")
+            )
+            text = None
+        else:
+            text = progress.get("text")
+            if text is None:
+                text = await gemini_service.generate_text(
+                    prompt=params["prompt"],
+                    max_tokens=params.get("max_tokens"),
+                    temperature=params.get("temperature", 0.7)
+                )
+                progress["text"] = text
+            audio_path = await gemini_tts_service.generate_speech(
+                text=text,
+                voice_name=params.get("voice_name") or "Kore",
+                language=params.get("language")
+            )
+        await gemini_tts_service.cleanup_old_files(100)
+
+        filename = os.path.basename(audio_path)
+        result = {"audio_url": f"/audio/{filename}", "filename": filename}
+        if text is not None:
+            result["text"] = text
+        return result
+
+    def _is_allow_listed(self, url: str, host: str) -> bool:
+        for item in self.webhook_allowed:
+            if "://" in item:
+                # URL 前缀还要求主机名一致，"https://a.com" 不匹配 "https://a.com.evil.net"
+                if url.startswith(item) and urlsplit(item).hostname == host:
+                    return True
+            elif item.startswith("."):
+                if host.endswith(item.lower()):
+                    return True
+            elif host == item.lower():
+                return True
+        return False
+
+    async def check_callback_url(self, url: str):
+        """
+        校验回调地址，防止通过 webhook 访问内网服务 (SSRF)
+
+        配置了允许列表时只接受列表中的地址（可以是内网地址）；未配置时接受任意公网地址，
+        主机名解析到私有、回环、链路本地等非公网 IP 时拒绝。
+
+        Raises:
+            CallbackNotAllowedError: 回调地址不被允许
+        """
+        parsed = urlsplit(url)
+        host = (parsed.hostname or "").lower()
+        if parsed.scheme not in ("http", "https") or not host:
+            raise CallbackNotAllowedError("回调地址必须是 http(s) URL")
+        if self._is_allow_listed(url, host):
+            return
+        if self.webhook_allowed:
+            raise CallbackNotAllowedError(f"回调地址不在允许列表中: {host}")
+
+        try:
+            port = parsed.port or (443 if parsed.scheme == "https" else 80)
+            addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except (socket.gaierror, ValueError):
+            raise CallbackNotAllowedError(f"无法解析回调地址: {host}")
+        for address in addresses:
+            ip = ipaddress.ip_address(address[4][0].split("%")[0])
+            if ip.version == 6 and ip.ipv4_mapped:
+                ip = ip.ipv4_mapped
+            if not ip.is_global:
+                raise CallbackNotAllowedError(f"回调地址指向内网地址: {host} ({ip})")
+
+    async def _send_webhook(self, job: Dict[str, Any]):
+        """将任务结果 POST 到回调地址，失败时按指数退避重试"""
+        # 发送前重新校验：提交后 DNS 解析结果可能已改变，也可能是重启前提交、配置变更后接管的任务
+        try:
+            await self.check_callback_url(job["callback_url"])
+        except CallbackNotAllowedError as e:
+            logger.error(f"任务 {job['id']} 回调地址不被允许，不发送回调: {str(e)}")
+            return
+        payload = {key: job.get(key) for key in ("id", "type", "state", "result", "error", "created_at", "finished_at")}
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if settings.JOB_WEBHOOK_SECRET:
+            signature = hmac.new(settings.JOB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Signature-SHA256"] = signature
+
+        delay = 1.0
+        async with httpx.AsyncClient(timeout=settings.JOB_WEBHOOK_TIMEOUT) as client:
+            for attempt in range(settings.JOB_WEBHOOK_RETRIES):
+                try:
+                    response = await client.post(job["callback_url"], content=body, headers=headers)
+                    if response.status_code < 400:
+                        logger.info(f"任务 {job['id']} 回调成功")
+                        return
+                    logger.warning(f"任务 {job['id']} 回调返回 {response.status_code} (尝试 {attempt + 1})")
+                except httpx.HTTPError as e:
+                    logger.warning(f"任务 {job['id']} 回调失败 (尝试 {attempt + 1}): {str(e)}")
+                await asyncio.sleep(delay)
+                delay *= 2
+        logger.error(f"任务 {job['id']} 回调多次失败，放弃")
+
+    def _recover_orphaned_jobs(self) -> List[Dict[str, Any]]:
+        """
+        接管所属进程已退出的未完成任务
+
+        多个 worker 同时启动时通过文件锁串行执行，避免同一任务被重复接管。
+        """
+        recovered = []
+        with open(os.path.join(self.job_dir, ".recover.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for job in self._iter_jobs():
+                if job.get("state") in FINISHED_STATES or _pid_alive(job.get("owner_pid")):
+                    continue
+                job["owner_pid"] = os.getpid()
+                job["state"] = "queued"
+                job["updated_at"] = time.time()
+                write_file_atomic(self._path_for(job["id"]), json.dumps(job, ensure_ascii=False).encode("utf-8"))
+                recovered.append(job)
+        if recovered:
+            logger.info(f"接管了 {len(recovered)} 个未完成的任务")
+        return recovered
+
+    def _cleanup_finished_jobs(self):
+        """删除超过保留时间的已完成任务记录"""
+        cutoff = time.time() - settings.JOB_RETENTION_HOURS * 3600
+        for job in self._iter_jobs():
+            if job.get("state") in FINISHED_STATES and job.get("finished_at", 0) < cutoff:
+                try:
+                    os.remove(self._path_for(job["id"]))
+                except OSError:
+                    pass
+
+    def _iter_jobs(self):
+        for filename in os.listdir(self.job_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, filename), "rb") as f:
+                    yield json.loads(f.read())
+            except (OSError, ValueError):
+                continue
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    if pid == os.getpid():
+        # 本进程刚启动，文件中的记录来自之前使用同一 PID 的进程
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+
+def _remove_job_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# 创建全局实例
+job_queue = JobQueue(
+    job_dir=settings.JOB_DIR,
+    workers=settings.JOB_WORKERS,
+    max_queued=settings.JOB_QUEUE_MAX_SIZE,
+    webhook_allowed=settings.JOB_WEBHOOK_ALLOWED_HOSTS.split(",")
+)
@@ -0,0 +1,186 @@
+import asyncio
+import ipaddress
+import logging
+import time
+from typing import Optional, List, Union
+
+from config import settings
+from services.metrics import INGRESS_QUEUE_DELAY, LOAD_SHED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def parse_request_start(value: str) -> Optional[float]:
+    """
+    解析反向代理添加的请求开始时间头，返回 Unix 时间戳（秒）
+
+    支持 Nginx 的 "t=${msec}"（秒，带小数）以及毫秒、微秒整数格式。
+    """
+    value = value.strip()
+    if value.startswith("t="):
+        value = value[2:]
+    try:
+        timestamp = float(value)
+    except ValueError:
+        return None
+    # 按数量级判断单位
+    if timestamp > 1e14:
+        return timestamp / 1e6
+    if timestamp > 1e11:
+        return timestamp / 1e3
+    return timestamp
+
+
+def parse_networks(values: List[str]) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    """解析 IP 地址或 CIDR 列表，忽略无效项"""
+    networks = []
+    for value in values:
+        value = value.strip()
+        if not value:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(value, strict=False))
+        except ValueError:
+            logger.warning(f"忽略无效的代理地址: {value}")
+    return networks
+
+
+class EventLoopLagMonitor:
+    """
+    事件循环延迟探测
+
+    周期性 sleep 并测量实际唤醒时间比预期晚了多少。事件循环忙不过来时，
+    新连接和请求在 uvicorn 和内核 backlog 中排队的时间与该延迟同步增长。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start - self.interval)
+
+
+class CoDelAdmission:
+    """
+    基于排队延迟的准入控制（CoDel）
+
+    排队延迟在整个 interval 内持续高于 target 时进入丢弃状态，拒绝新请求；
+    一旦观察到低于 target 的排队延迟立即恢复。短暂的突发不会触发丢弃，
+    持续过载时尽早拒绝，而不是让请求排队到客户端超时后再做无用功。
+    """
+
+    def __init__(self, target: float, interval: float):
+        self.target = target
+        self.interval = interval
+        self.dropping = False
+        self._first_above_time = 0.0
+
+    def should_shed(self, queue_delay: float, now: float) -> bool:
+        if queue_delay < self.target:
+            self._first_above_time = 0.0
+            if self.dropping:
+                self.dropping = False
+                logger.info("排队延迟恢复正常，停止拒绝请求")
+            return False
+        if self._first_above_time == 0.0:
+            self._first_above_time = now + self.interval
+            return False
+        if now >= self._first_above_time and not self.dropping:
+            self.dropping = True
+            logger.warning("排队延迟持续超过 %.0f ms，开始拒绝新请求", self.target * 1000)
+        return self.dropping
+
+
+class LoadShedder:
+    """入口限流：综合事件循环延迟和代理记录的请求开始时间估计排队延迟"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        target: float,
+        interval: float,
+        exempt_paths,
+        request_start_header: str,
+        trusted_proxies: List[str] = (),
+        max_request_age: float = 30.0
+    ):
+        self.enabled = enabled
+        self.exempt_paths = frozenset(path for path in exempt_paths if path)
+        self.request_start_header = request_start_header
+        # 只采用这些代理转发的请求开始时间头，未配置时不读取该请求头
+        self.trusted_proxies = parse_networks(trusted_proxies)
+        self.max_request_age = max_request_age
+        self.monitor = EventLoopLagMonitor(interval=0.05)
+        self.codel = CoDelAdmission(target=target, interval=interval)
+
+    def trusts(self, peer: Optional[str], forwarded: bool = False) -> bool:
+        """
+        请求是否来自受信任的反向代理
+
+        forwarded 表示 uvicorn 已按 X-Forwarded-For 改写了客户端地址，只有连接来自
+        FORWARDED_ALLOW_IPS 中的代理时才会改写，此时 peer 是原始客户端，按受信任代理处理。
+        """
+        if not self.trusted_proxies:
+            return False
+        if forwarded:
+            return True
+        if not peer:
+            return False
+        try:
+            address = ipaddress.ip_address(peer)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def queue_delay(self, request_start: Optional[str]) -> float:
+        delay = self.monitor.lag
+        if request_start:
+            started = parse_request_start(request_start)
+            if started is not None:
+                age = time.time() - started
+                # 未来的时间和过旧的时间（伪造的请求头或主机间时钟偏差）不可信，只用事件循环延迟
+                if 0 <= age <= self.max_request_age:
+                    delay = max(delay, age)
+        return delay
+
+    def should_shed(
+        self, path: str, request_start: Optional[str], peer: Optional[str] = None, forwarded: bool = False
+    ) -> bool:
+        """判断是否拒绝该请求；豁免的路径也参与排队延迟统计，但从不拒绝"""
+        if not self.enabled:
+            return False
+        delay = self.queue_delay(request_start if self.trusts(peer, forwarded) else None)
+        INGRESS_QUEUE_DELAY.observe(delay)
+        shed = self.codel.should_shed(delay, time.monotonic())
+        if shed and path not in self.exempt_paths:
+            LOAD_SHED_REQUESTS.inc()
+            return True
+        return False
+
+
+# 创建全局实例
+load_shedder = LoadShedder(
+    enabled=settings.LOAD_SHED_ENABLED,
+    target=settings.LOAD_SHED_TARGET_MS / 1000,
+    interval=settings.LOAD_SHED_INTERVAL_MS / 1000,
+    exempt_paths=settings.LOAD_SHED_EXEMPT_PATHS.split(","),
+    request_start_header=settings.REQUEST_START_HEADER,
+    trusted_proxies=settings.REQUEST_START_TRUSTED_PROXIES.split(","),
+    max_request_age=settings.REQUEST_START_MAX_AGE_MS / 1000
+)
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Tuple, Dict
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram,
+    CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+
+# gunicorn 多 worker 部署时由配置文件设置 PROMETHEUS_MULTIPROC_DIR，
+# 各 worker 的指标写入该目录，抓取时汇总所有 worker 的数据
+MULTIPROCESS_MODE = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# 上游调用耗时从几百毫秒到几十秒不等
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "gemini_proxy_http_request_duration_seconds",
+    "HTTP 请求处理耗时",
+    ["method", "endpoint", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "gemini_proxy_http_requests_in_flight",
+    "正在处理的 HTTP 请求数",
+    multiprocess_mode="livesum"
+)
+
+INGRESS_QUEUE_DELAY = Histogram(
+    "gemini_proxy_ingress_queue_delay_seconds",
+    "请求进入应用前的排队延迟估计（事件循环延迟与代理请求开始时间中的较大者）",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+LOAD_SHED_REQUESTS = Counter(
+    "gemini_proxy_load_shed_requests_total",
+    "排队延迟过高时在入口直接拒绝 (503) 的请求数"
+)
+
+UPSTREAM_DURATION = Histogram(
+    "gemini_proxy_upstream_request_duration_seconds",
+    "Gemini 上游调用耗时",
+    ["model", "operation", "outcome"],
+    buckets=UPSTREAM_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "gemini_proxy_upstream_requests_in_flight",
+    "正在进行的 Gemini 上游调用数",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_RETRIES = Counter(
+    "gemini_proxy_upstream_retries_total",
+    "Gemini 上游调用重试次数",
+    ["model", "reason"]
+)
+UPSTREAM_TIMEOUTS = Counter(
+    "gemini_proxy_upstream_timeouts_total",
+    "Gemini 上游调用超时次数",
+    ["model", "operation"]
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "gemini_proxy_upstream_concurrency_limit",
+    "自适应限流当前允许的上游并发数",
+    ["limiter"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_LIMIT_WAITING = Gauge(
+    "gemini_proxy_upstream_limit_waiting",
+    "等待上游并发名额的请求数",
+    ["limiter"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_LIMIT_REJECTED = Counter(
+    "gemini_proxy_upstream_limit_rejected_total",
+    "等待上游并发名额超时而被拒绝 (503) 的请求数",
+    ["limiter"]
+)
+
+UPSTREAM_HEALTHY = Gauge(
+    "gemini_proxy_upstream_healthy",
+    "最近一次上游健康探测是否成功（1 / 0）",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+UPSTREAM_PROBE_LATENCY = Gauge(
+    "gemini_proxy_upstream_probe_latency_seconds",
+    "最近一次上游健康探测的耗时",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+AUDIO_CACHE_LOOKUPS = Counter(
+    "gemini_proxy_audio_cache_lookups_total",
+    "音频缓存查询次数，tier 为命中的缓存层（hot / disk）或 miss",
+    ["tier"]
+)
+AUDIO_CACHE_BYTES = Gauge(
+    "gemini_proxy_audio_hot_cache_bytes",
+    "内存热点层占用字节数",
+    multiprocess_mode="livesum"
+)
+AUDIO_CACHE_ENTRIES = Gauge(
+    "gemini_proxy_audio_hot_cache_entries",
+    "内存热点层条目数",
+    multiprocess_mode="livesum"
+)
+
+EXECUTOR_PENDING = Gauge(
+    "gemini_proxy_executor_pending_tasks",
+    "线程池中排队和执行中的任务数",
+    ["executor"],
+    multiprocess_mode="livesum"
+)
+EXECUTOR_ACTIVE = Gauge(
+    "gemini_proxy_executor_active_threads",
+    "线程池中正在执行任务的线程数，与 executor_workers 之比即为利用率",
+    ["executor"],
+    multiprocess_mode="livesum"
+)
+EXECUTOR_WORKERS = Gauge(
+    "gemini_proxy_executor_workers",
+    "线程池的线程数",
+    ["executor"],
+    multiprocess_mode="livesum"
+)
+EXECUTOR_REJECTED = Counter(
+    "gemini_proxy_executor_rejected_total",
+    "线程池排队已满而被拒绝 (503) 的任务数",
+    ["executor"]
+)
+SHUTDOWN_DRAIN_DURATION = Histogram(
+    "gemini_proxy_shutdown_drain_seconds",
+    "worker 关闭时等待进行中的上游调用、任务和文件写入完成的耗时",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0)
+)
+SHUTDOWN_ABANDONED = Counter(
+    "gemini_proxy_shutdown_abandoned_total",
+    "worker 关闭时超过等待时间仍未完成的任务数",
+    ["kind"]
+)
+
+JOB_QUEUE_DEPTH = Gauge(
+    "gemini_proxy_job_queue_depth",
+    "异步任务队列中等待执行的任务数",
+    multiprocess_mode="livesum"
+)
+
+WS_CONNECTIONS = Gauge(
+    "gemini_proxy_ws_connections",
+    "当前打开的 WebSocket 实时连接数",
+    multiprocess_mode="livesum"
+)
+WS_REQUESTS = Counter(
+    "gemini_proxy_ws_requests_total",
+    "WebSocket 连接上处理的请求数，按结果（success / error / cancelled / rejected）统计",
+    ["type", "outcome"]
+)
+
+USAGE_QUOTA_REJECTED = Counter(
+    "gemini_proxy_usage_quota_rejected_total",
+    "客户端用量超出配额被拒绝（返回 429）的请求数"
+)
+
+
+@contextmanager
+def track_upstream(model: str, operation: str):
+    """记录一次上游调用的耗时、并发数和结果（success / timeout / error）"""
+    UPSTREAM_IN_FLIGHT.labels(model).inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    except (TimeoutError, asyncio.TimeoutError):
+        outcome = "timeout"
+        UPSTREAM_TIMEOUTS.labels(model, operation).inc()
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.labels(model).dec()
+        UPSTREAM_DURATION.labels(model, operation, outcome).observe(time.perf_counter() - start)
+
+
+def read_gauge(name: str, labels: Dict[str, str]) -> float:
+    """
+    读取所有 worker 汇总后的 gauge 当前值
+
+    多进程模式下需要读取各 worker 的指标文件，为阻塞操作，应在线程池中调用。
+    """
+    if MULTIPROCESS_MODE:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return registry.get_sample_value(name, labels) or 0.0
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标，多进程模式下汇总所有 worker"""
+    if MULTIPROCESS_MODE:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from services.audio_store import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentCache:
+    """
+    PCM 音频片段缓存
+
+    以原始 PCM 格式保存可复用的音频片段（如长对话的分段合成结果），
+    方便直接拼接。方法均为同步阻塞操作，应在线程池中调用。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def prepare(self):
+        """创建缓存目录"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """根据片段内容和合成参数生成缓存键"""
+        content = "\x1f".join(parts)
+        return hashlib.md5(content.encode()).hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"seg_{key}.pcm")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取缓存的片段，不存在时返回 None"""
+        path = self._path_for(key)
+        try:
+            with open(path, "rb") as f:
+                pcm_data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # 更新修改时间，清理时按最近使用保留
+            os.utime(path)
+        except OSError:
+            pass
+        return pcm_data
+
+    def put(self, key: str, pcm_data: bytes):
+        """原子写入片段"""
+        try:
+            write_file_atomic(self._path_for(key), pcm_data)
+        except Exception as e:
+            logger.warning(f"写入音频片段缓存失败 {key}: {str(e)}")
+
+    def cleanup(self, max_files: int):
+        """清理旧的片段，保留最近使用的指定数量"""
+        try:
+            files = []
+            for filename in os.listdir(self.cache_dir):
+                if filename.startswith("seg_") and filename.endswith(".pcm"):
+                    filepath = os.path.join(self.cache_dir, filename)
+                    try:
+                        files.append((filepath, os.path.getmtime(filepath)))
+                    except FileNotFoundError:
+                        continue
+
+            if len(files) <= max_files:
+                return
+
+            files.sort(key=lambda x: x[1], reverse=True)
+            for filepath, _ in files[max_files:]:
+                try:
+                    os.remove(filepath)
+                except OSError as e:
+                    logger.warning(f"删除音频片段失败 {filepath}: {str(e)}")
+        except Exception as e:
+            logger.error(f"清理音频片段失败: {str(e)}")
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any
+
+from services.bulkhead import POOLS
+from services.job_queue import job_queue
+from services.metrics import SHUTDOWN_DRAIN_DURATION, SHUTDOWN_ABANDONED
+from services.tts_prewarm import tts_prewarmer
+
+logger = logging.getLogger(__name__)
+
+
+async def drain_background_work(timeout: float) -> Dict[str, Any]:
+    """
+    worker 关闭时等待进行中的后台工作完成
+
+    进行中的 HTTP 请求已由 uvicorn 在调用本函数前等待完毕。这里停止领取新任务和预热，
+    等待正在执行的异步任务、线程池中的上游调用和音频文件写入完成，避免浪费已消耗的配额
+    或留下未写完的缓存；超过 timeout 秒仍未完成的部分被放弃，异步任务由下次启动接管。
+
+    Returns:
+        收尾结果：耗时、被取消的任务数、各线程池中未完成的任务数
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+
+    tts_prewarmer.stop()
+    cancelled_jobs = await job_queue.drain(timeout)
+    if cancelled_jobs:
+        SHUTDOWN_ABANDONED.labels("job").inc(cancelled_jobs)
+
+    # 调用方被取消后线程中的上游调用仍在执行，等待其结束以及已提交的文件写入完成
+    while any(pool.pending for pool in POOLS) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    abandoned = {pool.name: pool.pending for pool in POOLS if pool.pending}
+    for name, count in abandoned.items():
+        SHUTDOWN_ABANDONED.labels(name).inc(count)
+
+    duration = time.perf_counter() - start
+    SHUTDOWN_DRAIN_DURATION.observe(duration)
+    if cancelled_jobs or abandoned:
+        logger.warning(
+            f"关闭等待超时 ({duration:.2f}s)，放弃 {cancelled_jobs} 个异步任务和线程池中的任务 {abandoned}"
+        )
+    else:
+        logger.info(f"进行中的工作已全部完成，耗时 {duration:.2f}s")
+    return {"duration": duration, "cancelled_jobs": cancelled_jobs, "abandoned": abandoned}
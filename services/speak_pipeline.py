@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Awaitable
+
+from config import settings
+from services.gemini_service import gemini_service
+from services.gemini_tts_service import gemini_tts_service
+from services.text_splitter import pop_complete_sentences
+from services import timing
+
+logger = logging.getLogger(__name__)
+
+
+async def stream_generate_and_speak(
+    prompt: str,
+    max_tokens: Optional[int] = None,
+    temperature: float = 0.7,
+    voice_name: str = "Kore",
+    language: Optional[str] = None,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流水线方式生成文本并转换为语音
+
+    流式生成文本，每得到一个完整句子就开始合成，生成与合成同时进行。
+    按句子顺序逐个产出事件，首段音频的等待时间约等于首句的生成和合成时间。
+    每句单独写入音频缓存，相同句子再次出现时直接命中缓存。
+    指定 on_text 时每收到一块生成的文本就以该文本调用一次，供调用方在音频之前先推送文字。
+
+    产出的事件:
+    - {"event": "segment", "index", "text", "audio_url", "filename"}: 一句音频已就绪
+    - {"event": "done", "text", "segments", "metadata"}: 全部完成
+    - {"event": "error", "error"}: 生成或合成失败，之后不再产出事件
+    """
+    started_at = time.monotonic()
+    semaphore = asyncio.Semaphore(settings.SPEAK_PIPELINE_CONCURRENCY)
+    pending: asyncio.Queue = asyncio.Queue()
+    text_chunks = []
+
+    async def synthesize(sentence: str) -> str:
+        async with semaphore:
+            return await gemini_tts_service.generate_speech(
+                text=sentence,
+                voice_name=voice_name,
+                language=language
+            )
+
+    async def schedule(sentence: str):
+        await pending.put((sentence, asyncio.create_task(synthesize(sentence))))
+
+    async def produce():
+        buffer = ""
+        try:
+            async for chunk in gemini_service.stream_text(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ):
+                text_chunks.append(chunk)
+                if on_text is not None:
+                    await on_text(chunk)
+                sentences, buffer = pop_complete_sentences(
+                    buffer + chunk, settings.SPEAK_PIPELINE_MAX_SENTENCE_CHARS
+                )
+                for sentence in sentences:
+                    await schedule(sentence)
+            if buffer.strip():
+                await schedule(buffer.strip())
+        finally:
+            await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    index = 0
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            sentence, task = item
+            filename = os.path.basename(await task)
+            if index == 0:
+                logger.info(f"流水线首段音频就绪，耗时 {time.monotonic() - started_at:.2f} 秒")
+            yield {
+                "event": "segment",
+                "index": index,
+                "text": sentence,
+                "audio_url": f"/audio/{filename}",
+                "filename": filename
+            }
+            index += 1
+
+        # 文本生成过程中的错误在这里抛出
+        await producer
+        text = "".join(text_chunks)
+        yield {
+            "event": "done",
+            "text": text,
+            "segments": index,
+            "metadata": {
+                "prompt_length": len(prompt),
+                "response_length": len(text),
+                "temperature": temperature,
+                "voice_name": voice_name,
+                "language": language or "auto",
+                "tts_engine": "gemini",
+                "elapsed": round(time.monotonic() - started_at, 3),
+                **timing.request_metadata()
+            }
+        }
+    except Exception as e:
+        logger.error(f"流水线生成文本并转语音错误: {str(e)}")
+        yield {"event": "error", "error": str(e)}
+    finally:
+        # 客户端断开或出错时取消尚未完成的生成和合成
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if item is not None:
+                item[1].cancel()
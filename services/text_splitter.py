@@ -0,0 +1,142 @@
+import re
+from typing import List, Optional, Tuple
+
+# 对话轮次: (说话人, 台词)
+DialogueTurn = Tuple[str, str]
+
+# 句子结束符：中文标点直接断句，英文标点需后接空白或位于文本末尾，换行也视为断句
+_SENTENCE_END_PATTERN = re.compile(r".*?(?:[。！？；]+[”’」』）)]*|[.!?;]+[\"')\]]*(?=\s|$)|\n+|$)")
+_CJK_SENTENCE_ENDINGS = tuple("。！？；”’」』）")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    将文本按句子拆分，句末标点保留在句子中
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        去除首尾空白后的非空句子列表
+    """
+    sentences = []
+    for match in _SENTENCE_END_PATTERN.finditer(text):
+        sentence = match.group(0).strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def pop_complete_sentences(buffer: str, max_chars: int = 0) -> Tuple[List[str], str]:
+    """
+    从流式生成的文本缓冲区中取出已完整的句子
+
+    英文句末标点位于缓冲区末尾时无法判断句子是否结束（可能是小数点或缩写），留待后续文本确认。
+
+    Args:
+        buffer: 当前累积的文本
+        max_chars: 剩余文本超过该长度仍未断句时整体作为一句返回，0 表示不限制
+
+    Returns:
+        (完整句子列表, 剩余未完成的文本)
+    """
+    sentences = []
+    position = 0
+    for match in _SENTENCE_END_PATTERN.finditer(buffer):
+        text = match.group(0)
+        if match.end() == len(buffer) and not (text.endswith("\n") or text.endswith(_CJK_SENTENCE_ENDINGS)):
+            break
+        sentence = text.strip()
+        if sentence:
+            sentences.append(sentence)
+        position = match.end()
+
+    remainder = buffer[position:]
+    if max_chars and len(remainder) > max_chars:
+        sentences.append(remainder.strip())
+        remainder = ""
+    return sentences, remainder
+
+
+def split_dialogue_turns(text: str, speakers: List[str]) -> Optional[List[DialogueTurn]]:
+    """
+    按说话人标记拆分对话文本
+
+    说话人标记形如 "Joe: " 或 "Joe：", 可以位于行首，也可以跟在上一句台词之后。
+
+    Args:
+        text: 包含说话人标记的文本
+        speakers: 说话人名称列表
+
+    Returns:
+        对话轮次列表；第一个说话人标记之前存在其他内容或未找到任何标记时返回 None
+    """
+    names = sorted({speaker for speaker in speakers if speaker}, key=len, reverse=True)
+    if not names:
+        return None
+
+    pattern = re.compile(r"(?<!\w)(" + "|".join(re.escape(name) for name in names) + r")\s*[:：]")
+    matches = list(pattern.finditer(text))
+    if not matches or text[:matches[0].start()].strip():
+        return None
+
+    turns = []
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        utterance = text[match.end():end].strip()
+        if utterance:
+            turns.append((match.group(1), utterance))
+    return turns or None
+
+
+def group_dialogue_turns(
+    turns: List[DialogueTurn],
+    max_chars: int,
+    max_turns: int
+) -> List[str]:
+    """
+    将对话轮次按固定轮次数分组，每组拼接为一段可单独合成的对话文本
+
+    分组边界只由轮次序号决定（每 max_turns 轮一组），与前面各轮的长度无关：修改一句台词
+    只改变所在分组的文本，其他分组的缓存键不变。一组超过字符上限时在组内再按字符数切分；
+    单个轮次超过字符上限时按句拆成同一说话人的多段，单句超过上限时该句单独成段。
+    """
+    chunks = []
+
+    for start in range(0, len(turns), max_turns):
+        current: List[str] = []
+        current_chars = 0
+        lines = [
+            line
+            for speaker, utterance in turns[start:start + max_turns]
+            for line in _turn_lines(speaker, utterance, max_chars)
+        ]
+        for line in lines:
+            if current and current_chars + len(line) > max_chars:
+                chunks.append("\n".join(current))
+                current = []
+                current_chars = 0
+            current.append(line)
+            current_chars += len(line)
+        if current:
+            chunks.append("\n".join(current))
+    return chunks
+
+
+def _turn_lines(speaker: str, utterance: str, max_chars: int) -> List[str]:
+    """一个轮次的台词行；超过字符上限时按句拆成同一说话人的多行"""
+    prefix = f"{speaker}: "
+    if len(prefix) + len(utterance) <= max_chars:
+        return [prefix + utterance]
+
+    lines = []
+    current = ""
+    for sentence in split_sentences(utterance):
+        if current and len(prefix) + len(current) + 1 + len(sentence) > max_chars:
+            lines.append(prefix + current)
+            current = ""
+        separator = "" if not current or current.endswith(_CJK_SENTENCE_ENDINGS) else " "
+        current += separator + sentence
+    if current:
+        lines.append(prefix + current)
+    return lines
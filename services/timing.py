@@ -0,0 +1,97 @@
+import contextvars
+import functools
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable
+
+
+class RequestTimings:
+    """
+    单个请求的分阶段耗时
+
+    同一阶段多次出现时累加（例如按句并行合成时 tts 为各句耗时之和，可能大于总耗时）。
+    线程池中的代码也会写入，因此用锁保护。
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started_at = time.perf_counter()
+        self._stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self._stages[name] = self._stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        """各阶段耗时（毫秒），包含截至目前的总耗时 total"""
+        with self._lock:
+            stages = {name: round(seconds * 1000, 2) for name, seconds in self._stages.items()}
+        stages["total"] = round((time.perf_counter() - self.started_at) * 1000, 2)
+        return stages
+
+    def server_timing_header(self) -> str:
+        """生成 Server-Timing 响应头"""
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.as_dict().items())
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def start_request(trace_id: Optional[str] = None) -> RequestTimings:
+    """为当前请求创建耗时记录，未提供 trace id 时生成一个"""
+    timings = RequestTimings(trace_id or uuid.uuid4().hex)
+    _current_timings.set(timings)
+    return timings
+
+
+def current() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def stage(name: str):
+    """记录一个阶段的耗时，不在请求上下文中时不做任何事"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def request_metadata() -> Dict[str, Any]:
+    """用于响应 metadata 的耗时和 trace id"""
+    timings = _current_timings.get()
+    if timings is None:
+        return {}
+    return {"trace_id": timings.trace_id, "timings": timings.as_dict()}
+
+
+def bind_to_request(func: Callable, *args) -> Callable[[], Any]:
+    """
+    包装提交到线程池的函数：在线程中恢复当前上下文，并记录排队等待时间 (executor_wait)
+
+    使线程内的 stage() 和用量统计也能关联到当前请求；不在请求上下文中时（WebSocket、异步任务）
+    只恢复上下文，不记录等待时间。
+    """
+    context = contextvars.copy_context()
+    timings = _current_timings.get()
+    if timings is None:
+        return functools.partial(context.run, func, *args)
+
+    submitted = time.perf_counter()
+
+    def run():
+        timings.add("executor_wait", time.perf_counter() - submitted)
+        return context.run(func, *args)
+
+    return run
+
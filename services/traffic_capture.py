@@ -0,0 +1,215 @@
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 这些字段中的文本在匿名化时替换；回调地址直接去掉，避免回放时请求真实的外部服务
+ANONYMIZED_FIELDS = ("text", "prompt", "content", "speaker")
+DROPPED_FIELDS = ("callback_url",)
+
+# 字母、数字、汉字组成的词，标点和空白保持不变，使断句和说话人标记的结构不变
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+_COMMON_CJK = (
+    "的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天"
+    "而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分将外但身些"
+)
+_ASCII_LOWER = "abcdefghijklmnopqrstuvwxyz"
+_ASCII_UPPER = _ASCII_LOWER.upper()
+_DIGITS = "0123456789"
+
+_STOP = object()
+
+
+class TrafficRecorder:
+    """
+    线上流量采集
+
+    按比例采样请求，记录方法、路径、请求体（可匿名化）、状态码和分阶段耗时，
+    供 benchmarks/replay_traffic.py 按原始到达间隔离线回放。
+    记录先放入内存队列，由后台线程写入 JSONL 文件，请求处理中不做文件 I/O，队列满时丢弃。
+    每个进程写入独立的文件，超过大小上限后轮转并 gzip 压缩。
+    """
+
+    def __init__(self, directory: str, enabled: bool, sample_rate: float, anonymize: bool, salt: str,
+                 exclude_paths: List[str], max_body_bytes: int, max_bytes: int, backup_count: int, queue_size: int):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.anonymize = anonymize
+        self.salt = (salt or os.urandom(16).hex()).encode("utf-8")
+        self.exclude_paths = tuple(path for path in exclude_paths if path)
+        self.max_body_bytes = max_body_bytes
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.queue_size = queue_size
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def should_capture(self, path: str) -> bool:
+        """是否采集该请求（在读取请求体之前判断，未采样的请求没有额外开销）"""
+        if not self.enabled or path in self.exclude_paths:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(self, method: str, path: str, query: str, content_type: str, body: bytes,
+               status: int, duration: float, timings: Optional[Dict[str, Any]] = None,
+               trace_id: Optional[str] = None):
+        """
+        记录一次请求，不阻塞
+
+        Args:
+            duration: 从收到请求到返回响应头的耗时（秒），流式响应不含响应体的传输时间
+        """
+        entry = {
+            "ts": time.time() - duration,
+            "method": method,
+            "path": path,
+            "query": query,
+            "content_type": content_type,
+            # 请求体的解析和匿名化在后台线程中进行
+            "body": body,
+            "body_bytes": len(body),
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            "timings": timings,
+            "trace_id": trace_id,
+            "pid": os.getpid()
+        }
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            pass
+
+    def _capture_body(self, content_type: str, body: bytes) -> Optional[Any]:
+        """解析 JSON 请求体，超过大小上限或无法解析时只记录长度"""
+        if not body or len(body) > self.max_body_bytes or "json" not in content_type:
+            return None
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        return self.anonymize_value(data) if self.anonymize else data
+
+    def anonymize_value(self, value: Any, key: Optional[str] = None) -> Any:
+        """递归替换指定字段中的文本"""
+        if isinstance(value, dict):
+            return {k: self.anonymize_value(v, k) for k, v in value.items() if k not in DROPPED_FIELDS}
+        if isinstance(value, list):
+            return [self.anonymize_value(item, key) for item in value]
+        if isinstance(value, str) and key in ANONYMIZED_FIELDS:
+            return _WORD_PATTERN.sub(lambda match: self._pseudo_word(match.group()), value)
+        return value
+
+    def _pseudo_word(self, word: str) -> str:
+        """
+        将一个词替换为等长、同字符类别的伪随机词
+
+        同一个词（在同一密钥下）总是得到相同的结果，因此重复文本仍然命中缓存，
+        说话人标记与 speaker_configs 中的名称也保持一致。
+        """
+        digest = hashlib.shake_256(self.salt + word.encode("utf-8")).digest(len(word) * 2)
+        chars = []
+        for i, char in enumerate(word):
+            n = int.from_bytes(digest[i * 2:i * 2 + 2], "big")
+            if char.isdigit():
+                chars.append(_DIGITS[n % len(_DIGITS)])
+            elif "\u4e00" <= char <= "\u9fff":
+                chars.append(_COMMON_CJK[n % len(_COMMON_CJK)])
+            elif char.isupper():
+                chars.append(_ASCII_UPPER[n % len(_ASCII_UPPER)])
+            else:
+                chars.append(_ASCII_LOWER[n % len(_ASCII_LOWER)])
+        return "".join(chars)
+
+    def _ensure_writer(self):
+        # gunicorn preload_app 时 fork 出的 worker 中没有写入线程，按进程启动
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._writer = threading.Thread(target=self._run, args=(self._queue,), name="traffic-capture", daemon=True)
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def stop(self):
+        """写出队列中剩余的记录并停止后台线程"""
+        if self._writer_pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._writer.join(timeout=5)
+        self._writer_pid = None
+
+    def _current_path(self) -> str:
+        return os.path.join(self.directory, f"traffic-{os.getpid()}.jsonl")
+
+    def _run(self, entries: queue.Queue):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._current_path()
+        f = open(path, "a", encoding="utf-8")
+        try:
+            while True:
+                entry = entries.get()
+                if entry is _STOP:
+                    break
+                try:
+                    entry["body"] = self._capture_body(entry["content_type"], entry["body"])
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    # 队列中没有更多记录时再刷新，高峰时批量写出
+                    if entries.empty():
+                        f.flush()
+                    if f.tell() >= self.max_bytes:
+                        f.close()
+                        self._rotate(path)
+                        f = open(path, "a", encoding="utf-8")
+                except Exception as e:
+                    logger.warning(f"写入流量采集记录失败: {str(e)}")
+        finally:
+            f.close()
+
+    def _rotate(self, path: str):
+        """将写满的文件压缩为 .jsonl.gz，并删除超出保留数量的旧文件"""
+        rotated = f"{path[:-len('.jsonl')]}-{time.strftime('%Y%m%d%H%M%S')}.jsonl"
+        os.replace(path, rotated)
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+
+        archives = sorted(glob.glob(os.path.join(self.directory, "traffic-*.jsonl.gz")), key=os.path.getmtime)
+        for old in archives[:max(len(archives) - self.backup_count, 0)]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+# 创建全局实例
+traffic_recorder = TrafficRecorder(
+    directory=settings.TRAFFIC_CAPTURE_DIR,
+    enabled=settings.TRAFFIC_CAPTURE_ENABLED,
+    sample_rate=settings.TRAFFIC_CAPTURE_SAMPLE_RATE,
+    anonymize=settings.TRAFFIC_CAPTURE_ANONYMIZE,
+    salt=settings.TRAFFIC_CAPTURE_SALT,
+    exclude_paths=settings.TRAFFIC_CAPTURE_EXCLUDE_PATHS.split(","),
+    max_body_bytes=settings.TRAFFIC_CAPTURE_MAX_BODY_BYTES,
+    max_bytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+    backup_count=settings.TRAFFIC_CAPTURE_BACKUP_COUNT,
+    queue_size=settings.TRAFFIC_CAPTURE_QUEUE_SIZE
+)
@@ -0,0 +1,270 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import settings
+from services.gemini_tts_service import gemini_tts_service
+from services.audio_store import audio_store
+from services.bulkhead import BulkheadFullError
+from services.metrics import read_gauge
+
+logger = logging.getLogger(__name__)
+
+# 预热条目: (文本, 声音, 语言, 是否按句分段)
+PrewarmEntry = Tuple[str, str, Optional[str], bool]
+
+
+class TTSRequestHistory:
+    """
+    TTS 请求历史记录
+
+    以 JSONL 格式追加记录每次 TTS 请求的文本和声音参数，供缓存预热统计热门短语。
+    文件超过大小上限时轮转为 .1 备份。记录操作为同步阻塞操作，应在后台任务中调用。
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, text: str, voice_name: str, language: Optional[str], segmented: Optional[bool]):
+        """追加一条请求记录"""
+        if not self.enabled:
+            return
+        line = json.dumps({
+            "ts": int(time.time()),
+            "text": text,
+            "voice_name": voice_name,
+            "language": language,
+            "segmented": segmented
+        }, ensure_ascii=False)
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            logger.warning(f"记录TTS请求历史失败: {str(e)}")
+
+
+def load_phrase_counts(paths: List[str], since: Optional[float] = None) -> Counter:
+    """
+    从请求历史或短语列表文件中统计 (文本, 声音, 语言, 是否分段) 的出现次数
+
+    支持两种文件格式：
+    - .jsonl: 每行一个 JSON 对象，包含 text，可选 voice_name、language、segmented、count、ts
+    - 其他: 纯文本短语列表，每行一个短语，可写作 "声音<TAB>短语" 指定声音
+
+    Args:
+        paths: 文件路径列表，不存在的文件会被忽略
+        since: 只统计该时间戳之后的 JSONL 记录
+    """
+    counts = Counter()
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if path.endswith(".jsonl"):
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        text = record.get("text")
+                        if not text or (since and record.get("ts", since) < since):
+                            continue
+                        segmented = record.get("segmented")
+                        entry = (
+                            text,
+                            record.get("voice_name") or "Kore",
+                            record.get("language"),
+                            settings.TTS_SEGMENTED_DEFAULT if segmented is None else bool(segmented)
+                        )
+                        counts[entry] += int(record.get("count", 1))
+                    else:
+                        voice_name, sep, text = line.partition("\t")
+                        if not sep:
+                            voice_name, text = "Kore", line
+                        counts[(text, voice_name, None, settings.TTS_SEGMENTED_DEFAULT)] += 1
+        except Exception as e:
+            logger.warning(f"读取预热短语文件失败 {path}: {str(e)}")
+    return counts
+
+
+def _read_live_tts_load() -> float:
+    model = gemini_tts_service.model_name
+    in_flight = read_gauge("gemini_proxy_upstream_requests_in_flight", {"model": model})
+    waiting = sum(
+        read_gauge("gemini_proxy_upstream_limit_waiting", {"limiter": limiter})
+        for limiter in ("tts", "multi_speaker_tts")
+    )
+    return in_flight + waiting
+
+
+async def _live_tts_load() -> float:
+    """
+    所有 worker 上正在进行和等待上游并发名额的 TTS 调用数
+
+    gunicorn 多 worker 部署时从 Prometheus 多进程指标目录汇总，能看到其他 worker 的实时流量。
+    I/O 线程池已满时视为繁忙。
+    """
+    try:
+        return await audio_store.run(_read_live_tts_load)
+    except BulkheadFullError:
+        return float("inf")
+
+
+class TTSPrewarmer:
+    """
+    TTS 缓存预热任务
+
+    按出现频率排序后，在后台依次合成前 N 个短语写入音频缓存。
+    上游调用受速率预算限制，并在任意 worker 上有实时 TTS 请求进行时暂停，避免与线上流量争抢配额。
+    多个 worker 通过文件锁保证同一时间只有一个预热任务在运行。
+    """
+
+    def __init__(self):
+        self.status: Dict[str, Any] = {"state": "idle"}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, entries: List[PrewarmEntry], rate_per_minute: Optional[float] = None) -> bool:
+        """
+        在后台启动预热任务
+
+        Returns:
+            是否成功启动（已有任务在运行时返回 False）
+        """
+        if self.running:
+            return False
+        entries = [
+            (text, voice_name, language, settings.TTS_SEGMENTED_DEFAULT if segmented is None else segmented)
+            for text, voice_name, language, segmented in entries
+        ]
+        self.status = {"state": "pending", "total": len(entries)}
+        self._task = asyncio.create_task(self.run(entries, rate_per_minute))
+        return True
+
+    def start_from_sources(
+        self,
+        top_n: Optional[int] = None,
+        rate_per_minute: Optional[float] = None,
+        paths: Optional[List[str]] = None
+    ) -> bool:
+        """从请求历史和配置的短语文件中选取热门短语并启动预热"""
+        if paths is None:
+            paths = [settings.TTS_HISTORY_FILE, settings.TTS_PREWARM_PHRASES_FILE]
+        since = time.time() - settings.TTS_PREWARM_HISTORY_HOURS * 3600
+        counts = load_phrase_counts(paths, since=since)
+        entries = [entry for entry, _ in counts.most_common(top_n or settings.TTS_PREWARM_TOP_N)]
+        if not entries:
+            logger.info("没有可预热的TTS短语")
+            return False
+        return self.start(entries, rate_per_minute)
+
+    def stop(self):
+        """取消正在运行的预热任务"""
+        if self.running:
+            self._task.cancel()
+
+    async def run(self, entries: List[PrewarmEntry], rate_per_minute: Optional[float] = None):
+        """依次合成预热条目，已缓存的条目直接跳过"""
+        lock_file = self._acquire_lock()
+        if lock_file is None:
+            logger.info("其他 worker 正在执行TTS缓存预热，跳过")
+            self.status = {"state": "skipped", "reason": "其他 worker 正在预热"}
+            return
+
+        rate = rate_per_minute or settings.TTS_PREWARM_RATE_PER_MINUTE
+        min_interval = 60.0 / rate if rate > 0 else 0.0
+        self.status = {
+            "state": "running",
+            "total": len(entries),
+            "synthesized": 0,
+            "cached": 0,
+            "failed": 0,
+            "started_at": time.time()
+        }
+        logger.info(f"开始TTS缓存预热: {len(entries)} 条，速率上限 {rate}/分钟")
+
+        try:
+            last_call = 0.0
+            for text, voice_name, language, segmented in entries:
+                # 与实际合成使用相同的后处理参数计算缓存文件
+                cached_path = gemini_tts_service.cached_speech_path(text, voice_name, language, segmented)
+                if await audio_store.exists(cached_path):
+                    self.status["cached"] += 1
+                    continue
+
+                # 速率预算：两次上游合成之间至少间隔 min_interval
+                wait = last_call + min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                # 任意 worker 上有实时 TTS 请求时让路
+                while await _live_tts_load() > settings.TTS_PREWARM_MAX_LIVE_INFLIGHT:
+                    await asyncio.sleep(1.0)
+
+                last_call = time.monotonic()
+                try:
+                    await gemini_tts_service.generate_speech(
+                        text=text,
+                        voice_name=voice_name,
+                        language=language,
+                        segmented=segmented
+                    )
+                    self.status["synthesized"] += 1
+                except Exception as e:
+                    self.status["failed"] += 1
+                    logger.warning(f"预热短语合成失败: {str(e)}")
+
+            self.status["state"] = "finished"
+            logger.info(
+                f"TTS缓存预热完成: 合成 {self.status['synthesized']} 条，"
+                f"已缓存 {self.status['cached']} 条，失败 {self.status['failed']} 条"
+            )
+        except asyncio.CancelledError:
+            self.status["state"] = "cancelled"
+            raise
+        finally:
+            self.status["finished_at"] = time.time()
+            lock_file.close()
+
+    def _acquire_lock(self):
+        """获取跨进程预热锁，获取失败返回 None"""
+        lock_path = settings.TTS_PREWARM_LOCK_FILE
+        directory = os.path.dirname(lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(lock_path, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+
+# 创建全局实例
+tts_history = TTSRequestHistory(settings.TTS_HISTORY_FILE, settings.TTS_HISTORY_MAX_BYTES)
+tts_prewarmer = TTSPrewarmer()
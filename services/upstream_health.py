@@ -0,0 +1,225 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import settings
+from services.audio_store import audio_store
+from services.gemini_service import gemini_service
+from services.gemini_tts_service import gemini_tts_service
+from services.metrics import track_upstream, UPSTREAM_HEALTHY, UPSTREAM_PROBE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamHealthProber:
+    """
+    上游健康探测
+
+    定期向每个配置的模型发送最小请求（1 个 token 的文本生成；TTS 模型默认只查询模型信息，
+    不消耗语音合成配额，开启 tts_synthesis 后改为合成一个词），记录是否成功和延迟。同一组 worker 中只有持有文件锁的进程执行探测并把结果写入共享状态文件，
+    其他进程只读取该文件，探测频率不随 worker 数增加；持锁进程退出后由其他进程接替。
+    /status 以及需要上游健康信息的组件直接读取内存中的结果，不发起任何请求。
+    """
+
+    def __init__(self, state_file: str, lock_file: str, interval: float, timeout: float, enabled: bool = True,
+                 tts_synthesis: bool = False):
+        self.state_file = state_file
+        self.lock_file = lock_file
+        self.interval = interval
+        self.timeout = timeout
+        self.enabled = enabled
+        self.tts_synthesis = tts_synthesis
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._lock = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _targets(self) -> List[Tuple[str, str, Any]]:
+        """(名称, 模型, 探测函数)"""
+        return [
+            ("text", gemini_service.model_name, self._probe_text),
+            ("tts", gemini_tts_service.model_name, self._probe_tts),
+        ]
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._lock is None:
+                    self._lock = self._try_lock()
+                if self._lock is not None:
+                    await self._probe_all()
+                else:
+                    await self._load_state()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"上游健康探测出错: {str(e)}")
+            # 读取方更频繁地刷新，使结果最多比探测晚半个周期
+            await asyncio.sleep(self.interval if self._lock is not None else self.interval / 2)
+
+    def _try_lock(self):
+        directory = os.path.dirname(self.lock_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.lock_file, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        logger.info("由本进程负责上游健康探测")
+        return lock_file
+
+    async def _probe_all(self):
+        targets = self._targets()
+        results = await asyncio.gather(*(self._probe(name, model, probe) for name, model, probe in targets))
+        for result in results:
+            previous = self.results.get(result["name"], {})
+            if result["healthy"]:
+                result["consecutive_failures"] = 0
+            else:
+                result["consecutive_failures"] = previous.get("consecutive_failures", 0) + 1
+            if previous and previous.get("healthy") != result["healthy"]:
+                if result["healthy"]:
+                    logger.info(f"上游 {result['model']} 恢复正常")
+                else:
+                    logger.warning(f"上游 {result['model']} 探测失败: {result['error']}")
+        self._apply({result["name"]: result for result in results})
+        data = json.dumps(self.results, ensure_ascii=False).encode("utf-8")
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        await audio_store.write(self.state_file, data)
+
+    async def _probe(self, name: str, model: str, probe) -> Dict[str, Any]:
+        start = time.perf_counter()
+        error = None
+        try:
+            with track_upstream(model, "probe"):
+                await asyncio.wait_for(probe(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            error = f"探测超时（{self.timeout:g} 秒）"
+        except Exception as e:
+            error = str(e)[:500]
+        return {
+            "name": name,
+            "model": model,
+            "healthy": error is None,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": error,
+            "checked_at": time.time()
+        }
+
+    async def _probe_text(self):
+        # 等待后台加载完成后再导入，SDK 已在线程中导入过
+        client = await gemini_service.ready_client()
+        from google.genai.types import GenerateContentConfig
+
+        await client.aio.models.generate_content(
+            model=gemini_service.model_name,
+            contents="ping",
+            config=GenerateContentConfig(max_output_tokens=1)
+        )
+
+    async def _probe_tts(self):
+        client = await gemini_tts_service.ready_client()
+        if not self.tts_synthesis:
+            # 只查询模型信息：能验证网络、密钥和模型名，但不占用语音合成配额
+            await client.aio.models.get(model=gemini_tts_service.model_name)
+            return
+
+        from google.genai.types import GenerateContentConfig, SpeechConfig, VoiceConfig, PrebuiltVoiceConfig
+
+        await client.aio.models.generate_content(
+            model=gemini_tts_service.model_name,
+            contents="OK",
+            config=GenerateContentConfig(
+                response_modalities=["AUDIO"],
+                speech_config=SpeechConfig(
+                    voice_config=VoiceConfig(prebuilt_voice_config=PrebuiltVoiceConfig(voice_name="Kore"))
+                )
+            )
+        )
+
+    async def _load_state(self):
+        try:
+            data = await audio_store.read(self.state_file)
+        except FileNotFoundError:
+            return
+        self._apply(json.loads(data))
+
+    def _apply(self, results: Dict[str, Dict[str, Any]]):
+        self.results = results
+        for result in results.values():
+            UPSTREAM_HEALTHY.labels(result["model"]).set(1 if result["healthy"] else 0)
+            UPSTREAM_PROBE_LATENCY.labels(result["model"]).set(result["latency_ms"] / 1000)
+
+    def _is_fresh(self, result: Dict[str, Any]) -> bool:
+        # 超过 3 个周期没有更新（探测进程卡住或已退出）的结果不再可信
+        return time.time() - result.get("checked_at", 0) <= self.interval * 3
+
+    def is_healthy(self, name: str) -> Optional[bool]:
+        """
+        查询上游是否健康，供路由、熔断等组件使用
+
+        Args:
+            name: 探测目标名称（text / tts）
+
+        Returns:
+            最近一次探测的结果；未启用探测、尚未探测或结果已过期时返回 None
+        """
+        result = self.results.get(name)
+        if result is None or not self._is_fresh(result):
+            return None
+        return result["healthy"]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """所有探测目标的最近结果，过期的结果标记 stale"""
+        return {
+            name: {**result, "stale": not self._is_fresh(result)}
+            for name, result in self.results.items()
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总为 /status 的返回内容"""
+        if not self.enabled:
+            return {"status": "ready", "message": "服务已准备就绪（未启用上游探测）"}
+        upstreams = self.snapshot()
+        fresh = [result for result in upstreams.values() if not result["stale"]]
+        if not fresh:
+            return {"status": "unknown", "message": "上游探测尚未完成", "upstreams": upstreams}
+        unhealthy = [result["model"] for result in fresh if not result["healthy"]]
+        if not unhealthy:
+            status, message = "ready", "服务已准备就绪"
+        elif len(unhealthy) == len(fresh):
+            status, message = "error", f"上游不可用: {', '.join(unhealthy)}"
+        else:
+            status, message = "degraded", f"部分上游不可用: {', '.join(unhealthy)}"
+        return {"status": status, "message": message, "upstreams": upstreams}
+
+
+# 创建全局实例
+upstream_prober = UpstreamHealthProber(
+    state_file=settings.UPSTREAM_PROBE_STATE_FILE,
+    lock_file=settings.UPSTREAM_PROBE_LOCK_FILE,
+    interval=settings.UPSTREAM_PROBE_INTERVAL,
+    timeout=settings.UPSTREAM_PROBE_TIMEOUT,
+    enabled=settings.UPSTREAM_PROBE_ENABLED,
+    tts_synthesis=settings.UPSTREAM_PROBE_TTS_SYNTHESIS
+)
@@ -0,0 +1,417 @@
+import asyncio
+import calendar
+import contextvars
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 不在请求中发起的上游调用（启动时的缓存预热等）记在该名下
+INTERNAL_CLIENT = "internal"
+
+# 每条汇总记录的用量字段，顺序与内存中的计数列表一致
+USAGE_FIELDS = ("requests", "input_tokens", "output_tokens", "tts_characters", "audio_seconds")
+
+_current_client: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("usage_client", default=None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    client TEXT NOT NULL,
+    model TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    tts_characters INTEGER NOT NULL DEFAULT 0,
+    audio_seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (client, model, operation, hour)
+)
+"""
+
+# 多个 worker 写入同一行时在数据库中累加
+_UPSERT = """
+INSERT INTO usage (client, model, operation, hour, requests, input_tokens, output_tokens, tts_characters, audio_seconds)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (client, model, operation, hour) DO UPDATE SET
+    requests = requests + excluded.requests,
+    input_tokens = input_tokens + excluded.input_tokens,
+    output_tokens = output_tokens + excluded.output_tokens,
+    tts_characters = tts_characters + excluded.tts_characters,
+    audio_seconds = audio_seconds + excluded.audio_seconds
+"""
+
+
+def set_client(client_id: Optional[str]):
+    """设置当前上下文（请求、WebSocket 连接、异步任务）的客户端标识"""
+    _current_client.set(client_id)
+
+
+def current_client() -> str:
+    return _current_client.get() or INTERNAL_CLIENT
+
+
+def api_key_from(headers: Any, fallback: Optional[str] = None) -> Optional[str]:
+    """请求携带的 API Key：USAGE_API_KEY_HEADER 请求头或 Authorization: Bearer，都没有时为 fallback"""
+    value = headers.get(settings.USAGE_API_KEY_HEADER)
+    if not value:
+        scheme, _, token = (headers.get("authorization") or "").partition(" ")
+        if scheme.lower() == "bearer":
+            value = token.strip()
+    return value or fallback
+
+
+def authenticated_client(api_key: Optional[str]) -> Optional[str]:
+    """API Key 对应的客户端（USAGE_CLIENT_KEYS），Key 无效时返回 None"""
+    if not api_key:
+        return None
+    return _CLIENT_KEYS.get(api_key)
+
+
+def is_admin(api_key: Optional[str]) -> bool:
+    """是否为 USAGE_ADMIN_KEY（可以查询所有客户端的用量）"""
+    if not api_key or not settings.USAGE_ADMIN_KEY:
+        return False
+    return hmac.compare_digest(api_key.encode(), settings.USAGE_ADMIN_KEY.encode())
+
+
+def resolve_client(api_key: Optional[str], claimed: Optional[str]) -> str:
+    """
+    确定请求的客户端标识
+
+    配置了 USAGE_CLIENT_KEYS 时只按 API Key 映射客户端，未携带或无效的 Key 统一记为
+    USAGE_ANONYMOUS_CLIENT，更换或省略标识不能绕过配额；未配置时使用调用方自行声明的
+    USAGE_CLIENT_HEADER，此时用量和配额仅供参考。
+    """
+    if _CLIENT_KEYS:
+        return authenticated_client(api_key) or settings.USAGE_ANONYMOUS_CLIENT
+    claimed = (claimed or "").strip()[:128]
+    return claimed or settings.USAGE_ANONYMOUS_CLIENT
+
+
+def parse_client_keys(value: str) -> Dict[str, str]:
+    """解析 "key=client,key2=client2" 格式的 API Key 映射"""
+    keys = {}
+    for item in value.split(","):
+        key, sep, client = item.partition("=")
+        if sep and key.strip() and client.strip():
+            keys[key.strip()] = client.strip()
+    return keys
+
+
+_CLIENT_KEYS = parse_client_keys(settings.USAGE_CLIENT_KEYS)
+
+
+def parse_quotas(value: str) -> Dict[str, float]:
+    """解析 "client=limit,client2=limit" 格式的配额配置，* 表示未单独配置的客户端"""
+    quotas = {}
+    for item in value.split(","):
+        name, sep, limit = item.partition("=")
+        if sep and name.strip() and limit.strip():
+            quotas[name.strip()] = float(limit)
+    return quotas
+
+
+def period_bounds(period: str, now: Optional[float] = None) -> Tuple[int, int]:
+    """当前配额周期（UTC 自然日或自然月）的起止时间戳"""
+    now = time.time() if now is None else now
+    if period == "month":
+        year, month = time.gmtime(now)[:2]
+        start = calendar.timegm((year, month, 1, 0, 0, 0))
+        end = calendar.timegm((year + month // 12, month % 12 + 1, 1, 0, 0, 0))
+        return start, end
+    start = int(now // 86400 * 86400)
+    return start, start + 86400
+
+
+def _token_counts(usage_metadata: Any) -> Tuple[int, int]:
+    if usage_metadata is None:
+        return 0, 0
+    return (
+        getattr(usage_metadata, "prompt_token_count", None) or 0,
+        getattr(usage_metadata, "candidates_token_count", None) or 0
+    )
+
+
+class UsageTracker:
+    """
+    上游用量统计和配额
+
+    每次上游调用后按 (客户端, 模型, 操作, 小时) 在内存中累加请求数、输入/输出 token、
+    TTS 字符数和音频时长，由后台任务每隔 flush_interval 秒在线程中批量写入 SQLite，
+    请求路径上只有一次加锁累加。多个 worker 共用同一个数据库文件，写入时在数据库中累加。
+
+    配置了配额的客户端，每次写入后从数据库读取其当前周期的总用量，检查配额时再加上本进程
+    尚未写入的部分，不访问数据库。其他 worker 的用量最多晚 flush_interval 秒计入。
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_interval: float,
+        token_quotas: Dict[str, float],
+        character_quotas: Dict[str, float],
+        quota_period: str = "day",
+        enabled: bool = True
+    ):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.token_quotas = token_quotas
+        self.character_quotas = character_quotas
+        self.quota_period = quota_period
+        self.enabled = enabled
+        self._pending: Dict[Tuple[str, str, str, int], List[float]] = {}
+        # 正在写入的批次，写完并刷新周期总量之前仍计入配额
+        self._writing: Dict[Tuple[str, str, str, int], List[float]] = {}
+        self._lock = threading.Lock()
+        # (周期开始时间, {客户端: (token 数, TTS 字符数)})，来自数据库
+        self._period_totals: Tuple[int, Dict[str, Tuple[float, float]]] = (0, {})
+        self._schema_ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def has_quotas(self) -> bool:
+        return bool(self.token_quotas or self.character_quotas)
+
+    def record(
+        self,
+        model: str,
+        operation: str,
+        usage_metadata: Any = None,
+        characters: int = 0,
+        audio_seconds: float = 0.0
+    ):
+        """
+        记录一次上游调用的用量，可在线程池中调用
+
+        Args:
+            model: 模型名称
+            operation: 操作（generate_text / stream_text / tts / multi_speaker_tts）
+            usage_metadata: 响应中的 usage_metadata，包含输入和输出 token 数
+            characters: 合成的文本字符数
+            audio_seconds: 合成的音频时长（秒）
+        """
+        if not self.enabled:
+            return
+        input_tokens, output_tokens = _token_counts(usage_metadata)
+        key = (current_client(), model, operation, int(time.time() // 3600 * 3600))
+        with self._lock:
+            totals = self._pending.get(key)
+            if totals is None:
+                totals = self._pending[key] = [0, 0, 0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += input_tokens
+            totals[2] += output_tokens
+            totals[3] += characters
+            totals[4] += audio_seconds
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台写入，并写入剩余的用量"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.enabled:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """将内存中汇总的用量写入数据库，并刷新配额客户端的周期总量"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._writing = batch
+        if not batch and not self.has_quotas:
+            return
+        loop = asyncio.get_running_loop()
+        if batch:
+            try:
+                await loop.run_in_executor(None, self._write_batch, batch)
+            except Exception as e:
+                # 写入事务未提交，放回待写入的用量下次重试
+                logger.warning(f"写入用量记录失败，稍后重试: {str(e)}")
+                with self._lock:
+                    for key, values in batch.items():
+                        totals = self._pending.setdefault(key, [0, 0, 0, 0, 0.0])
+                        for index, value in enumerate(values):
+                            totals[index] += value
+                    self._writing = {}
+                return
+        if not self.has_quotas:
+            with self._lock:
+                self._writing = {}
+            return
+        try:
+            period_totals = await loop.run_in_executor(None, self._read_period_totals)
+        except Exception as e:
+            # 已写入的用量不能再放回（会重复计数），先累加到缓存的周期总量中，下次写入后再从数据库刷新
+            logger.warning(f"读取配额周期用量失败: {str(e)}")
+            with self._lock:
+                self._add_to_period_totals(batch)
+                self._writing = {}
+            return
+        with self._lock:
+            self._writing = {}
+            self._period_totals = period_totals
+
+    def _add_to_period_totals(self, batch: Dict[Tuple[str, str, str, int], List[float]]):
+        """将已写入数据库的一批用量累加到缓存的周期总量（需持有锁）"""
+        start, _ = period_bounds(self.quota_period)
+        totals_start, totals = self._period_totals
+        if totals_start != start:
+            totals_start, totals = start, {}
+        totals = dict(totals)
+        for (client, _model, _operation, hour), values in batch.items():
+            if hour >= start:
+                tokens, characters = totals.get(client, (0, 0))
+                totals[client] = (tokens + values[1] + values[2], characters + values[3])
+        self._period_totals = (totals_start, totals)
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        if not self._schema_ready:
+            # WAL 模式下多个 worker 写入时不阻塞 /usage 查询
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def _write_batch(self, batch: Dict[Tuple[str, str, str, int], List[float]]):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(_UPSERT, [(*key, *values) for key, values in batch.items()])
+        finally:
+            connection.close()
+
+    def _read_period_totals(self) -> Tuple[int, Dict[str, Tuple[float, float]]]:
+        connection = self._connect()
+        try:
+            start, _ = period_bounds(self.quota_period)
+            rows = connection.execute(
+                "SELECT client, SUM(input_tokens + output_tokens), SUM(tts_characters) "
+                "FROM usage WHERE hour >= ? GROUP BY client",
+                (start,)
+            ).fetchall()
+            return start, {client: (tokens, characters) for client, tokens, characters in rows}
+        finally:
+            connection.close()
+
+    def _quota_for(self, quotas: Dict[str, float], client_id: str) -> Optional[float]:
+        return quotas.get(client_id, quotas.get("*"))
+
+    def period_usage(self, client_id: str) -> Tuple[float, float]:
+        """客户端当前配额周期的 (token 数, TTS 字符数)，包含本进程尚未写入数据库的部分"""
+        start, _ = period_bounds(self.quota_period)
+        with self._lock:
+            totals_start, totals = self._period_totals
+            tokens, characters = totals.get(client_id, (0, 0)) if totals_start == start else (0, 0)
+            for batch in (self._writing, self._pending):
+                for (client, _model, _operation, hour), values in batch.items():
+                    if client == client_id and hour >= start:
+                        tokens += values[1] + values[2]
+                        characters += values[3]
+        return tokens, characters
+
+    def check_quota(self, client_id: str) -> Optional[str]:
+        """
+        检查客户端是否已用完当前周期的配额
+
+        Returns:
+            已超出时返回错误信息，否则返回 None
+        """
+        token_limit = self._quota_for(self.token_quotas, client_id)
+        character_limit = self._quota_for(self.character_quotas, client_id)
+        if token_limit is None and character_limit is None:
+            return None
+        tokens, characters = self.period_usage(client_id)
+        if token_limit is not None and tokens >= token_limit:
+            return f"客户端 {client_id} 的 token 用量已达配额上限 ({token_limit:g})"
+        if character_limit is not None and characters >= character_limit:
+            return f"客户端 {client_id} 的语音合成字符数已达配额上限 ({character_limit:g})"
+        return None
+
+    def quota_retry_after(self) -> int:
+        """距离下一个配额周期开始的秒数"""
+        _, end = period_bounds(self.quota_period)
+        return max(1, int(end - time.time()))
+
+    def quota_status(self, client_id: str) -> Dict[str, Any]:
+        tokens, characters = self.period_usage(client_id)
+        start, end = period_bounds(self.quota_period)
+        return {
+            "period": self.quota_period,
+            "period_start": start,
+            "period_end": end,
+            "tokens": tokens,
+            "token_limit": self._quota_for(self.token_quotas, client_id),
+            "tts_characters": characters,
+            "tts_character_limit": self._quota_for(self.character_quotas, client_id)
+        }
+
+    async def query(
+        self,
+        client_id: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """按客户端、模型和操作汇总 [start, end) 时间范围（按小时对齐）内已写入数据库的用量"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._query, client_id, start, end)
+
+    def _query(self, client_id: Optional[str], start: Optional[float], end: Optional[float]) -> List[Dict[str, Any]]:
+        conditions, params = [], []
+        if client_id is not None:
+            conditions.append("client = ?")
+            params.append(client_id)
+        if start is not None:
+            conditions.append("hour >= ?")
+            params.append(int(start // 3600 * 3600))
+        if end is not None:
+            conditions.append("hour < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT client, model, operation, {', '.join(f'SUM({field})' for field in USAGE_FIELDS)} "
+                f"FROM usage {where} GROUP BY client, model, operation ORDER BY client, model, operation",
+                params
+            ).fetchall()
+        finally:
+            connection.close()
+        return [
+            {
+                "client_id": client, "model": model, "operation": operation,
+                **dict(zip(USAGE_FIELDS, values)), "audio_seconds": round(values[-1], 3)
+            }
+            for client, model, operation, *values in rows
+        ]
+
+
+# 创建全局实例
+usage_tracker = UsageTracker(
+    db_path=settings.USAGE_DB_PATH,
+    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+    token_quotas=parse_quotas(settings.USAGE_QUOTA_TOKENS),
+    character_quotas=parse_quotas(settings.USAGE_QUOTA_TTS_CHARACTERS),
+    quota_period=settings.USAGE_QUOTA_PERIOD,
+    enabled=settings.USAGE_ENABLED
+)
@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+from services.audio_cache import HotAudioCache
+
+
+def _promoted_cache(path):
+    cache = HotAudioCache(max_bytes=1024 * 1024, promote_after=1)
+    cache.promote(path.name, str(path))
+    assert cache.contains(path.name)
+    return cache
+
+
+def test_lookup_returns_entry_while_disk_file_is_unchanged(tmp_path):
+    path = tmp_path / "gemini_a.wav"
+    path.write_bytes(b"RIFF" + b"\0" * 100)
+    cache = _promoted_cache(path)
+
+    entry = asyncio.run(cache.lookup(path.name, str(path)))
+
+    assert entry is not None
+    assert entry.read() == path.read_bytes()
+
+
+def test_lookup_discards_entry_deleted_by_another_worker(tmp_path):
+    path = tmp_path / "gemini_a.wav"
+    path.write_bytes(b"RIFF" + b"\0" * 100)
+    cache = _promoted_cache(path)
+    # 其他 worker 的清理删除了磁盘文件
+    os.remove(path)
+
+    assert asyncio.run(cache.lookup(path.name, str(path))) is None
+    assert not cache.contains(path.name)
+
+
+def test_lookup_discards_entry_replaced_on_disk(tmp_path):
+    path = tmp_path / "gemini_a.wav"
+    path.write_bytes(b"RIFF" + b"\0" * 100)
+    cache = _promoted_cache(path)
+    replacement = tmp_path / "new.wav"
+    replacement.write_bytes(b"RIFF" + b"\1" * 100)
+    os.replace(replacement, path)
+
+    assert asyncio.run(cache.lookup(path.name, str(path))) is None
+    assert not cache.contains(path.name)
@@ -0,0 +1,55 @@
+import asyncio
+import os
+import time
+
+from services.audio_store import audio_store, _write_wav_atomic
+
+# 并发写入的文件数（不超过 I/O 线程池的排队上限）和每个文件的 PCM 数据大小
+WRITES = 200
+PCM_BYTES = 1024 * 1024
+# 探测间隔和允许的最大超时；同样的写入直接在事件循环中执行时超时远大于此
+PROBE_INTERVAL = 0.01
+MAX_LAG = 0.05
+
+
+async def _probe_lag(stop: asyncio.Event) -> float:
+    """循环 sleep(PROBE_INTERVAL)，返回实际唤醒时间相对预期的最大超时"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        worst = max(worst, time.perf_counter() - start - PROBE_INTERVAL)
+    return worst
+
+
+async def _write_all(directory: str, write) -> float:
+    pcm = os.urandom(PCM_BYTES)
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_lag(stop))
+    # 先让探测任务运行一轮
+    await asyncio.sleep(PROBE_INTERVAL)
+    await asyncio.gather(*(
+        write(os.path.join(directory, f"{i}.wav"), pcm, 1, 2, 24000) for i in range(WRITES)
+    ))
+    stop.set()
+    return await probe
+
+
+def test_concurrent_write_wav_does_not_block_event_loop(tmp_path):
+    worst = asyncio.run(_write_all(str(tmp_path), audio_store.write_wav))
+
+    assert worst < MAX_LAG, f"事件循环最大延迟 {worst * 1000:.1f}ms"
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == WRITES
+    assert all(name.endswith(".wav") for name in files)
+    assert os.path.getsize(tmp_path / "0.wav") == 44 + PCM_BYTES
+
+
+def test_lag_probe_detects_blocking_writes(tmp_path):
+    """对照：同样的写入直接在事件循环中执行时，探测到的延迟超过上限"""
+    async def write_on_loop(path, pcm_data, channels, sample_width, sample_rate):
+        _write_wav_atomic(path, pcm_data, channels, sample_width, sample_rate)
+
+    worst = asyncio.run(_write_all(str(tmp_path), write_on_loop))
+
+    assert worst >= MAX_LAG
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from services.job_queue import JobQueue, JobQueueFullError, CallbackNotAllowedError
+
+TTS_PARAMS = {"text": "你好"}
+
+
+def test_concurrent_submit_over_capacity_leaves_no_orphaned_job(tmp_path):
+    queue = JobQueue(job_dir=str(tmp_path), workers=1, max_queued=1)
+
+    async def submit_two():
+        return await asyncio.gather(
+            queue.submit("tts", TTS_PARAMS), queue.submit("tts", TTS_PARAMS), return_exceptions=True
+        )
+
+    results = asyncio.run(submit_two())
+
+    assert sum(isinstance(result, JobQueueFullError) for result in results) == 1
+    accepted = [result for result in results if isinstance(result, dict)]
+    assert os.listdir(tmp_path) == [f"{accepted[0]['id']}.json"]
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8000/hook",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:192.168.1.1]/hook",
+    "ftp://8.8.8.8/hook",
+])
+def test_callback_to_internal_address_is_rejected(url):
+    queue = JobQueue(job_dir="unused", workers=1, max_queued=1)
+
+    with pytest.raises(CallbackNotAllowedError):
+        asyncio.run(queue.check_callback_url(url))
+
+
+def test_callback_to_public_address_is_accepted():
+    queue = JobQueue(job_dir="unused", workers=1, max_queued=1)
+
+    asyncio.run(queue.check_callback_url("https://8.8.8.8/hook"))
+
+
+@pytest.mark.parametrize("url, allowed", [
+    ("http://127.0.0.1:9000/hooks/tts", True),
+    ("http://127.0.0.1:9000/other", False),
+    ("https://hooks.example.com/x", True),
+    ("https://a.internal.example/x", True),
+    ("https://cb.example.org/x", True),
+    ("https://cb.example.org.evil.net/x", False),
+    ("https://8.8.8.8/hook", False),
+])
+def test_callback_allow_list(url, allowed):
+    queue = JobQueue(
+        job_dir="unused", workers=1, max_queued=1,
+        webhook_allowed=["http://127.0.0.1:9000/hooks/", "https://cb.example.org", "hooks.example.com", ".internal.example"]
+    )
+
+    if allowed:
+        asyncio.run(queue.check_callback_url(url))
+    else:
+        with pytest.raises(CallbackNotAllowedError):
+            asyncio.run(queue.check_callback_url(url))
+
+
+def test_worker_survives_job_file_errors(tmp_path, monkeypatch):
+    queue = JobQueue(job_dir=str(tmp_path), workers=1, max_queued=10)
+
+    async def failing_save(job):
+        raise OSError("No space left on device")
+
+    async def run():
+        queue.start()
+        first = await queue.submit("tts", TTS_PARAMS)
+        # 之后的保存都失败，worker 处理该任务时出错
+        monkeypatch.setattr(queue, "_save", failing_save)
+        await asyncio.wait_for(queue._queue.join(), timeout=5)
+        alive = [task for task in queue._worker_tasks if not task.done()]
+        await queue.stop()
+        return first, alive
+
+    first, alive = asyncio.run(run())
+
+    assert len(alive) == 1
+    saved = json.loads((tmp_path / f"{first['id']}.json").read_text())
+    assert saved["state"] == "failed"
+    assert "No space left" in saved["error"]
+
+
+def test_busy_retries_are_capped_and_reuse_generated_text(tmp_path, monkeypatch):
+    from config import settings
+    from services import job_queue as job_queue_module
+    from services.bulkhead import BulkheadFullError
+
+    calls = {"text": 0, "speech": 0}
+
+    async def generate_text(**kwargs):
+        calls["text"] += 1
+        return "生成的文本"
+
+    async def generate_speech(**kwargs):
+        calls["speech"] += 1
+        raise BulkheadFullError("tts")
+
+    monkeypatch.setattr(settings, "JOB_BUSY_RETRIES", 1)
+    monkeypatch.setattr(job_queue_module.gemini_service, "generate_text", generate_text)
+    monkeypatch.setattr(job_queue_module.gemini_tts_service, "generate_speech", generate_speech)
+    queue = JobQueue(job_dir=str(tmp_path), workers=1, max_queued=10)
+
+    async def run():
+        queue.start()
+        job = await queue.submit("generate_and_speak", {"prompt": "你好"})
+        await asyncio.wait_for(queue._queue.join(), timeout=5)
+        await queue.stop()
+        return await queue.get(job["id"])
+
+    job = asyncio.run(run())
+
+    assert job["state"] == "failed"
+    assert calls == {"text": 1, "speech": 2}
@@ -0,0 +1,48 @@
+import time
+
+from services.load_shedding import LoadShedder
+
+
+def _shedder(trusted=("127.0.0.1",)):
+    return LoadShedder(
+        enabled=True, target=0.1, interval=1.0, exempt_paths=[], request_start_header="X-Request-Start",
+        trusted_proxies=list(trusted), max_request_age=30.0
+    )
+
+
+def _header(seconds_ago: float) -> str:
+    return f"t={time.time() - seconds_ago:.3f}"
+
+
+def test_request_start_from_trusted_proxy_is_used():
+    shedder = _shedder()
+
+    assert shedder.trusts("127.0.0.1")
+    assert 0.4 < shedder.queue_delay(_header(0.5)) < 1.0
+
+
+def test_bogus_request_start_is_ignored():
+    shedder = _shedder()
+
+    assert shedder.queue_delay("t=1") == 0.0
+    assert shedder.queue_delay(_header(-5)) == 0.0
+
+
+def test_request_start_is_ignored_without_trusted_proxy():
+    assert not _shedder(trusted=()).trusts("127.0.0.1")
+    assert not _shedder().trusts("10.0.0.8")
+    assert not _shedder().trusts(None)
+
+
+def test_untrusted_header_never_triggers_shedding():
+    shedder = _shedder(trusted=())
+
+    for _ in range(3):
+        assert not shedder.should_shed("/api/v1/generate", "t=1", "203.0.113.9")
+        time.sleep(0.6)
+
+
+def test_request_forwarded_by_uvicorn_trusted_proxy_is_trusted():
+    # uvicorn 已将客户端地址改写为 X-Forwarded-For 中的原始客户端
+    assert _shedder().trusts("203.0.113.9", forwarded=True)
+    assert not _shedder(trusted=()).trusts("203.0.113.9", forwarded=True)
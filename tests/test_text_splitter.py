@@ -0,0 +1,51 @@
+from services.segment_cache import SegmentCache
+from services.text_splitter import group_dialogue_turns
+
+SPEAKERS = "Joe,Jane"
+
+
+def _chunk_keys(turns):
+    chunks = group_dialogue_turns(turns, max_chars=300, max_turns=10)
+    return [SegmentCache.make_key("dialogue", chunk, SPEAKERS) for chunk in chunks]
+
+
+def test_editing_one_turn_changes_only_its_chunk_key():
+    turns = [("Joe" if i % 2 == 0 else "Jane", f"这是第 {i:02d} 句台词。") for i in range(50)]
+    # 改长一句台词，使所在的一组超过字符上限
+    edited = list(turns)
+    edited[23] = (edited[23][0], edited[23][1] + "补充" * 100)
+
+    before = _chunk_keys(turns)
+    after = _chunk_keys(edited)
+
+    assert len(before) == 5
+    assert [key for key in before if key not in after] == [before[2]]
+    # 前后各组的分组边界不受影响
+    assert after[:2] == before[:2]
+    assert after[-2:] == before[-2:]
+
+
+def test_group_over_char_limit_is_split_within_group():
+    turns = [("Joe", "a" * 300), ("Jane", "b" * 300), ("Joe", "c" * 300), ("Jane", "d")]
+
+    chunks = group_dialogue_turns(turns, max_chars=800, max_turns=3)
+
+    assert chunks == [
+        "Joe: " + "a" * 300 + "\nJane: " + "b" * 300,
+        "Joe: " + "c" * 300,
+        "Jane: d",
+    ]
+
+
+def test_oversized_turn_is_split_at_sentence_boundaries():
+    sentences = [f"这是第 {i} 句很长的台词" + "啊" * 80 + "。" for i in range(20)]
+    turns = [("Joe", "你好。"), ("Jane", "".join(sentences)), ("Joe", "再见。")]
+
+    chunks = group_dialogue_turns(turns, max_chars=800, max_turns=10)
+
+    assert all(len(chunk) <= 800 for chunk in chunks)
+    jane_lines = [line for chunk in chunks for line in chunk.split("\n") if line.startswith("Jane: ")]
+    assert len(jane_lines) > 1
+    assert "".join(line[len("Jane: "):] for line in jane_lines) == "".join(sentences)
+    assert chunks[0].startswith("Joe: 你好。")
+    assert chunks[-1].endswith("Joe: 再见。")
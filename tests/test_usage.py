@@ -0,0 +1,62 @@
+import asyncio
+import sqlite3
+
+from services import usage
+
+
+def test_claimed_client_id_is_used_without_client_keys(monkeypatch):
+    monkeypatch.setattr(usage, "_CLIENT_KEYS", {})
+
+    assert usage.resolve_client(None, "app-1") == "app-1"
+    assert usage.resolve_client(None, None) == "anonymous"
+
+
+def test_client_keys_decide_identity_and_ignore_claimed_id(monkeypatch):
+    monkeypatch.setattr(usage, "_CLIENT_KEYS", usage.parse_client_keys("k1=app-1, k2=app-2"))
+
+    assert usage.resolve_client("k1", "app-2") == "app-1"
+    # 更换或省略声明的标识都记在匿名客户端下，不能得到新的配额
+    assert usage.resolve_client(None, "fresh-id") == "anonymous"
+    assert usage.resolve_client("wrong", "app-1") == "anonymous"
+
+
+def test_api_key_from_header_or_bearer():
+    assert usage.api_key_from({"X-API-Key": "k1"}) == "k1"
+    assert usage.api_key_from({"authorization": "Bearer k2"}) == "k2"
+    assert usage.api_key_from({}, "k3") == "k3"
+    assert usage.api_key_from({}) is None
+
+
+def test_admin_key_is_required(monkeypatch):
+    monkeypatch.setattr(usage.settings, "USAGE_ADMIN_KEY", "")
+    assert not usage.is_admin("")
+    monkeypatch.setattr(usage.settings, "USAGE_ADMIN_KEY", "secret")
+    assert usage.is_admin("secret")
+    assert not usage.is_admin("secre")
+
+
+def test_failed_quota_refresh_does_not_write_batch_twice(tmp_path):
+    tracker = usage.UsageTracker(
+        db_path=str(tmp_path / "usage.db"),
+        flush_interval=60,
+        token_quotas={"*": 1000},
+        character_quotas={}
+    )
+
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    async def run():
+        usage.set_client("app-1")
+        tracker.record("tts-model", "tts", characters=10)
+        original = tracker._read_period_totals
+        tracker._read_period_totals = locked
+        await tracker.flush()
+        tracker._read_period_totals = original
+        await tracker.flush()
+        return await tracker.query("app-1")
+
+    rows = asyncio.run(run())
+
+    assert [(row["requests"], row["tts_characters"]) for row in rows] == [(1, 10)]
+    assert tracker.period_usage("app-1") == (0, 10)
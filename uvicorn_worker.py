@@ -0,0 +1,22 @@
+"""
+Gunicorn Worker - 在 uvicorn.workers.UvicornWorker 基础上限制关闭时等待 HTTP 请求的时间
+"""
+
+from uvicorn.workers import UvicornWorker
+
+from config import settings
+
+
+class GracefulUvicornWorker(UvicornWorker):
+    """
+    worker 重启或达到 max_requests 回收时，uvicorn 默认无限等待进行中的请求，
+    超过 graceful_timeout 后被 gunicorn 直接杀掉，应用的关闭流程（等待后台任务和文件写入）得不到执行。
+    这里让 uvicorn 最多等待 graceful_timeout 减去 SHUTDOWN_DRAIN_TIMEOUT 和少量余量，
+    剩余时间留给应用的关闭流程。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # max_requests 回收由 worker 自行退出，不受 graceful_timeout 约束，但关闭期间不再发送心跳，受 timeout 约束
+        budget = min(self.cfg.graceful_timeout, self.cfg.timeout)
+        self.config.timeout_graceful_shutdown = max(1, int(budget - settings.SHUTDOWN_DRAIN_TIMEOUT - 5))